@@ -1,313 +1,445 @@
 import os
-import nltk
-import spacy
-import time
-from nltk.sentiment import SentimentIntensityAnalyzer
-from nltk.tokenize import word_tokenize
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
-import re
-import psycopg2
-import requests
-import openai
-from selenium import webdriver
+import threading
+from analysis_pool import AnalysisPool
+from browser_sessions import login_with_cache, shared_sessions, wait_for, wait_for_ready
+from chatlog_export import CHATLOG_COLUMNS, export, iter_chatlog
+from chatlog_partitions import ChatlogPartitions
+from chatlog_writer import ChatlogWriter
+from completion_cache import CompletionCache
+from context_builder import ContextBuilder
+from db_pool import DatabasePool
+from dom_observer import ChatObserver
+from llm_client import LLMClient
+from migrations import Migrator, chatlog_migrations
+from pipeline import MessagePipeline
+from profile_cache import CachedProfileStore
+from profile_store import ProfileStore
+from room_manager import BrowserPool, Room, RoomManager
+from scraper import IncrementalScraper
+from streaming import StreamMetrics, stream_chunks
+from topic_model import RoomTopicModel, topic_key
+from topic_vectors import TopicIndex
+from ws_ingest import WebSocketIngest
+from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.support import expected_conditions as EC
 import asyncio
-import websockets
-                
-openai.api_key = os.environ["OPENAI_API_KEY"]
 
 class Chatlog:
-    def __init__(self, chatroom_url, username, password, database_name, database_user, database_password):
+    def __init__(self, chatroom_url, username, password, database_name, database_user, database_password,
+                 pool=None, min_connections=1, max_connections=10, analysis=None):
         self.chatroom_url = chatroom_url
         self.username = username
         self.password = password
         self.database_name = database_name
         self.database_user = database_user
         self.database_password = database_password
-        self.nlp = spacy.load("en_core_web_sm")  
-
-        self.conn = psycopg2.connect(
-            host="localhost",
-            port=5432,
-            database=database_name,
-            user=database_user,
-            password=database_password
+        self._owns_analysis = analysis is None
+        self.analysis = analysis or AnalysisPool("en_core_web_sm")
+
+        self._owns_pool = pool is None
+        self.pool = pool or DatabasePool(
+            database_name,
+            database_user,
+            database_password,
+            min_connections=min_connections,
+            max_connections=max_connections
         )
-        self.cur = self.conn.cursor()
+        # Every profile write also refreshes that user's entry in the interest index.
+        self.interests = TopicIndex()
+        # Loads the saved model in the background; messages go unclustered until then.
+        self.topics = RoomTopicModel()
+        # Hot profiles are served from memory; bursts of updates are written once per second.
+        self.profiles = CachedProfileStore(ProfileStore(self.pool, index=self.interests, topics=self.topics))
+        self.writer = ChatlogWriter(self.pool)
+        self.partitions = ChatlogPartitions(self.pool)
         self.upgrade_database()
+        self.partitions.start()
+        self.interests.start(self.pool, rebuild_interval=6 * 3600)
+        self.topics.start(self.pool)
+
+    def close(self):
+        self.migrator.stop()
+        self.partitions.stop()
+        self.topics.stop()
+        self.interests.stop()
+        self.profiles.close()
+        self.writer.close()
+        if self._owns_pool:
+            self.pool.close()
+        if self._owns_analysis:
+            self.analysis.close()
 
     def upgrade_database(self):
-        self.cur.execute(
-            "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'user_profiles')"
-        )
-        user_profiles_table_exists = self.cur.fetchone()[0]
-
-        self.cur.execute(
-            "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'chatlog')"
-        )
-        chatlog_table_exists = self.cur.fetchone()[0]
-
-        if not user_profiles_table_exists:
-            self.cur.execute("""
-                CREATE TABLE user_profiles (
-                    user_id SERIAL PRIMARY KEY,
-                    sentiments TEXT,
-                    topics TEXT,
-                    data JSONB
-                )
-            """)
-            self.conn.commit()
-
-        if not chatlog_table_exists:
-            self.cur.execute("""
-                CREATE TABLE chatlog (
-                    entry_id SERIAL PRIMARY KEY,
-                    user_id INTEGER,
-                    message TEXT,
-                    timestamp TIMESTAMP DEFAULT NOW()
-                )
-            """)
-            self.conn.commit()
+        # One query against schema_migrations when the schema is already current.
+        self.migrator = Migrator(self.pool, chatlog_migrations(self.partitions))
+        self.migrator.migrate(backfill=False)
+        # Existing rows are migrated in small batches while the bot runs.
+        self.migrator.start_backfills()
 
     def get_user_profile(self, user_id):
-        sentiments = []
-        topics = []
-        data = {}
-
-        self.cur.execute(
-            "SELECT * FROM user_profiles WHERE user_id = %s",
-            (user_id,)
-        )
-        profile = self.cur.fetchone()
+        return self.profiles.get(user_id)
 
-        if profile:
-            sentiments = [int(sentiment) for sentiment in profile[1].split(",")]
-            topics = profile[2].split(",")
-            data = profile[3]
+    def update_user_profile(self, user_id, sentiments, topics, data=None):
+        self.profiles.update(user_id, sentiments, topics, data)
 
-        return {
-            "user_id": user_id,
-            "avg_sentiment": sum(sentiments) / len(sentiments),
-            "most_common_topic": max(topics, key=topics.count),
-            "data": data
-        }
-
-    def create_user_profile(self, user_id, sentiments, topics, data):
-        sentiments_str = ",".join(str(sentiment) for sentiment in sentiments)
-        topics_str = ",".join(topics)
-
-        self.cur.execute(
-            "INSERT INTO user_profiles (user_id, sentiments, topics, data) VALUES (%s, %s, %s, %s)",
-            (user_id, sentiments_str, topics_str, data)
-        )
-        self.conn.commit()
-
-    def update_user_profile(self, user_id, sentiments, topics, data):
-        sentiments_str = ",".join(str(sentiment) for sentiment in sentiments)
-        topics_str = ",".join(topics)
-
-        self.cur.execute(
-            "UPDATE user_profiles SET sentiments = %s, topics = %s, data = %s WHERE user_id = %s",
-            (sentiments_str, topics_str, data, user_id)
-        )
-        self.conn.commit()
+    def similar_users(self, user_id, k=10):
+        """Users whose topic vectors are closest to this user's, as `(user_id, similarity)`."""
+        return self.interests.similar_to(int(user_id), k)
 
     def get_chat_history(self, user_id, limit=10):
-        self.cur.execute(
-            "SELECT * FROM chatlog WHERE user_id = %s ORDER BY timestamp DESC LIMIT %s",
-            (user_id, limit)
-        )
-        return self.cur.fetchall()
+        # Every column is in chatlog_user_id_timestamp_idx, so this is an index-only scan.
+        with self.pool.cursor() as cur:
+            cur.execute(
+                "SELECT entry_id, user_id, message, timestamp FROM chatlog "
+                "WHERE user_id = %s ORDER BY timestamp DESC LIMIT %s",
+                (user_id, limit)
+            )
+            return cur.fetchall()
+
+    def iter_chat_history(self, user_id=None, since=None, until=None, chunk_size=10000):
+        # Read in short keyset-paged queries; memory stays at `chunk_size` rows.
+        return iter_chatlog(self.pool, since, until, user_id, chunk_size)
+
+    def export_chatlog(self, path, since=None, until=None):
+        """Writes the chatlog (or a time range of it) to `path` as .jsonl.gz or .parquet."""
+        # Its own connection, so a long export never takes one from the bot's pool.
+        pool = DatabasePool(self.database_name, self.database_user, self.database_password, max_connections=1)
+        try:
+            return export(iter_chatlog(pool, since, until), CHATLOG_COLUMNS, path)
+        finally:
+            pool.close()
 
     def add_chat_entry(self, user_id, message):
-        self.cur.execute(
-            "INSERT INTO chatlog (user_id, message) VALUES (%s, %s)",
-            (user_id, message)
+        self.writer.add(user_id, message)
+
+    def classify(self, record):
+        # The room topic replaces raw noun lemmas once the model is ready.
+        # Profiles store its saved id; ProfileStore shows it by its label.
+        record["topic_id"] = self.topics.assign(record["message"])
+        if record["topic_id"] is not None:
+            record["topics"] = [topic_key(record["topic_id"])]
+        return record
+
+    def analyze_messages(self, records):
+        futures = self.analysis.submit_batch([record["message"] for record in records])
+        for record, future in zip(records, futures):
+            record["analysis"] = future
+        return records
+
+    def persist_message(self, record):
+        record.update(record.pop("analysis").result())
+        self.classify(record)
+        self.add_chat_entry(record["user_id"], record["message"])
+        self.update_user_profile(record["user_id"], record["sentiments"], record["topics"])
+        return record
+
+    def login_to_chat(self, sessions=None, store=None):
+        if getattr(self, "driver", None) is None:
+            self.sessions = sessions or shared_sessions()
+            self.driver = self.sessions.acquire()
+        self.scraper = IncrementalScraper(self.driver, ".chat-message")
+        self.observer = ChatObserver(self.driver, ".chat-message")
+        # A saved session skips the login form entirely on later runs.
+        login_with_cache(
+            self.driver,
+            self.chatroom_url,
+            self.username,
+            self._submit_login,
+            EC.presence_of_element_located((By.CSS_SELECTOR, ".chat-message, #message_input")),
+            store
         )
-        self.conn.commit()
-    def login_to_chat(self):
-        self.driver.get(self.chatroom_url)
-        time.sleep(2)  # Wait for page to load
 
-        username_input = self.driver.find_element_by_name('username')
-        password_input = self.driver.find_element_by_name('password')
+    def _submit_login(self, driver):
+        username_input = wait_for(driver, EC.visibility_of_element_located((By.NAME, 'username')))
+        password_input = driver.find_element(By.NAME, 'password')
 
         username_input.send_keys(self.username)
         password_input.send_keys(self.password)
 
-        submit_button = self.driver.find_element_by_css_selector("button[type='submit']")
+        submit_button = driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
         submit_button.click()
-        time.sleep(2)  # Wait for login to process
 
     def get_chat_messages(self):
-        chat_messages = self.driver.find_elements_by_css_selector(".chat-message")
+        # Only messages that appeared since the last poll, so history is not re-stored.
+        return self.scraper.poll()
 
-        messages = []
-        for message in chat_messages:
-            user_id = message.get_attribute("data-user-id")
-            text = message.text
-            messages.append({
-                "user_id": user_id,
-                "message": text,
-            })
+    def wait_for_messages(self, timeout=5):
+        # Blocks in the browser until the observer sees a new message.
+        return self.observer.wait(timeout)
 
-        return messages
-
-    def run(self):
+    def run(self, queue_size=1000):
         self.login_to_chat()
-
-        while True:
-            messages = self.get_chat_messages()
-            for message in messages:
-                user_id = message['user_id']
-                text = message['message']
-                self.store_chatlog(user_id, text)
-            time.sleep(5)  # Wait for new messages
-from openai import GPT3Completion
+        self.observer.install()
+        self._run_pipeline(self.wait_for_messages, 0, queue_size)
+
+    def run_websocket(self, url=None, queue_size=1000):
+        # Frames are pushed to us, so there is no browser and no polling delay.
+        ingest = WebSocketIngest(url or self.chatroom_url)
+        self._run_pipeline(ingest.stream(queue_size), None, queue_size)
+
+    def _run_pipeline(self, ingest, poll_interval, queue_size):
+        # A scraped page is analyzed with one nlp.pipe call per batch.
+        pipeline = MessagePipeline(
+            ingest,
+            [
+                ("analyze", self.analyze_messages),
+                ("persist", self.persist_message),
+            ],
+            queue_size=queue_size,
+            batch_sizes={"analyze": self.analysis.batch_size},
+            poll_interval=poll_interval
+        )
+        try:
+            asyncio.run(pipeline.run())
+        finally:
+            self.close()
 
 class Chatbot:
     def __init__(self, chatlog):
         self.chatlog = chatlog
-        self.gpt3 = GPT3Completion(api_key="your_openai_api_key")  # replace with your actual key
+        # Recent history is loaded once per user, then kept up to date in memory.
+        self.context = ContextBuilder(chatlog.get_chat_history)
+        self.gpt3 = GPT3Completion(api_key="your_openai_api_key", context=self.context)  # replace with your actual key
+        self.stream_metrics = StreamMetrics()
 
     def generate_response(self, message_dict):
-        user_id = message_dict["user"]
-        message = message_dict["message"]
-
-        self.chatlog.store_chatlog(user_id, message)
-
-        doc = self.chatlog.nlp(message)
-        sentiments = [sentence._.sentiment.polarity for sentence in doc.sents]
-        topics = [token.lemma_ for token in doc if token.pos_ in ["NOUN", "PROPN"]]
-
-        user_profile = self.chatlog.get_user_profile(user_id)
-        existing_sentiments = user_profile.get("avg_sentiment", [])
-        existing_topics = user_profile.get("most_common_topic", [])
-        existing_data = user_profile.get("data", {})
-
-        updated_sentiments = existing_sentiments + sentiments
-        updated_topics = existing_topics + topics
-
-        if user_profile:
-            self.chatlog.update_user_profile(user_id, updated_sentiments, updated_topics, existing_data)
-        else:
-            self.chatlog.create_user_profile(user_id, updated_sentiments, updated_topics, existing_data)
+        record = {"user_id": message_dict["user"], "message": message_dict["message"]}
+        record = self.respond(self.persist_message(self.analyze_message(record)))
+        return record["response"]
+
+    def analyze_message(self, record):
+        # Parsing runs in the worker pool; persist_message waits for the result.
+        record["analysis"] = self.chatlog.analysis.submit(record["message"])
+        return record
+
+    def persist_message(self, record):
+        record.update(record.pop("analysis").result())
+        self.chatlog.classify(record)
+        # Before the entry is queued, so a first history load cannot include it.
+        record["history"] = self.context.observe(record["user_id"], record["message"])
+        self.chatlog.add_chat_entry(record["user_id"], record["message"])
+        self.chatlog.update_user_profile(record["user_id"], record["sentiments"], record["topics"])
+        return record
+
+    def build_context(self, record):
+        user_profile = self.chatlog.get_user_profile(record["user_id"])
+        return {
+            "sentiment": user_profile["avg_sentiment"],
+            "topics": user_profile["top_topics"],
+            "history": record.get("history", ()),
+            "message": record["message"],
+        }
 
+    def respond(self, record):
         # generate a context-aware response using the GPT-3 model
-        context = {
-            "sentiment": sum(updated_sentiments) / len(updated_sentiments) if updated_sentiments else 0,
-            "topics": updated_topics,
-            "message": message,
-        }
-        response = self.gpt3.generate_message(context)
-        return response
+        record["response"] = self.gpt3.generate_message(self.build_context(record))
+        return record
+
+    def stream_response(self, record):
+        tokens = self.gpt3.stream_message(self.build_context(record))
+        return stream_chunks(tokens, metrics=self.stream_metrics)
     
 class GPT3Completion:
-    def __init__(self, api_key):
+    def __init__(self, api_key, client=None, context=None):
         self.api_key = api_key
+        self.client = client or LLMClient(cache=CompletionCache())
+        self.context = context or ContextBuilder()
+
+    def build_prompt(self, context):
+        # Bounded by the builder's token budget however long the history and topic list get.
+        return self.context.build_prompt(context)
 
     def generate_message(self, context):
-        prompt = f"The user's sentiment is {context['sentiment']}. They are talking about {', '.join(context['topics'])}. Their message is: {context['message']}. How should we respond?"
+        response = self.client.complete(
+            engine="text-davinci-002",
+            prompt=self.build_prompt(context),
+            temperature=0.7,
+            max_tokens=100
+        )
+        return response.strip()
 
-        response = openai.Completion.create(
+    def stream_message(self, context):
+        return self.client.stream(
             engine="text-davinci-002",
-            prompt=prompt,
+            prompt=self.build_prompt(context),
             temperature=0.7,
             max_tokens=100
         )
-        return response.choices[0].text.strip()
 
 
 class Chatbot:
     def __init__(self, chatlog):
         self.chatlog = chatlog
-        self.gpt3 = GPT3Completion(api_key="your_openai_api_key")  # replace with your actual key
+        # Recent history is loaded once per user, then kept up to date in memory.
+        self.context = ContextBuilder(chatlog.get_chat_history)
+        self.gpt3 = GPT3Completion(api_key="your_openai_api_key", context=self.context)  # replace with your actual key
+        self.stream_metrics = StreamMetrics()
 
     def generate_response(self, message_dict):
-        user_id = message_dict["user"]
-        message = message_dict["message"]
-
-        self.chatlog.store_chatlog(user_id, message)
-
-        doc = self.chatlog.nlp(message)
-        sentiments = [sentence._.sentiment.polarity for sentence in doc.sents]
-        topics = [token.lemma_ for token in doc if token.pos_ in ["NOUN", "PROPN"]]
-
-        user_profile = self.chatlog.get_user_profile(user_id)
-        existing_sentiments = user_profile.get("avg_sentiment", [])
-        existing_topics = user_profile.get("most_common_topic", [])
-        existing_data = user_profile.get("data", {})
-
-        updated_sentiments = existing_sentiments + sentiments
-        updated_topics = existing_topics + topics
-
-        if user_profile:
-            self.chatlog.update_user_profile(user_id, updated_sentiments, updated_topics, existing_data)
-        else:
-            self.chatlog.create_user_profile(user_id, updated_sentiments, updated_topics, existing_data)
+        record = {"user_id": message_dict["user"], "message": message_dict["message"]}
+        record = self.respond(self.persist_message(self.analyze_message(record)))
+        return record["response"]
+
+    def analyze_message(self, record):
+        # Parsing runs in the worker pool; persist_message waits for the result.
+        record["analysis"] = self.chatlog.analysis.submit(record["message"])
+        return record
+
+    def persist_message(self, record):
+        record.update(record.pop("analysis").result())
+        self.chatlog.classify(record)
+        # Before the entry is queued, so a first history load cannot include it.
+        record["history"] = self.context.observe(record["user_id"], record["message"])
+        self.chatlog.add_chat_entry(record["user_id"], record["message"])
+        self.chatlog.update_user_profile(record["user_id"], record["sentiments"], record["topics"])
+        return record
+
+    def build_context(self, record):
+        user_profile = self.chatlog.get_user_profile(record["user_id"])
+        return {
+            "sentiment": user_profile["avg_sentiment"],
+            "topics": user_profile["top_topics"],
+            "history": record.get("history", ()),
+            "message": record["message"],
+        }
 
+    def respond(self, record):
         # generate a context-aware response using the GPT-3 model
-        context = {
-            "sentiment": sum(updated_sentiments) / len(updated_sentiments) if updated_sentiments else 0,
-            "topics": updated_topics,
-            "message": message,
-        }
-        response = self.gpt3.generate_message(context)
-        return response
+        record["response"] = self.gpt3.generate_message(self.build_context(record))
+        return record
+
+    def stream_response(self, record):
+        tokens = self.gpt3.stream_message(self.build_context(record))
+        return stream_chunks(tokens, metrics=self.stream_metrics)
 
     def process_command(self, command):
-        response = openai.Completion.create(
+        response = self.gpt3.client.complete(
             engine="davinci",
             prompt=command,
             temperature=0.7,
             max_tokens=100
         )
-        return response.choices[0].text.strip()
+        return response.strip()
     
-from selenium import webdriver
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
 
 class ChatInterface:
-    def __init__(self, chatbot):
+    def __init__(self, chatbot, message_selector=".chat-message", sessions=None):
         self.chatbot = chatbot
-        # Start the WebDriver and load the page
-        self.wd = webdriver.Chrome()
+        # Borrow a warm headless browser rather than starting a new one per interface
+        self.sessions = sessions or shared_sessions()
+        self.wd = self.sessions.acquire()
         self.wait = WebDriverWait(self.wd, 10)
+        self.observer = ChatObserver(self.wd, message_selector)
+        # The pipeline reads and sends from worker threads; WebDriver is not thread-safe.
+        self.wd_lock = threading.Lock()
 
     def start(self, url):
+        self.url = url
         self.wd.get(url)
-
-    def login(self, username, password):
-        username_input = self.wait.until(EC.presence_of_element_located((By.ID, 'username_input')))  # replace 'username_input' with the actual ID
-        password_input = self.wait.until(EC.presence_of_element_located((By.ID, 'password_input')))  # replace 'password_input' with the actual ID
-        username_input.send_keys(username)
-        password_input.send_keys(password)
-        password_input.send_keys(Keys.RETURN)
+        wait_for_ready(self.wd)
+
+    def login(self, username, password, store=None):
+        def submit(driver):
+            username_input = self.wait.until(EC.presence_of_element_located((By.ID, 'username_input')))  # replace 'username_input' with the actual ID
+            password_input = self.wait.until(EC.presence_of_element_located((By.ID, 'password_input')))  # replace 'password_input' with the actual ID
+            username_input.send_keys(username)
+            password_input.send_keys(password)
+            password_input.send_keys(Keys.RETURN)
+
+        login_with_cache(
+            self.wd,
+            self.url,
+            username,
+            submit,
+            EC.presence_of_element_located((By.ID, 'message_input')),
+            store
+        )
 
     def send_message(self, message):
-        message_input = self.wait.until(EC.presence_of_element_located((By.ID, 'message_input')))  # replace 'message_input' with the actual ID
-        message_input.send_keys(message)
-        message_input.send_keys(Keys.RETURN)
-
-    def read_message(self):
-        message_output = self.wait.until(EC.presence_of_element_located((By.ID, 'message_output')))  # replace 'message_output' with the actual ID
-        return message_output.text
-
-    def run(self, username, password, url):
+        with self.wd_lock:
+            message_input = self.wait.until(EC.presence_of_element_located((By.ID, 'message_input')))  # replace 'message_input' with the actual ID
+            message_input.send_keys(message)
+            message_input.send_keys(Keys.RETURN)
+
+    def read_messages(self):
+        # One call drains everything the in-page observer has buffered.
+        with self.wd_lock:
+            return self.observer.drain()
+
+    def run(self, username, password, url, poll_interval=0.25, queue_size=100, respond_workers=4, report_interval=60,
+            streaming=True):
         self.start(url)
         self.login(username, password)
-        while True:
-            time.sleep(1)
-            new_message = self.read_message()
-            if new_message:
-                response = self.chatbot.generate_response({"user": username, "message": new_message})
-                self.send_message(response)
+        with self.wd_lock:
+            self.observer.install()
+
+        def ingest():
+            # Skip our own posts so the bot does not answer itself.
+            return [record for record in self.read_messages() if record["user_id"] != username]
+
+        def respond(record):
+            if streaming:
+                # Post each sentence as soon as it is generated.
+                for chunk in self.chatbot.stream_response(record):
+                    self.send_message(chunk)
+                return record
+            record = self.chatbot.respond(record)
+            self.send_message(record["response"])
+            return record
+
+        pipeline = MessagePipeline(
+            ingest,
+            [
+                ("analyze", self.chatbot.analyze_message),
+                ("persist", self.chatbot.persist_message),
+                ("respond", respond),
+            ],
+            queue_size=queue_size,
+            workers={"respond": respond_workers},
+            poll_interval=poll_interval,
+            report_interval=report_interval
+        )
+        asyncio.run(pipeline.run())
+
+
+def room_stages(chatbot):
+    # Every room runs through the same Chatbot, so they share its spaCy pool,
+    # database pool and LLM client; only the tab and the pipeline are per room.
+    def stages(room):
+        def respond(record):
+            for chunk in chatbot.stream_response(record):
+                room.send_message(chunk)
+            return record
+
+        return [
+            ("analyze", chatbot.analyze_message),
+            ("persist", chatbot.persist_message),
+            ("respond", respond),
+        ]
+    return stages
+
+
+def run_rooms(chatbot, urls, username, password, browsers=2, report_interval=60):
+    manager = RoomManager(
+        room_stages(chatbot),
+        browsers=BrowserPool(size=browsers),
+        report_interval=report_interval
+    )
+    for index, url in enumerate(urls):
+        manager.add_room(Room(f"room-{index}", url, username, password))
+    try:
+        manager.run_forever()
+    finally:
+        chatbot.chatlog.close()
+
+
 if __name__ == "__main__":
+    rooms = [url for url in os.environ.get("CHAT_ROOMS", "").split(",") if url]
+    if not rooms:
+        # Chrome starts in the background while the database and models load.
+        sessions = shared_sessions()
     chatlog = Chatlog(
         chatroom_url="http://your-chat-room-url",
         username="your-username",
@@ -317,5 +449,9 @@ if __name__ == "__main__":
         database_password="your-db-password"
     )
     chatbot = Chatbot(chatlog)
-    chat_interface = ChatInterface(chatbot)
-    chat_interface.run("your-username", "your-password", "http://your-chat-room-url")
+    # CHAT_ROOMS="url1,url2,..." runs every room over a couple of shared browsers.
+    if rooms:
+        run_rooms(chatbot, rooms, "your-username", "your-password")
+    else:
+        chat_interface = ChatInterface(chatbot, sessions=sessions)
+        chat_interface.run("your-username", "your-password", "http://your-chat-room-url")
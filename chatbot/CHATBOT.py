@@ -1,16 +1,8 @@
-import random
-import time
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
-from nltk.tokenize import word_tokenize
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
-import re
-import spacy
-import psycopg2
-import requests
-
-openai.api_key = os.environ["OPENAI_API_KEY"]
+from chatlog_partitions import ChatlogPartitions
+from db_pool import DatabasePool
+from migrations import Migrator, chatlog_migrations
+from models import openai_api
+from profile_store import ProfileStore
 
 class Chatlog:
     """
@@ -36,14 +28,15 @@ class Chatlog:
         self.database_user = database_user
         self.database_password = database_password
 
-        self.conn = psycopg2.connect(
-            host="localhost",
-            port=5432,
-            database=database_name,
-            user=database_user,
-            password=database_password
-        )
-        self.cur = self.conn.cursor()
+        self.pool = DatabasePool(database_name, database_user, database_password)
+        self.profiles = ProfileStore(self.pool)
+        self.upgrade_database()
+
+    def upgrade_database(self):
+        # ProfileStore reads columns added by later migrations (top_topic, topic_vector).
+        self.migrator = Migrator(self.pool, chatlog_migrations(ChatlogPartitions(self.pool)))
+        self.migrator.migrate(backfill=False)
+        self.migrator.start_backfills()
 
     def get_user_profile(self, user_id):
         """
@@ -55,23 +48,8 @@ class Chatlog:
         Returns:
             dict: The user profile.
         """
-        sentiments = []
-        topics = []
-
-        self.cur.execute(
-            "SELECT * FROM user_profiles WHERE user_id = %s",
-            (user_id,)
-        )
-        profile = self.cur.fetchone()
-
-        if profile:
-            sentiments = [int(sentiment) for sentiment in profile[1].split(",")]
-            topics = profile[2].split(",")
-
-        return {
-            "avg_sentiment": sum(sentiments) / len(sentiments),
-            "most_common_topic": max(topics, key=topics.count)
-        }
+        # One fixed-size row: the decayed sentiment sums and a stored top topic.
+        return self.profiles.get(user_id)
 
 class Chatbot:
     """
@@ -119,7 +97,7 @@ class Chatbot:
 
         prompt += " How should I respond?"
 
-        response = openai.Completion.create(
+        response = openai_api().Completion.create(
             engine="davinci",
             prompt=prompt,
             temperature=0.7,
@@ -1,24 +1,10 @@
-import os
-import random
 import time
-import nltk
-import spacy
-import websocket
-from selenium import webdriver
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from nltk.sentiment import SentimentIntensityAnalyzer
-from nltk.tokenize import word_tokenize
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
-import re
-import psycopg2
-import requests
-import openai
-
-openai.api_key = os.environ["OPENAI_API_KEY"]
+from analysis_pool import analyze_doc
+from chatlog_partitions import ChatlogPartitions
+from db_pool import DatabasePool
+from migrations import Migrator, chatlog_migrations
+from models import openai_api, spacy_model
+from profile_store import ProfileStore
 
 class Chatlog:
     def __init__(self, chatroom_url, username, password, database_name, database_user, database_password):
@@ -28,123 +14,47 @@ class Chatlog:
         self.database_name = database_name
         self.database_user = database_user
         self.database_password = database_password
-        self.nlp = spacy.load("en_core_web_sm")  
-
-        self.conn = psycopg2.connect(
-            host="localhost",
-            port=5432,
-            database=database_name,
-            user=database_user,
-            password=database_password
-        )
-        self.cur = self.conn.cursor()
+
+        self.pool = DatabasePool(database_name, database_user, database_password)
+        self.partitions = ChatlogPartitions(self.pool)
+        # Fixed-size decayed aggregates per user instead of an ever-growing history.
+        self.profiles = ProfileStore(self.pool)
         self.upgrade_database()
+        self.partitions.start()
 
-    def upgrade_database(self):
-        self.cur.execute(
-            "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'user_profiles')"
-        )
-        user_profiles_table_exists = self.cur.fetchone()[0]
+    @property
+    def nlp(self):
+        # Loaded by the first message that needs parsing, not at startup.
+        return spacy_model("en_core_web_sm")
 
-        self.cur.execute(
-            "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'chatlog')"
-        )
-        chatlog_table_exists = self.cur.fetchone()[0]
-
-        if not user_profiles_table_exists:
-            self.cur.execute("""
-                CREATE TABLE user_profiles (
-                    user_id SERIAL PRIMARY KEY,
-                    sentiments TEXT,
-                    topics TEXT,
-                    data JSONB
-                )
-            """)
-            self.conn.commit()
-
-        if not chatlog_table_exists:
-            self.cur.execute("""
-                CREATE TABLE chatlog (
-                    entry_id SERIAL PRIMARY KEY,
-                    user_id INTEGER,
-                    message TEXT,
-                    timestamp TIMESTAMP DEFAULT NOW()
-                )
-            """)
-            self.conn.commit()
+    def upgrade_database(self):
+        self.migrator = Migrator(self.pool, chatlog_migrations(self.partitions))
+        self.migrator.migrate(backfill=False)
+        self.migrator.start_backfills()
 
     def get_user_profile(self, user_id):
-        sentiments = []
-        topics = []
-        data = {}
-
-        self.cur.execute(
-            "SELECT * FROM user_profiles WHERE user_id = %s",
-            (user_id,)
-        )
-        profile = self.cur.fetchone()
-
-        if profile:
-            sentiments = [int(sentiment) for sentiment in profile[1].split(",")]
-            topics = profile[2].split(",")
-            data = profile[3]
-
-        return {
-            "user_id": user_id,
-            "avg_sentiment": sum(sentiments) / len(sentiments),
-            "most_common_topic": max(topics, key=topics.count),
-            "data": data
-        }
-
-    def create_user_profile(self, user_id, sentiments, topics, data):
-        sentiments_str = ",".join(str(sentiment) for sentiment in sentiments)
-        topics_str = ",".join(topics)
-
-        self.cur.execute(
-            "INSERT INTO user_profiles (user_id, sentiments, topics, data) VALUES (%s, %s, %s, %s)",
-            (user_id, sentiments_str, topics_str, data)
-        )
-        self.conn.commit()
+        return self.profiles.get(user_id)
 
-    def update_user_profile(self, user_id, sentiments, topics, data):
-        sentiments_str = ",".join(str(sentiment) for sentiment in sentiments)
-        topics_str = ",".join(topics)
-
-        self.cur.execute(
-            "UPDATE user_profiles SET sentiments = %s, topics = %s, data = %s WHERE user_id = %s",
-            (sentiments_str, topics_str, data, user_id)
-        )
-        self.conn.commit()
+    def update_user_profile(self, user_id, sentiments, topics, data=None):
+        self.profiles.update(user_id, sentiments, topics, data)
 
     def store_chatlog(self, user_id, message):
-        self.cur.execute(
-            "INSERT INTO chatlog (user_id, message) VALUES (%s, %s)",
-            (user_id, message)
-        )
-        self.conn.commit()
-
-    def on_message(self, ws, message):
-        print("Received message: ", message)
-
-    def on_error(self, ws, error):
-        print("Error occurred: ", error)
+        with self.pool.cursor() as cur:
+            cur.execute(
+                "INSERT INTO chatlog (user_id, message) VALUES (%s, %s)",
+                (user_id, message)
+            )
 
-    def on_close(self, ws):
-        print("### closed ###")
+    def use_websocket(self, chatbot):
+        from ws_ingest import WebSocketIngest
 
-    def on_open(self, ws):
-        def run(*args):
-            ws.send("Hello, world!")
-        run()
+        # Every chat frame goes through the same analysis and persistence path as the CLI.
+        def on_records(records):
+            for record in records:
+                chatbot.generate_response({"user": record["user_id"], "message": record["message"]})
 
-    def use_websocket(self):
-        websocket.enableTrace(True)
-        ws = websocket.WebSocketApp(self.chatroom_url,
-                                  on_message = self.on_message,
-                                  on_error = self.on_error,
-                                  on_close = self.on_close)
-        ws.on_open = self.on_open
-        ws.run_forever()
+        ingest = WebSocketIngest(self.chatroom_url, on_records=on_records)
+        ingest.run_forever()
 
 class Chatbot:
     def __init__(self, chatlog):
@@ -156,28 +66,19 @@ class Chatbot:
 
         self.chatlog.store_chatlog(user_id, message)
 
-        doc = self.chatlog.nlp(message)
-        sentiments = [sentence._.sentiment.polarity for sentence in doc.sents]
-        topics = [token.lemma_ for token in doc if token.pos_ in ["NOUN", "PROPN"]]
+        # The same VADER scores per sentence as the other bots; spaCy has no
+        # `._.sentiment` extension unless a plugin registers one.
+        analysis = analyze_doc(self.chatlog.nlp(message))
+        sentiments, topics = analysis["sentiments"], analysis["topics"]
 
-        user_profile = self.chatlog.get_user_profile(user_id)
-        existing_sentiments = user_profile.get("avg_sentiment", [])
-        existing_topics = user_profile.get("most_common_topic", [])
-        existing_data = user_profile.get("data", {})
-
-        updated_sentiments = existing_sentiments + sentiments
-        updated_topics = existing_topics + topics
-
-        if user_profile:
-            self.chatlog.update_user_profile(user_id, updated_sentiments, updated_topics, existing_data)
-        else:
-            self.chatlog.create_user_profile(user_id, updated_sentiments, updated_topics, existing_data)
+        # Only this message's scores are sent; the store folds them into the decayed aggregates.
+        self.chatlog.update_user_profile(user_id, sentiments, topics)
 
         response = "Thank you for your message. How can I assist you?"
         return response
 
     def process_command(self, command):
-        response = openai.Completion.create(
+        response = openai_api().Completion.create(
             engine="davinci",
             prompt=command,
             temperature=0.7,
@@ -186,6 +87,13 @@ class Chatbot:
         return response.choices[0].text.strip()
 
     def use_selenium(self, selenium_url):
+        # Selenium is only imported by the command that drives a browser.
+        from selenium import webdriver
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.common.keys import Keys
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
         driver = webdriver.Firefox()
 
         driver.get(selenium_url)
@@ -256,7 +164,7 @@ def start_cli():
             print(f"Response: {response}")
 
         elif command == "websocket":
-            chatlog.use_websocket()
+            chatlog.use_websocket(chatbot)
 
         elif command == "selenium":
             selenium_url = input("Enter URL for Selenium: ")
@@ -0,0 +1,155 @@
+import os
+import sys
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from sentiment import SentimentEngine
+
+# Sentence boundaries need the parser and topics need the tagger and
+# lemmatizer; named entities are never read, so NER is not run at all.
+UNUSED_COMPONENTS = ("ner",)
+
+# Loaded once per worker process by _load_model.
+_nlp = None
+
+
+def load_model(model_name, disable=UNUSED_COMPONENTS):
+    # Imported here so only the worker processes pay for spaCy.
+    import spacy
+    return spacy.load(model_name, disable=list(disable))
+
+
+def _load_model(model_name, disable):
+    global _nlp
+    _nlp = load_model(model_name, disable)
+
+
+def analyze_doc(doc):
+    return analyze_docs([doc])[0]
+
+
+def analyze_docs(docs):
+    """Scores every sentence of every doc in a single `score_batch` call."""
+    sentences = [[sentence.text for sentence in doc.sents] for doc in docs]
+    compound = SentimentEngine.shared().score_batch([text for doc in sentences for text in doc]).compound
+
+    results = []
+    offset = 0
+    for doc, texts in zip(docs, sentences):
+        results.append({
+            "sentiments": compound[offset:offset + len(texts)].tolist(),
+            "topics": [token.lemma_ for token in doc if token.pos_ in ["NOUN", "PROPN"]],
+        })
+        offset += len(texts)
+    return results
+
+
+def analyze_batch(nlp, messages, batch_size=64):
+    return analyze_docs(list(nlp.pipe(messages, batch_size=batch_size)))
+
+
+def _analyze(message):
+    return analyze_doc(_nlp(message))
+
+
+def _analyze_batch(messages, batch_size):
+    return analyze_batch(_nlp, messages, batch_size)
+
+
+class AnalysisPool:
+    """
+    Runs sentiment and topic extraction on a pool of worker processes.
+
+    Each worker loads the spaCy pipeline once when it starts, so parsing is
+    spread across cores instead of running on the thread handling the room.
+    `submit` returns a future; resolving futures in submission order (as the
+    pipeline's single persist worker does) keeps profile updates in message
+    order even though messages are parsed concurrently.
+
+    Bursts of messages should go through `submit_batch`, which runs them
+    through `nlp.pipe` in chunks of `batch_size` so tagger and parser cost is
+    amortized across the chunk.
+
+    Attributes:
+        model_name (str): The spaCy pipeline each worker loads.
+        processes (int): Number of worker processes (defaults to CPU count).
+        batch_size (int): Messages per `nlp.pipe` chunk.
+        disable (tuple): Pipeline components the workers do not load.
+    """
+
+    def __init__(self, model_name="en_core_web_sm", processes=None, batch_size=64, disable=UNUSED_COMPONENTS):
+        self.model_name = model_name
+        self.processes = processes or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.disable = tuple(disable)
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            initializer=_load_model,
+            initargs=(model_name, self.disable)
+        )
+
+    def submit(self, message):
+        return self._executor.submit(_analyze, message)
+
+    def analyze(self, message):
+        return self.submit(message).result()
+
+    def submit_batch(self, messages):
+        """
+        Splits `messages` into `batch_size` chunks, one `nlp.pipe` call per chunk.
+
+        Returns one future per message, in input order, so callers can treat
+        batched and single submissions alike.
+        """
+        futures = [Future() for _ in messages]
+        for start in range(0, len(messages), self.batch_size):
+            end = start + self.batch_size
+            chunk = self._executor.submit(_analyze_batch, messages[start:end], self.batch_size)
+            chunk.add_done_callback(lambda done, targets=futures[start:end]: _fan_out(done, targets))
+        return futures
+
+    def analyze_batch(self, messages):
+        return [future.result() for future in self.submit_batch(messages)]
+
+    def close(self):
+        self._executor.shutdown()
+
+
+def _fan_out(done, futures):
+    error = done.exception()
+    if error is not None:
+        for future in futures:
+            future.set_exception(error)
+        return
+    for future, result in zip(futures, done.result()):
+        future.set_result(result)
+
+
+def benchmark(messages, model_name="en_core_web_sm", batch_size=64):
+    """Compares per-message `nlp(message)` with `nlp.pipe` on one core."""
+    nlp = load_model(model_name)
+    results = {}
+
+    started = time.perf_counter()
+    for message in messages:
+        analyze_doc(nlp(message))
+    results["per_message"] = len(messages) / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    analyze_batch(nlp, messages, batch_size)
+    results["pipe"] = len(messages) / (time.perf_counter() - started)
+
+    return results
+
+
+if __name__ == "__main__":
+    # Replays a backlog file (one message per line) through both paths.
+    with open(sys.argv[1]) as f:
+        backlog = [line.strip() for line in f if line.strip()]
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+
+    rates = benchmark(backlog, batch_size=batch_size)
+    print(f"Messages: {len(backlog)}")
+    print(f"Per-message: {rates['per_message']:.0f} msg/s")
+    print(f"nlp.pipe (batch_size={batch_size}): {rates['pipe']:.0f} msg/s")
+    print(f"Speedup: {rates['pipe'] / rates['per_message']:.2f}x")
@@ -0,0 +1,356 @@
+import atexit
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+
+def chromedriver_path():
+    """Resolves chromedriver once per process instead of once per bot."""
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is None:
+            try:
+                from webdriver_manager.chrome import ChromeDriverManager
+                _driver_path = ChromeDriverManager().install()
+            except ImportError:
+                # Selenium 4.6+ finds a driver on its own.
+                _driver_path = ""
+        return _driver_path
+
+
+def make_driver(headless=True):
+    """
+    Starts a Chrome session tuned for scraping chat rooms.
+
+    Headless, no images, and an "eager" page load strategy, so `get()`
+    returns once the DOM is ready instead of after every asset has loaded.
+    """
+    options = Options()
+    if headless:
+        options.add_argument("--headless=new")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--disable-extensions")
+    options.add_argument("--no-first-run")
+    options.add_argument("--window-size=1280,900")
+    options.add_argument("--blink-settings=imagesEnabled=false")
+    options.page_load_strategy = "eager"
+
+    path = chromedriver_path()
+    if path:
+        from selenium.webdriver.chrome.service import Service
+        return webdriver.Chrome(service=Service(path), options=options)
+    return webdriver.Chrome(options=options)
+
+
+def wait_for(driver, condition, timeout=10):
+    """Waits for an expected condition, e.g. `EC.element_to_be_clickable(locator)`."""
+    return WebDriverWait(driver, timeout, poll_frequency=0.1).until(condition)
+
+
+def wait_for_ready(driver, timeout=10):
+    wait_for(driver, lambda d: d.execute_script("return document.readyState") != "loading", timeout)
+
+
+def wait_for_url_change(driver, url, timeout=10):
+    wait_for(driver, EC.url_changes(url), timeout)
+
+
+class SessionStore:
+    """
+    Saves a logged-in session's cookies and localStorage to disk.
+
+    Sessions are keyed by site origin and username and expire after
+    `max_age` seconds, after which the caller logs in again. The files hold
+    live login cookies, so the directory and files are private to the user.
+    """
+
+    def __init__(self, path=None, max_age=7 * 24 * 3600):
+        self.path = path or os.path.join(os.path.expanduser("~"), ".chatbot", "sessions")
+        self.max_age = max_age
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+
+    def _file(self, url, username):
+        parts = urlparse(url)
+        key = f"{parts.scheme}://{parts.netloc}\x1f{username}".encode("utf-8")
+        return os.path.join(self.path, hashlib.sha256(key).hexdigest()[:32] + ".json")
+
+    def save(self, driver, url, username):
+        session = {
+            "saved": time.time(),
+            "cookies": driver.get_cookies(),
+            "local_storage": driver.execute_script(
+                "const items = {};"
+                "for (let i = 0; i < localStorage.length; i++) {"
+                "    const key = localStorage.key(i);"
+                "    items[key] = localStorage.getItem(key);"
+                "}"
+                "return items;"
+            ),
+        }
+        filename = self._file(url, username)
+        # Created 0600 rather than with the umask's default permissions.
+        fd = os.open(filename + ".tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(session, f)
+        os.replace(filename + ".tmp", filename)
+
+    def restore(self, driver, url, username):
+        """
+        Loads a saved session into `driver` and opens `url`.
+
+        Returns False when there is nothing usable to restore. Cookies can
+        only be set for the page's current origin, so the origin is loaded
+        first and `url` is loaded again afterwards.
+        """
+        try:
+            with open(self._file(url, username)) as f:
+                session = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if time.time() - session.get("saved", 0) > self.max_age:
+            return False
+
+        parts = urlparse(url)
+        driver.get(f"{parts.scheme}://{parts.netloc}/")
+        for cookie in session["cookies"]:
+            cookie.pop("sameSite", None)
+            try:
+                driver.add_cookie(cookie)
+            except Exception as error:
+                print("Skipping cookie: ", error)
+        driver.execute_script(
+            "const items = arguments[0];"
+            "for (const key in items) { localStorage.setItem(key, items[key]); }",
+            session["local_storage"]
+        )
+        driver.get(url)
+        return True
+
+    def forget(self, url, username):
+        try:
+            os.remove(self._file(url, username))
+        except OSError:
+            pass
+
+
+def login_with_cache(driver, url, username, login, logged_in, store=None, timeout=5):
+    """
+    Opens `url` logged in as `username`, reusing a saved session if it still works.
+
+    `login(driver)` performs a full login from the page at `url`;
+    `logged_in` is an expected condition that holds once the chat has
+    loaded for a logged-in user. A fresh login is saved for next time.
+    Returns True when the saved session was reused.
+    """
+    store = store or SessionStore()
+    if store.restore(driver, url, username):
+        try:
+            wait_for(driver, logged_in, timeout)
+            return True
+        except Exception:
+            store.forget(url, username)
+            driver.delete_all_cookies()
+
+    driver.get(url)
+    login(driver)
+    wait_for(driver, logged_in)
+    store.save(driver, url, username)
+    return False
+
+
+class SessionPool:
+    """
+    Keeps warm browser sessions so bots do not pay Chrome's startup cost.
+
+    `warm()` starts `size` sessions in parallel ahead of time, and `start()`
+    does the same on a background thread so the program can carry on while
+    Chrome launches. `acquire()` hands one out (waiting for a warm-up in
+    progress, and starting another only if the pool is still empty) and
+    `release()` returns it after deleting its cookies, localStorage and
+    sessionStorage and going back to about:blank, so the next bot does not
+    inherit the last one's login; a session that cannot be cleared is shut
+    down instead. A session that has died is replaced on the next acquire.
+    Create one pool per process and pass it to every bot.
+
+    Attributes:
+        started (int): Sessions started.
+        reused (int): Acquires served by a warm session.
+    """
+
+    def __init__(self, size=2, headless=True, driver_factory=None):
+        self.size = size
+        self.driver_factory = driver_factory or (lambda: make_driver(headless))
+        self.started = 0
+        self.reused = 0
+        self._idle = queue.LifoQueue()
+        self._all = []
+        self._lock = threading.Lock()
+        self._warming = None
+        self._closed = False
+
+    def start(self):
+        self._warming = threading.Thread(target=self._warm, name="session-pool-warm", daemon=True)
+        self._warming.start()
+        return self
+
+    def warm(self):
+        missing = self.size - self._idle.qsize()
+        if missing <= 0:
+            return
+        with ThreadPoolExecutor(max_workers=missing) as executor:
+            for driver in executor.map(lambda _: self._start(), range(missing)):
+                self._idle.put(driver)
+
+    def acquire(self):
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                warming = self._warming
+                if warming is None or not warming.is_alive():
+                    return self._start()
+                warming.join()
+                continue
+            if self._alive(driver):
+                self.reused += 1
+                return driver
+            self._discard(driver)
+
+    def release(self, driver):
+        try:
+            self._clear(driver)
+            driver.get("about:blank")
+        except Exception:
+            self._discard(driver)
+            return
+        self._idle.put(driver)
+
+    def stats(self):
+        return {"started": self.started, "reused": self.reused, "idle": self._idle.qsize()}
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        # A browser still launching is quit as soon as it is up (see _start).
+        warming = self._warming
+        if warming is not None and warming is not threading.current_thread():
+            warming.join()
+        with self._lock:
+            drivers, self._all = self._all, []
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception as error:
+                print("Error closing browser: ", error)
+
+    def _warm(self):
+        try:
+            self.warm()
+        except Exception as error:
+            print("Warming browser sessions failed: ", error)
+
+    def _start(self):
+        driver = self.driver_factory()
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._all.append(driver)
+                self.started += 1
+        if closed:
+            # Finished launching after close(); nothing would ever quit it.
+            driver.quit()
+            raise RuntimeError("SessionPool is closed")
+        return driver
+
+    def _clear(self, driver):
+        try:
+            driver.execute_script("localStorage.clear(); sessionStorage.clear();")
+        except Exception:
+            # Pages such as about:blank have no storage to clear.
+            pass
+        driver.delete_all_cookies()
+        if hasattr(driver, "execute_cdp_cmd"):
+            # delete_all_cookies only reaches the current page's domain.
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+
+    def _alive(self, driver):
+        try:
+            driver.current_window_handle
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, driver):
+        with self._lock:
+            if driver in self._all:
+                self._all.remove(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+
+_shared_sessions = None
+_shared_sessions_lock = threading.Lock()
+
+
+def shared_sessions(size=1):
+    """
+    The process-wide SessionPool, started warming in the background on first call.
+
+    It lives as long as the process and is closed at interpreter exit, so
+    its browsers do not outlive the bot.
+    """
+    global _shared_sessions
+    with _shared_sessions_lock:
+        if _shared_sessions is None:
+            _shared_sessions = SessionPool(size=size).start()
+            atexit.register(_shared_sessions.close)
+        return _shared_sessions
+
+
+def benchmark(url, runs=3):
+    """Compares a cold start of the same headless Chrome with acquiring a warm session from the pool."""
+    # Resolved once up front, as it would be for the pool, so only browser startup is timed.
+    chromedriver_path()
+    cold = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        driver = make_driver()
+        driver.get(url)
+        cold.append(time.perf_counter() - started)
+        driver.quit()
+
+    pool = SessionPool(size=1)
+    pool.warm()
+    warm = []
+    try:
+        for _ in range(runs):
+            started = time.perf_counter()
+            driver = pool.acquire()
+            driver.get(url)
+            warm.append(time.perf_counter() - started)
+            pool.release(driver)
+    finally:
+        pool.close()
+
+    print(f"cold start: {sum(cold) / runs:.2f}s  warm session: {sum(warm) / runs:.2f}s")
+
+
+if __name__ == "__main__":
+    import sys
+
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else "about:blank")
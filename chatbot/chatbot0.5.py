@@ -1,156 +1,80 @@
-import os
-import random
-import time
-import nltk
-import spacy
-from nltk.sentiment import SentimentIntensityAnalyzer
-from nltk.tokenize import word_tokenize
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
-import re
-import psycopg2
-import requests
-import openai
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
-from time import sleep
-
-openai.api_key = os.environ["OPENAI_API_KEY"]
-
-class StumbleChatBot:
-    def __init__(self, username, password):
-        self.driver = webdriver.Chrome(ChromeDriverManager().install())
-        self.username = username
-        self.password = password
+import threading
 
-    def login(self):
-        self.driver.get("https://www.stumblechat.com") 
-        sleep(2)
-        self.driver.find_element(By.ID, "login-button-id").click() 
-        sleep(2)
-        self.driver.find_element(By.ID, "username-input-id").send_keys(self.username)
-        self.driver.find_element(By.ID, "password-input-id").send_keys(self.password)
-        self.driver.find_element(By.ID, "login-submit-button-id").click()
-        sleep(2)
-
-    def fetch_messages(self):
-        messages_elements = self.driver.find_elements(By.CLASS_NAME, "message-element-class")
-        messages = [element.text for element in messages_elements]
-        return messages
-
-    def post_message(self, message):
-        self.driver.find_element(By.ID, "post-message-input-id").send_keys(message)
-        self.driver.find_element(By.ID, "post-message-button-id").click()
+from chatlog_partitions import ChatlogPartitions
+from chatlog_writer import ChatlogWriter
+from db_pool import DatabasePool
+from migrations import Migrator, chatlog_migrations
+from models import openai_api, spacy_model
+from profile_cache import CachedProfileStore
+from profile_store import ProfileStore
+from sentiment import SentimentEngine
 
 class Chatlog:
-    def __init__(self, chatroom_url, username, password, database_name, database_user, database_password):
+    def __init__(self, chatroom_url, username, password, database_name, database_user, database_password,
+                 pool=None, min_connections=1, max_connections=10):
         self.chatroom_url = chatroom_url
         self.username = username
         self.password = password
         self.database_name = database_name
         self.database_user = database_user
         self.database_password = database_password
-        self.nlp = spacy.load("en_core_web_sm")  
-
-        self.conn = psycopg2.connect(
-            host="localhost",
-            port=5432,
-            database=database_name,
-            user=database_user,
-            password=database_password
+
+        self._owns_pool = pool is None
+        self.pool = pool or DatabasePool(
+            database_name,
+            database_user,
+            database_password,
+            min_connections=min_connections,
+            max_connections=max_connections
         )
-        self.cur = self.conn.cursor()
+        self.profiles = CachedProfileStore(ProfileStore(self.pool))
+        self.writer = ChatlogWriter(self.pool)
+        self.partitions = ChatlogPartitions(self.pool)
         self.upgrade_database()
+        self.partitions.start()
 
-    def upgrade_database(self):
-        self.cur.execute(
-            "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'user_profiles')"
-        )
-        user_profiles_table_exists = self.cur.fetchone()[0]
+    @property
+    def nlp(self):
+        # Loaded by the first chat message, not at startup; profile lookups never parse.
+        return spacy_model("en_core_web_sm")
 
-        self.cur.execute(
-            "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'chatlog')"
-        )
-        chatlog_table_exists = self.cur.fetchone()[0]
-
-        if not user_profiles_table_exists:
-            self.cur.execute("""
-                CREATE TABLE user_profiles (
-                    user_id SERIAL PRIMARY KEY,
-                    sentiments TEXT,
-                    topics TEXT,
-                    data JSONB
-                )
-            """)
-            self.conn.commit()
-
-        if not chatlog_table_exists:
-            self.cur.execute("""
-                CREATE TABLE chatlog (
-                    entry_id SERIAL PRIMARY KEY,
-                    user_id INTEGER,
-                    message TEXT,
-                    timestamp TIMESTAMP DEFAULT NOW()
-                )
-            """)
-            self.conn.commit()
+    def close(self):
+        self.migrator.stop()
+        self.partitions.stop()
+        self.profiles.close()
+        self.writer.close()
+        if self._owns_pool:
+            self.pool.close()
+
+    def upgrade_database(self):
+        # One query against schema_migrations when the schema is already current.
+        self.migrator = Migrator(self.pool, chatlog_migrations(self.partitions))
+        self.migrator.migrate(backfill=False)
+        # Existing rows are migrated in small batches while the bot runs.
+        self.migrator.start_backfills()
 
     def get_user_profile(self, user_id):
-        sentiments = []
-        topics = []
-        data = {}
+        return self.profiles.get(user_id)
 
-        self.cur.execute(
-            "SELECT * FROM user_profiles WHERE user_id = %s",
-            (user_id,)
-        )
-        profile = self.cur.fetchone()
-
-        if profile:
-            sentiments = profile[1]
-            topics = profile[2]
-            data = profile[3]
-
-        return (sentiments, topics, data)
-
-    def save_user_profile(self, user_id, sentiments, topics, data):
-        self.cur.execute("""
-            INSERT INTO user_profiles (user_id, sentiments, topics, data)
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (user_id)
-            DO UPDATE SET sentiments = %s, topics = %s, data = %s""",
-            (user_id, sentiments, topics, data, sentiments, topics, data)
-        )
-        self.conn.commit()
+    def update_user_profile(self, user_id, sentiments, topics, data=None):
+        # Folded into the cached aggregates instead of rewriting the whole history.
+        self.profiles.update(user_id, sentiments, topics, data)
 
     def save_chat_entry(self, user_id, message):
-        self.cur.execute(
-            "INSERT INTO chatlog (user_id, message) VALUES (%s, %s)",
-            (user_id, message)
-        )
-        self.conn.commit()
+        self.writer.add(user_id, message)
 
 class Chatbot:
     def __init__(self, chatlog):
         self.chatlog = chatlog
 
     def chat(self, user_id, message):
-        sentiments, topics, data = self.chatlog.get_user_profile(user_id)
-        sentiments.append(self.analyze_sentiment(message))
-        topics.extend(self.analyze_topics(message))
-        self.chatlog.save_user_profile(user_id, sentiments, topics, data)
+        self.chatlog.update_user_profile(user_id, [self.analyze_sentiment(message)], self.analyze_topics(message))
         self.chatlog.save_chat_entry(user_id, message)
         response = self.generate_response(message)
         return response
 
     def analyze_sentiment(self, message):
-        sia = SentimentIntensityAnalyzer()
-        sentiment = sia.polarity_scores(message)
-        return sentiment
+        return SentimentEngine.shared().score(message)
 
     def analyze_topics(self, message):
         doc = self.chatlog.nlp(message)
@@ -159,7 +83,7 @@ class Chatbot:
 
     def generate_response(self, message):
         prompt = f"The following is a conversation with an AI assistant. The assistant is helpful, creative, and friendly.\n\nUser: {message}\nAssistant:"
-        response = openai.Completion.create(
+        response = openai_api().Completion.create(
             engine="text-davinci-002",
             prompt=prompt,
             temperature=0.8,
@@ -171,6 +95,24 @@ def authenticate(username, password):
     # authenticate method implementation depends on your service
     return True
 
+def warm_browser():
+    # Selenium is imported and Chrome launched off the main thread, so the
+    # prompt is not held up and the first fetch/post finds a browser ready.
+    def warm():
+        try:
+            from browser_sessions import shared_sessions
+            shared_sessions()
+        except Exception as error:
+            print("Could not start a browser: ", error)
+    threading.Thread(target=warm, name="warm-browser", daemon=True).start()
+
+def connect_stumblechat(username, password):
+    # Selenium and a browser are only started by the first command that needs them.
+    from stumblechat import StumbleChatBot
+    bot = StumbleChatBot(username, password)
+    bot.login()
+    return bot
+
 def start_cli():
     username = input("Enter your username: ")
     password = input("Enter your password: ")
@@ -187,37 +129,45 @@ def start_cli():
         database_password="your-db-password"
     )
     chatbot = Chatbot(chatlog)
-    stumblechat_bot = StumbleChatBot(username, password)
-    stumblechat_bot.login()
-
-    while True:
-        command = input("Enter command (chat, profile, fetch, post, command, exit): ")
-        if command == "chat":
-            user_id = input("Enter user id: ")
-            message = input("Enter your message: ")
-            response = chatbot.chat(user_id, message)
-            print(f"Chatbot response: {response}")
-        elif command == "profile":
-            user_id = input("Enter user id: ")
-            sentiments, topics, data = chatlog.get_user_profile(user_id)
-            print(f"Sentiments: {sentiments}")
-            print(f"Topics: {topics}")
-            print(f"Data: {data}")
-        elif command == "fetch":
-            messages = stumblechat_bot.fetch_messages()
-            print("Fetched messages: ")
-            for msg in messages:
-                print(msg)
-        elif command == "post":
-            message = input("Enter the message to post: ")
-            stumblechat_bot.post_message(message)
-        elif command == "command":
-            command = input("Enter your command: ")
-            response = chatbot.generate_response(command)
-            print(f"Chatbot response: {response}")
-        elif command == "exit":
-            print("Exiting...")
-            break
+    stumblechat_bot = None
+    # The shared browser pool closes itself at exit (see shared_sessions).
+    warm_browser()
+
+    try:
+        while True:
+            command = input("Enter command (chat, profile, fetch, post, command, exit): ")
+            if command == "chat":
+                user_id = input("Enter user id: ")
+                message = input("Enter your message: ")
+                response = chatbot.chat(user_id, message)
+                print(f"Chatbot response: {response}")
+            elif command == "profile":
+                user_id = input("Enter user id: ")
+                profile = chatlog.get_user_profile(user_id)
+                print(f"Average sentiment: {profile['avg_sentiment']}")
+                print(f"Topics: {profile['top_topics']}")
+                print(f"Data: {profile['data']}")
+            elif command == "fetch":
+                stumblechat_bot = stumblechat_bot or connect_stumblechat(username, password)
+                messages = stumblechat_bot.fetch_messages()
+                print("Fetched messages: ")
+                for msg in messages:
+                    print(msg)
+            elif command == "post":
+                message = input("Enter the message to post: ")
+                stumblechat_bot = stumblechat_bot or connect_stumblechat(username, password)
+                stumblechat_bot.post_message(message)
+            elif command == "command":
+                command = input("Enter your command: ")
+                response = chatbot.generate_response(command)
+                print(f"Chatbot response: {response}")
+            elif command == "exit":
+                print("Exiting...")
+                break
+    finally:
+        if stumblechat_bot is not None:
+            stumblechat_bot.close()
+        chatlog.close()
 
 if __name__ == "__main__":
     start_cli()
@@ -1,43 +1,38 @@
-import psycopg2
-import openai
-import os
-import json
-
-openai.api_key = os.environ["OPENAI_API_KEY"]
+from completion_cache import CompletionCache
+from db_pool import DatabasePool
+from llm_client import LLMClient
+from profile_cache import CachedProfileStore
+from profile_store import ProfileStore
 
 class DatabaseManager:
-    def __init__(self, database_name, database_user, database_password):
-        self.conn = psycopg2.connect(
-            host="localhost",
-            port=5432,
-            database=database_name,
-            user=database_user,
-            password=database_password
+    def __init__(self, database_name, database_user, database_password, pool=None,
+                 min_connections=1, max_connections=10, profile_ttl=30):
+        self.pool = pool or DatabasePool(
+            database_name,
+            database_user,
+            database_password,
+            min_connections=min_connections,
+            max_connections=max_connections
         )
-        self.cur = self.conn.cursor()
+        # Profiles are written by the chat loggers; re-read them at most every `profile_ttl` seconds.
+        self.profiles = CachedProfileStore(ProfileStore(self.pool), ttl=profile_ttl)
 
     def get_user_profile(self, user_id):
-        self.cur.execute("SELECT * FROM user_profiles WHERE user_id = %s", (user_id,))
-        profile = self.cur.fetchone()
-
-        if profile:
-            profile_data = json.loads(profile[1])
-            return profile_data
-        else:
-            return {}
+        return self.profiles.get(user_id)
 
 class OpenAIHelper:
-    def __init__(self, engine="davinci"):
+    def __init__(self, engine="davinci", client=None):
         self.engine = engine
+        self.client = client or LLMClient(cache=CompletionCache())
 
     def generate_response(self, prompt):
-        response = openai.Completion.create(
+        response = self.client.complete(
             engine=self.engine,
             prompt=prompt,
             temperature=0.7,
             max_tokens=100
         )
-        return response["choices"][0]["text"].strip()
+        return response.strip()
 
 class Chatbot:
     def __init__(self, db_manager, openai_helper):
@@ -1,128 +1,87 @@
-import os
-import random
-import time
-import nltk
-import spacy
-from nltk.sentiment import SentimentIntensityAnalyzer
-from nltk.tokenize import word_tokenize
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
-import re
-import psycopg2
-import requests
-import openai
-
-openai.api_key = os.environ["OPENAI_API_KEY"]
+"""
+This script is for a command-line interface (CLI) chatbot. It interacts with the user through a series of prompts and user inputs.
+
+When run, it first prompts the user to input their username and password for authentication. If the authentication is successful, it sets up a `Chatlog` instance to interact with a chat room and a Postgres database.
+
+The user can then interact with the chatbot through several commands:
+
+- `chat`: The user inputs their user ID and a message. The chatbot stores the chatlog entry, analyzes the message for sentiment and topics, updates the user profile accordingly, and generates a response.
+
+- `profile`: The user inputs their user ID. The chatbot fetches and displays the user's profile, including average sentiment, most common topic, and other user data.
+
+- `command`: The user inputs their user ID and a command. The chatbot processes the command with OpenAI's GPT-3 model and prints the response.
+
+- `exit`: The chatbot program is terminated.
+"""
+from analysis_pool import AnalysisPool
+from chatlog_partitions import ChatlogPartitions
+from chatlog_writer import ChatlogWriter
+from completion_cache import CompletionCache, cached_completion
+from db_pool import DatabasePool
+from migrations import Migrator, chatlog_migrations
+from profile_cache import CachedProfileStore
+from profile_store import ProfileStore
 
 class Chatlog:
-    def __init__(self, chatroom_url, username, password, database_name, database_user, database_password):
+    def __init__(self, chatroom_url, username, password, database_name, database_user, database_password,
+                 pool=None, min_connections=1, max_connections=10, analysis=None):
         self.chatroom_url = chatroom_url
         self.username = username
         self.password = password
         self.database_name = database_name
         self.database_user = database_user
         self.database_password = database_password
-        self.nlp = spacy.load("en_core_web_sm")  # Load the English language model
-
-        self.conn = psycopg2.connect(
-            host="localhost",
-            port=5432,
-            database=database_name,
-            user=database_user,
-            password=database_password
+        self._owns_analysis = analysis is None
+        self.analysis = analysis or AnalysisPool("en_core_web_sm")
+
+        self._owns_pool = pool is None
+        self.pool = pool or DatabasePool(
+            database_name,
+            database_user,
+            database_password,
+            min_connections=min_connections,
+            max_connections=max_connections
         )
-        self.cur = self.conn.cursor()
+        # Hot profiles are served from memory; bursts of updates are written once per second.
+        self.profiles = CachedProfileStore(ProfileStore(self.pool))
+        self.writer = ChatlogWriter(self.pool)
+        self.partitions = ChatlogPartitions(self.pool)
 
         # Upgrade the database schema if needed
         self.upgrade_database()
+        self.partitions.start()
+
+    def close(self):
+        self.migrator.stop()
+        self.partitions.stop()
+        self.profiles.close()
+        self.writer.close()
+        if self._owns_pool:
+            self.pool.close()
+        if self._owns_analysis:
+            self.analysis.close()
 
     def upgrade_database(self):
-        self.cur.execute(
-            "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'user_profiles')"
-        )
-        user_profiles_table_exists = self.cur.fetchone()[0]
-
-        self.cur.execute(
-            "SELECT EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'chatlog')"
-        )
-        chatlog_table_exists = self.cur.fetchone()[0]
-
-        if not user_profiles_table_exists:
-            self.cur.execute("""
-                CREATE TABLE user_profiles (
-                    user_id SERIAL PRIMARY KEY,
-                    sentiments TEXT,
-                    topics TEXT,
-                    data JSONB
-                )
-            """)
-            self.conn.commit()
-
-        if not chatlog_table_exists:
-            self.cur.execute("""
-                CREATE TABLE chatlog (
-                    entry_id SERIAL PRIMARY KEY,
-                    user_id INTEGER,
-                    message TEXT,
-                    timestamp TIMESTAMP DEFAULT NOW()
-                )
-            """)
-            self.conn.commit()
+        # One query against schema_migrations when the schema is already current.
+        self.migrator = Migrator(self.pool, chatlog_migrations(self.partitions))
+        self.migrator.migrate(backfill=False)
+        # Existing rows are migrated in small batches while the bot runs.
+        self.migrator.start_backfills()
 
     def get_user_profile(self, user_id):
-        sentiments = []
-        topics = []
-        data = {}
-
-        self.cur.execute(
-            "SELECT * FROM user_profiles WHERE user_id = %s",
-            (user_id,)
-        )
-        profile = self.cur.fetchone()
-
-        if profile:
-            sentiments = [int(sentiment) for sentiment in profile[1].split(",")]
-            topics = profile[2].split(",")
-            data = profile[3]
-
-        return {
-            "user_id": user_id,
-            "avg_sentiment": sum(sentiments) / len(sentiments),
-            "most_common_topic": max(topics, key=topics.count),
-            "data": data
-        }
-
-    def create_user_profile(self, user_id, sentiments, topics, data):
-        sentiments_str = ",".join(str(sentiment) for sentiment in sentiments)
-        topics_str = ",".join(topics)
-
-        self.cur.execute(
-            "INSERT INTO user_profiles (user_id, sentiments, topics, data) VALUES (%s, %s, %s, %s)",
-            (user_id, sentiments_str, topics_str, data)
-        )
-        self.conn.commit()
-
-    def update_user_profile(self, user_id, sentiments, topics, data):
-        sentiments_str = ",".join(str(sentiment) for sentiment in sentiments)
-        topics_str = ",".join(topics)
+        return self.profiles.get(user_id)
 
-        self.cur.execute(
-            "UPDATE user_profiles SET sentiments = %s, topics = %s, data = %s WHERE user_id = %s",
-            (sentiments_str, topics_str, data, user_id)
-        )
-        self.conn.commit()
+    def update_user_profile(self, user_id, sentiments, topics, data=None):
+        self.profiles.update(user_id, sentiments, topics, data)
 
     def store_chatlog(self, user_id, message):
-        self.cur.execute(
-            "INSERT INTO chatlog (user_id, message) VALUES (%s, %s)",
-            (user_id, message)
-        )
-        self.conn.commit()
+        self.writer.add(user_id, message)
 
 
 class Chatbot:
-    def __init__(self, chatlog):
+    def __init__(self, chatlog, completions=None):
         self.chatlog = chatlog
+        self.completions = completions or CompletionCache()
 
     def generate_response(self, message_dict):
         user_id = message_dict["user"]
@@ -131,35 +90,22 @@ class Chatbot:
         # Store the chatlog entry
         self.chatlog.store_chatlog(user_id, message)
 
-        # Perform NLP tasks using spacy
-        doc = self.chatlog.nlp(message)
-        sentiments = [sentence._.sentiment.polarity for sentence in doc.sents]
-        topics = [token.lemma_ for token in doc if token.pos_ in ["NOUN", "PROPN"]]
-
-        user_profile = self.chatlog.get_user_profile(user_id)
-        existing_sentiments = user_profile.get("avg_sentiment", [])
-        existing_topics = user_profile.get("most_common_topic", [])
-        existing_data = user_profile.get("data", {})
-
-        updated_sentiments = existing_sentiments + sentiments
-        updated_topics = existing_topics + topics
-
-        if user_profile:
-            self.chatlog.update_user_profile(user_id, updated_sentiments, updated_topics, existing_data)
-        else:
-            self.chatlog.create_user_profile(user_id, updated_sentiments, updated_topics, existing_data)
+        # Perform NLP tasks on the spacy worker pool
+        analysis = self.chatlog.analysis.analyze(message)
+        self.chatlog.update_user_profile(user_id, analysis["sentiments"], analysis["topics"])
 
         response = "Thank you for your message. How can I assist you?"
         return response
 
     def process_command(self, command):
-        response = openai.Completion.create(
+        response = cached_completion(
+            self.completions,
             engine="davinci",
             prompt=command,
             temperature=0.7,
             max_tokens=100
         )
-        return response.choices[0].text.strip()
+        return response.strip()
 
 
 def authenticate(username, password):
@@ -220,6 +166,7 @@ def start_cli():
             print(f"Response: {response}")
 
         elif command == "exit":
+            chatlog.close()
             break
 
         else:
@@ -228,17 +175,3 @@ def start_cli():
 
 if __name__ == "__main__":
     start_cli()
-
-This script is for a command-line interface (CLI) chatbot. It interacts with the user through a series of prompts and user inputs.
-
-When run, it first prompts the user to input their username and password for authentication. If the authentication is successful, it sets up a `Chatlog` instance to interact with a chat room and a Postgres database.
-
-The user can then interact with the chatbot through several commands:
-
-- `chat`: The user inputs their user ID and a message. The chatbot stores the chatlog entry, analyzes the message for sentiment and topics, updates the user profile accordingly, and generates a response.
-
-- `profile`: The user inputs their user ID. The chatbot fetches and displays the user's profile, including average sentiment, most common topic, and other user data.
-
-- `command`: The user inputs their user ID and a command. The chatbot processes the command with OpenAI's GPT-3 model and prints the response.
-
-- `exit`: The chatbot program is terminated.
@@ -0,0 +1,185 @@
+import gzip
+import json
+import sys
+import time
+from datetime import date, datetime
+
+from psycopg2 import sql
+
+from db_pool import DatabasePool
+from topic_vectors import decode_vector
+
+CHATLOG_COLUMNS = ("entry_id", "user_id", "message", "timestamp")
+PROFILE_COLUMNS = (
+    "user_id", "sentiment_count", "sentiment_sum", "sentiment_sumsq", "topic_counts", "top_topic",
+    "topic_vector", "data", "updated_at",
+)
+
+
+def iter_rows(pool, table, columns, keys, conditions=(), params=(), chunk_size=10000):
+    """
+    Yields `columns` of `table` in `keys` order, `chunk_size` rows per query.
+
+    Each query is its own short transaction that resumes after the last row
+    of the one before (`WHERE (keys) > (last row's keys)`), so an export of
+    any length holds no locks and no pooled connection between chunks and
+    never holds up partition maintenance. Only one chunk is in memory at a
+    time. `keys` must be among `columns` and unique together.
+    """
+    key_list = sql.SQL(", ").join(map(sql.Identifier, keys))
+    select = sql.SQL("SELECT {} FROM {}").format(
+        sql.SQL(", ").join(map(sql.Identifier, columns)), sql.Identifier(table)
+    )
+    positions = [columns.index(key) for key in keys]
+    last = None
+    while True:
+        where = [sql.SQL(condition) for condition in conditions]
+        args = list(params)
+        if last is not None:
+            where.append(sql.SQL("({}) > ({})").format(key_list, sql.SQL(", ").join(sql.Placeholder() * len(keys))))
+            args.extend(last)
+        query = select
+        if where:
+            query = sql.SQL("{} WHERE {}").format(query, sql.SQL(" AND ").join(where))
+        query = sql.SQL("{} ORDER BY {} LIMIT %s").format(query, key_list)
+
+        with pool.cursor() as cur:
+            cur.execute(query, args + [chunk_size])
+            rows = cur.fetchall()
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last = [rows[-1][position] for position in positions]
+
+
+def iter_chatlog(pool, since=None, until=None, user_id=None, chunk_size=10000):
+    """Streams `CHATLOG_COLUMNS` rows; a time range only reads the partitions it covers."""
+    conditions = []
+    params = []
+    if since is not None:
+        conditions.append("timestamp >= %s")
+        params.append(since)
+    if until is not None:
+        conditions.append("timestamp < %s")
+        params.append(until)
+    if user_id is not None:
+        conditions.append("user_id = %s")
+        params.append(user_id)
+
+    # Keyed to an index each way: (user_id, timestamp) for one user, the
+    # (entry_id, timestamp) primary key otherwise.
+    keys = ("timestamp", "entry_id") if user_id is not None else ("entry_id", "timestamp")
+    return iter_rows(pool, "chatlog", CHATLOG_COLUMNS, keys, conditions, params, chunk_size)
+
+
+def iter_profiles(pool, chunk_size=10000):
+    return iter_rows(pool, "user_profiles", PROFILE_COLUMNS, ("user_id",), chunk_size=chunk_size)
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (memoryview, bytes)):
+        # topic_vector: float32s, exported as a list of numbers.
+        return decode_vector(value).tolist()
+    return value
+
+
+def write_jsonl(rows, columns, path):
+    """Writes `rows` as gzip-compressed JSON lines, one object per row; returns the row count."""
+    count = 0
+    with gzip.open(path, "wt", compresslevel=6, encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps({column: _plain(value) for column, value in zip(columns, row)}))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def write_parquet(rows, columns, path, row_group_size=50000):
+    """
+    Writes `rows` to a Parquet file, one row group per `row_group_size` rows.
+
+    Only one row group is held in memory at a time. Needs pyarrow.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {
+        "entry_id": pa.int64(),
+        "user_id": pa.int64(),
+        "message": pa.string(),
+        "timestamp": pa.timestamp("us"),
+        "sentiment_count": pa.float64(),
+        "sentiment_sum": pa.float64(),
+        "sentiment_sumsq": pa.float64(),
+        "topic_counts": pa.string(),
+        "top_topic": pa.string(),
+        "topic_vector": pa.list_(pa.float32()),
+        "data": pa.string(),
+        "updated_at": pa.timestamp("us"),
+    }
+    # A fixed schema, so a row group that happens to be all NULL in a column still matches.
+    schema = pa.schema([(column, types.get(column, pa.string())) for column in columns])
+
+    count = 0
+    writer = None
+    batch = []
+    try:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= row_group_size:
+                writer = _write_row_group(pa, pq, writer, batch, schema, path)
+                count += len(batch)
+                batch = []
+        if batch or writer is None:
+            writer = _write_row_group(pa, pq, writer, batch, schema, path)
+            count += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def _write_row_group(pa, pq, writer, batch, schema, path):
+    data = {column: [] for column in schema.names}
+    for row in batch:
+        for column, value in zip(schema.names, row):
+            if isinstance(value, (dict, list)):
+                # JSONB columns have no fixed schema; keep them as JSON text.
+                value = json.dumps(value)
+            elif isinstance(value, (memoryview, bytes)):
+                value = decode_vector(value).tolist()
+            data[column].append(value)
+    if writer is None:
+        writer = pq.ParquetWriter(path, schema, compression="zstd")
+    writer.write_table(pa.table(data, schema=schema))
+    return writer
+
+
+def export(rows, columns, path):
+    """Writes `rows` to `path` as Parquet (.parquet) or gzipped JSON lines (anything else)."""
+    started = time.perf_counter()
+    if path.endswith(".parquet"):
+        count = write_parquet(rows, columns, path)
+    else:
+        count = write_jsonl(rows, columns, path)
+    elapsed = time.perf_counter() - started
+    print(f"Exported {count} rows to {path} in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} rows/s)")
+    return count
+
+
+if __name__ == "__main__":
+    # python chatlog_export.py <database> <user> <password> chatlog|profiles <path> [since] [until]
+    # e.g. ... chatlog chatlog-2023.jsonl.gz 2023-01-01 2024-01-01
+    database, user, password, table, path = sys.argv[1:6]
+    pool = DatabasePool(database, user, password, max_connections=2)
+    try:
+        if table == "profiles":
+            export(iter_profiles(pool), PROFILE_COLUMNS, path)
+        else:
+            since = datetime.fromisoformat(sys.argv[6]) if len(sys.argv) > 6 else None
+            until = datetime.fromisoformat(sys.argv[7]) if len(sys.argv) > 7 else None
+            export(iter_chatlog(pool, since, until), CHATLOG_COLUMNS, path)
+    finally:
+        pool.close()
@@ -0,0 +1,230 @@
+import threading
+from datetime import datetime, timedelta
+
+from psycopg2 import errors, sql
+
+PERIODS = ("day", "week", "month")
+
+
+def period_start(moment, period):
+    """The first instant of the day, ISO week or month containing `moment`."""
+    day = datetime(moment.year, moment.month, moment.day)
+    if period == "day":
+        return day
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def next_period(start, period):
+    if period == "day":
+        return start + timedelta(days=1)
+    if period == "week":
+        return start + timedelta(days=7)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+class ChatlogPartitions:
+    """
+    Keeps the chatlog table range-partitioned by timestamp.
+
+    A new database gets `chatlog` as a partitioned table with one partition
+    per `period`, a default partition for stray timestamps, and a
+    `(user_id, timestamp DESC)` index that includes the remaining columns, so
+    latest-N history lookups are index-only scans that touch a few pages per
+    partition. `rotate()` creates partitions `premake` periods ahead, and
+    `apply_retention()` drops whole partitions older than `retention`
+    periods, which costs nothing like a bulk DELETE. Both run from
+    `maintain()`, which `start()` calls periodically.
+
+    The DDL has to wait for readers of chatlog to finish, and every insert
+    queues behind DDL that is waiting. `maintain()` therefore runs each step
+    with `lock_timeout` set and retries it `lock_retries` times before
+    leaving it to the next run, so a long read holds up inserts for at most
+    `lock_timeout` seconds at a time.
+
+    A chatlog that is still a plain table (before its migration has run)
+    only gets the index; rotation and retention are skipped for it.
+
+    Attributes:
+        pool (DatabasePool): Pool maintenance borrows a connection from.
+        period (str): "day", "week" or "month".
+        premake (int): Future partitions kept ready ahead of time.
+        retention (int): Partitions kept, or None to keep everything.
+        lock_timeout (float): Seconds a maintenance step waits for its locks.
+        lock_retries (int): Attempts per step before it is skipped until the next run.
+    """
+
+    table = "chatlog"
+
+    def __init__(self, pool, period="month", premake=2, retention=None, lock_timeout=2, lock_retries=3):
+        if period not in PERIODS:
+            raise ValueError(f"period must be one of {PERIODS}")
+        self.pool = pool
+        self.period = period
+        self.premake = premake
+        self.retention = retention
+        self.lock_timeout = lock_timeout
+        self.lock_retries = lock_retries
+        self.partitioned = None
+
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def ensure_schema(self, cur):
+        if self._detect(cur) is None:
+            cur.execute("""
+                CREATE TABLE chatlog (
+                    entry_id BIGSERIAL,
+                    user_id INTEGER,
+                    message TEXT,
+                    timestamp TIMESTAMP NOT NULL DEFAULT NOW(),
+                    PRIMARY KEY (entry_id, timestamp)
+                ) PARTITION BY RANGE (timestamp)
+            """)
+            cur.execute("CREATE TABLE chatlog_default PARTITION OF chatlog DEFAULT")
+            self.partitioned = True
+
+        cur.execute("""
+            CREATE INDEX IF NOT EXISTS chatlog_user_id_timestamp_idx
+            ON chatlog (user_id, timestamp DESC) INCLUDE (entry_id, message)
+        """)
+        if self.partitioned:
+            self.rotate(cur)
+
+    def partitions(self, cur):
+        """Returns `(name, start)` for every period partition, oldest first."""
+        cur.execute("""
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = %s AND child.relname LIKE %s
+        """, (self.table, self.table + "\\_p%"))
+
+        partitions = []
+        for (name,) in cur.fetchall():
+            try:
+                start = datetime.strptime(name[len(self.table) + 2:], "%Y%m%d")
+            except ValueError:
+                continue
+            partitions.append((name, start))
+        return sorted(partitions, key=lambda partition: partition[1])
+
+    def rotate(self, cur, now=None):
+        start = period_start(now or datetime.now(), self.period)
+        existing = {name for name, _ in self.partitions(cur)}
+
+        for _ in range(self.premake + 1):
+            end = next_period(start, self.period)
+            name = f"{self.table}_p{start:%Y%m%d}"
+            if name not in existing:
+                self._create_partition(cur, name, start, end)
+            start = end
+
+    def cover(self, cur, oldest, now=None):
+        """Creates the partitions between `oldest` and now, e.g. before loading old rows."""
+        start = period_start(oldest, self.period)
+        current = period_start(now or datetime.now(), self.period)
+        existing = {name for name, _ in self.partitions(cur)}
+
+        while start < current:
+            end = next_period(start, self.period)
+            name = f"{self.table}_p{start:%Y%m%d}"
+            if name not in existing:
+                self._create_partition(cur, name, start, end)
+            start = end
+
+    def apply_retention(self, cur, now=None):
+        if self.retention is None:
+            return []
+        cutoff = period_start(now or datetime.now(), self.period)
+        for _ in range(self.retention - 1):
+            cutoff = self._previous_period(cutoff)
+
+        dropped = []
+        for name, start in self.partitions(cur):
+            if next_period(start, self.period) > cutoff:
+                break
+            cur.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(
+                sql.Identifier(self.table), sql.Identifier(name)
+            ))
+            cur.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+            dropped.append(name)
+        return dropped
+
+    def maintain(self):
+        with self.pool.cursor() as cur:
+            if self.partitioned is None:
+                self._detect(cur)
+        if not self.partitioned:
+            return
+        self._without_blocking(self.rotate)
+        dropped = self._without_blocking(self.apply_retention)
+        if dropped:
+            print(f"Dropped expired chatlog partitions: {', '.join(dropped)}")
+
+    def start(self, interval=3600):
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="chatlog-partitions", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, interval):
+        while not self._stopping.wait(interval):
+            try:
+                self.maintain()
+            except Exception as error:
+                print("Chatlog partition maintenance failed: ", error)
+
+    def _without_blocking(self, step):
+        """Runs `step(cur)` in its own transaction, giving up on locks after `lock_timeout`."""
+        for attempt in range(self.lock_retries):
+            try:
+                with self.pool.cursor() as cur:
+                    cur.execute("SET LOCAL lock_timeout = %s", (f"{int(self.lock_timeout * 1000)}ms",))
+                    return step(cur)
+            except errors.LockNotAvailable:
+                if self._stopping.wait(self.lock_timeout * (attempt + 1)):
+                    break
+        print(f"Chatlog partition maintenance: {step.__name__} skipped, chatlog is busy")
+        return None
+
+    def _detect(self, cur):
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (self.table,))
+        row = cur.fetchone()
+        self.partitioned = None if row is None else row[0] == "p"
+        return self.partitioned
+
+    def _create_partition(self, cur, name, start, end):
+        # Rows that already landed in the default partition for this range
+        # would make CREATE ... PARTITION OF fail, so build the partition as a
+        # plain table, move those rows into it, then attach it.
+        table = sql.Identifier(self.table)
+        partition = sql.Identifier(name)
+        cur.execute(sql.SQL("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)").format(
+            partition, table
+        ))
+        cur.execute(sql.SQL("""
+            WITH moved AS (
+                DELETE FROM chatlog_default WHERE timestamp >= %s AND timestamp < %s RETURNING *
+            )
+            INSERT INTO {} SELECT * FROM moved
+        """).format(partition), (start, end))
+        cur.execute(sql.SQL("ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s)").format(
+            table, partition
+        ), (start, end))
+
+    def _previous_period(self, start):
+        if self.period == "day":
+            return start - timedelta(days=1)
+        if self.period == "week":
+            return start - timedelta(days=7)
+        if start.month == 1:
+            return start.replace(year=start.year - 1, month=12)
+        return start.replace(month=start.month - 1)
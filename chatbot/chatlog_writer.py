@@ -0,0 +1,243 @@
+import atexit
+import csv
+import io
+import os
+import threading
+import time
+from datetime import datetime
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+
+class ChatlogWriter:
+    """
+    A write-behind buffer for chatlog entries.
+
+    Entries are queued in memory and written by a background thread with one
+    COPY (or one multi-row INSERT) and one commit per batch. A batch is flushed
+    once it holds `max_batch` rows or its oldest row is `max_delay` seconds old,
+    and everything still queued is flushed on `close()` or interpreter exit.
+
+    A batch the database rejects (e.g. a user id that is not a number) is
+    split in halves until the offending rows are isolated; those are saved
+    and dropped so they cannot hold up the rows behind them. While the
+    database is unreachable rows are retried, but at most `max_buffer` are
+    kept in memory; older ones are saved to disk instead. Rows that still
+    cannot be written on `close()` are saved too. Saved rows are CSV files
+    under `spill_dir`, ready to be loaded with psql's `\\copy`.
+
+    Attributes:
+        pool (DatabasePool): Pool the writer thread borrows a connection from per batch.
+        max_batch (int): Flush as soon as this many rows are queued.
+        max_delay (float): Flush rows that have waited this many seconds.
+        use_copy (bool): Use COPY instead of a multi-row INSERT.
+        max_buffer (int): Most rows kept in memory while writes are failing.
+        spill_dir (str): Where rejected, overflowing and unwritten rows are saved.
+        flushed_rows (int): Rows committed.
+        rejected_rows (int): Rows the database refused, saved and dropped.
+        overflow_rows (int): Rows moved out of memory because the buffer was full.
+    """
+
+    def __init__(self, pool, max_batch=500, max_delay=1.0, use_copy=True, max_buffer=100000, spill_dir=None):
+        self.pool = pool
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.use_copy = use_copy
+        self.max_buffer = max_buffer
+        self.spill_dir = spill_dir or os.path.join(os.path.expanduser("~"), ".chatbot", "chatlog-spill")
+        self.flushed_rows = 0
+        self.rejected_rows = 0
+        self.overflow_rows = 0
+
+        self._rows = []
+        self._first_at = None
+        self._in_flight = 0
+        self._flush_requested = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="chatlog-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def queue_depth(self):
+        """Rows accepted but not yet committed, including a batch being written."""
+        with self._cond:
+            return len(self._rows) + self._in_flight
+
+    def add(self, user_id, message, timestamp=None):
+        self.add_many([{"user_id": user_id, "message": message, "timestamp": timestamp}])
+
+    def add_many(self, messages):
+        """Queues scraped `{"user_id", "message"}` records, stamping them with the current time."""
+        now = datetime.now()
+        rows = [(m["user_id"], m["message"], m.get("timestamp") or now) for m in messages]
+        if not rows:
+            return
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("ChatlogWriter is closed")
+            if not self._rows:
+                self._first_at = time.monotonic()
+            self._rows.extend(rows)
+            overflow = self._take_overflow()
+            self._cond.notify_all()
+        if overflow:
+            self._save(overflow, "overflow")
+
+    def flush(self, timeout=30):
+        """
+        Waits up to `timeout` seconds for every queued row to be committed.
+
+        Returns False if rows are still unwritten, e.g. while the database is down.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            while (self._rows or self._in_flight) and self._thread.is_alive():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return not (self._rows or self._in_flight)
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        atexit.unregister(self.close)
+
+        if self._rows:
+            self._save(self._rows, "unwritten")
+
+    def _take_overflow(self):
+        # Called with the lock held; the oldest rows beyond max_buffer.
+        excess = len(self._rows) - self.max_buffer
+        if excess <= 0:
+            return []
+        overflow, self._rows = self._rows[:excess], self._rows[excess:]
+        self.overflow_rows += len(overflow)
+        return overflow
+
+    def _save(self, rows, reason):
+        try:
+            path = self._spill(rows, reason)
+        except OSError as error:
+            print(f"Could not save {len(rows)} {reason} chatlog entries, they are lost: ", error)
+            return
+        print(f"Saved {len(rows)} {reason} chatlog entries to {path}; load them with "
+              f"\\copy chatlog (user_id, message, timestamp) FROM '{path}' WITH (FORMAT csv)")
+
+    def _spill(self, rows, reason):
+        os.makedirs(self.spill_dir, mode=0o700, exist_ok=True)
+        name = f"chatlog-{reason}-{datetime.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}-{id(self)}.csv"
+        path = os.path.join(self.spill_dir, name)
+        # Chat messages, so readable by this user only.
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "w", newline="") as f:
+            csv.writer(f).writerows(rows)
+        return path
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                if self._rows and (self._closed or self._flush_requested):
+                    break
+                if self._closed:
+                    return None
+                if not self._rows:
+                    self._flush_requested = False
+                    self._cond.notify_all()
+                    self._cond.wait()
+                    continue
+                if len(self._rows) >= self.max_batch:
+                    break
+                age = time.monotonic() - self._first_at
+                if age >= self.max_delay:
+                    break
+                self._cond.wait(self.max_delay - age)
+
+            batch, self._rows = self._rows, []
+            self._in_flight = len(batch)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+
+            written, rejected, unwritten = self._write_isolating(batch)
+            if rejected:
+                self._save(rejected, "rejected")
+
+            with self._cond:
+                self._in_flight = 0
+                self.flushed_rows += written
+                self.rejected_rows += len(rejected)
+                overflow = []
+                if unwritten:
+                    self._rows[:0] = unwritten
+                    self._first_at = time.monotonic()
+                    overflow = self._take_overflow()
+                self._cond.notify_all()
+                stop = bool(unwritten) and self._closed
+
+            if overflow:
+                self._save(overflow, "overflow")
+            if stop:
+                return
+            if unwritten:
+                time.sleep(min(self.max_delay, 5))
+
+    def _write_isolating(self, batch):
+        """
+        Writes `batch`, splitting it to isolate rows the database rejects.
+
+        Returns `(written, rejected rows, unwritten rows)`; rows are left
+        unwritten when the database cannot be reached, so they are retried.
+        """
+        written = 0
+        rejected = []
+        parts = [batch]
+        while parts:
+            rows = parts.pop()
+            try:
+                self._write(rows)
+                written += len(rows)
+            except (psycopg2.DataError, psycopg2.IntegrityError, ValueError) as error:
+                if len(rows) == 1:
+                    print("Chatlog entry rejected: ", error)
+                    rejected.extend(rows)
+                else:
+                    middle = len(rows) // 2
+                    parts.append(rows[middle:])
+                    parts.append(rows[:middle])
+            except Exception as error:
+                print("Chatlog flush failed: ", error)
+                return written, rejected, rows + [row for part in reversed(parts) for row in part]
+        return written, rejected, []
+
+    def _write(self, batch):
+        with self.pool.cursor() as cur:
+            if self.use_copy:
+                buf = io.StringIO()
+                csv.writer(buf).writerows(batch)
+                buf.seek(0)
+                cur.copy_expert(
+                    "COPY chatlog (user_id, message, timestamp) FROM STDIN WITH (FORMAT csv)",
+                    buf
+                )
+            else:
+                execute_values(
+                    cur,
+                    "INSERT INTO chatlog (user_id, message, timestamp) VALUES %s",
+                    batch,
+                    page_size=len(batch)
+                )
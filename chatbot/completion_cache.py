@@ -0,0 +1,161 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from models import openai_api
+
+
+def normalize_prompt(prompt):
+    return " ".join(prompt.split())
+
+
+class CompletionCache:
+    """
+    A two-tier cache of completion texts keyed on engine, prompt and sampling parameters.
+
+    Prompts are whitespace-normalized before hashing, so templated prompts
+    that differ only in spacing share an entry. The in-memory tier is an LRU
+    of `maxsize` entries; the optional on-disk tier is a SQLite file holding
+    up to `disk_maxsize` entries and survives restarts. Entries older than
+    `ttl` seconds are treated as misses in both tiers.
+
+    Attributes:
+        hits (int): Lookups answered from memory.
+        disk_hits (int): Lookups answered from disk (and promoted to memory).
+        misses (int): Lookups answered by neither tier.
+        evictions (int): Entries dropped to stay within size limits.
+        expirations (int): Entries dropped because they outlived `ttl`.
+    """
+
+    def __init__(self, maxsize=1024, ttl=3600, disk_path=None, disk_maxsize=100000):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.disk_maxsize = disk_maxsize
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        self._disk_writes = 0
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, value TEXT, created REAL)"
+            )
+            self._disk.execute("CREATE INDEX IF NOT EXISTS completions_created ON completions (created)")
+            self._disk.commit()
+
+    @staticmethod
+    def make_key(engine, prompt, **params):
+        payload = json.dumps(
+            {"engine": engine, "prompt": normalize_prompt(prompt), "params": params},
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+                self.expirations += 1
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT value, created FROM completions WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, created = row
+                    if now - created <= self.ttl:
+                        self.disk_hits += 1
+                        self._remember(key, value, created)
+                        return value
+                    self._disk.execute("DELETE FROM completions WHERE key = ?", (key,))
+                    self._disk.commit()
+                    self.expirations += 1
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        created = time.time()
+
+        with self._lock:
+            self._remember(key, value, created)
+            if self._disk is not None:
+                self._disk.execute(
+                    "INSERT OR REPLACE INTO completions (key, value, created) VALUES (?, ?, ?)",
+                    (key, value, created)
+                )
+                self._disk_writes += 1
+                # Counting rows on every write is wasteful; trim periodically.
+                if self._disk_writes % 100 == 0:
+                    self._trim_disk(created)
+                self._disk.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "memory_entries": len(self._memory),
+            }
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
+
+    def _remember(self, key, value, created):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _trim_disk(self, now):
+        expired = self._disk.execute("DELETE FROM completions WHERE created < ?", (now - self.ttl,)).rowcount
+        self.expirations += expired
+
+        excess = self._disk.execute("SELECT COUNT(*) FROM completions").fetchone()[0] - self.disk_maxsize
+        if excess > 0:
+            self._disk.execute(
+                "DELETE FROM completions WHERE key IN "
+                "(SELECT key FROM completions ORDER BY created LIMIT ?)",
+                (excess,)
+            )
+            self.evictions += excess
+
+
+def cached_completion(cache, engine, prompt, temperature=0.7, max_tokens=100):
+    """Returns the completion text for `prompt`, calling OpenAI only on a cache miss."""
+    key = cache.make_key(engine, prompt, temperature=temperature, max_tokens=max_tokens)
+    text = cache.get(key)
+    if text is None:
+        response = openai_api().Completion.create(
+            engine=engine,
+            prompt=prompt,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+        text = response["choices"][0]["text"]
+        cache.set(key, text)
+    return text
@@ -0,0 +1,157 @@
+import threading
+from collections import OrderedDict, deque
+
+
+def estimate_tokens(text):
+    # The same 4-characters-per-token rule LLMClient budgets with.
+    return len(text) // 4 + 1
+
+
+class _History:
+    __slots__ = ("lines", "tokens")
+
+    def __init__(self):
+        self.lines = deque()
+        self.tokens = 0
+
+
+class ContextBuilder:
+    """
+    Builds completion prompts from a user's recent messages and profile within a token budget.
+
+    Each user's recent messages are loaded once with `load_history(user_id,
+    limit)` (newest first, as `Chatlog.get_chat_history` returns them) and
+    kept with their token counts. Later messages are appended in memory by
+    `observe()`, so building a prompt costs no query and no re-tokenizing.
+    Per user, at most `history_limit` messages and `budget` tokens are kept,
+    and at most `maxsize` users are cached (LRU).
+
+    A prompt always holds the current message and the instruction. Profile
+    facts (sentiment and up to `max_topics` topics) come next, then as many
+    of the most recent messages as still fit, so prompts never exceed
+    `budget` tokens unless the message alone does.
+
+    Attributes:
+        hits (int): Histories served from memory.
+        misses (int): Histories loaded through `load_history`.
+    """
+
+    def __init__(self, load_history=None, budget=512, history_limit=20, max_topics=5, maxsize=10000,
+                 count_tokens=estimate_tokens):
+        self.load_history = load_history
+        self.budget = budget
+        self.history_limit = history_limit
+        self.max_topics = max_topics
+        self.maxsize = maxsize
+        self.count_tokens = count_tokens
+        self.hits = 0
+        self.misses = 0
+
+        self._histories = OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, user_id, message):
+        """
+        Records a new message from `user_id`.
+
+        Call it before the message is queued for the chatlog, so a first
+        load does not pick it up as well.
+
+        Returns:
+            tuple: The `(line, tokens)` pairs that preceded it, oldest first.
+        """
+        key = str(user_id)
+        with self._lock:
+            history = self._histories.get(key)
+            if history is not None:
+                self.hits += 1
+        if history is None:
+            history = self._load(user_id)
+            with self._lock:
+                self.misses += 1
+                # Another thread may have loaded this user meanwhile; keep its copy.
+                history = self._histories.setdefault(key, history)
+                self._evict()
+
+        with self._lock:
+            self._histories.move_to_end(key)
+            previous = tuple(history.lines)
+            self._append(history, message)
+        return previous
+
+    def forget(self, user_id):
+        with self._lock:
+            self._histories.pop(str(user_id), None)
+
+    def build_prompt(self, context):
+        """
+        Assembles the prompt for `context`.
+
+        `context` holds "message", and optionally "sentiment", "topics" and
+        "history" (the pairs `observe()` returned).
+        """
+        budget = self.budget
+        ask = f"Their message is: {context['message']}. How should we respond?"
+        budget -= self.count_tokens(ask)
+
+        facts = []
+        sentiment = context.get("sentiment")
+        if sentiment is not None:
+            line = f"The user's sentiment is {sentiment:.2f}."
+            cost = self.count_tokens(line)
+            if cost <= budget:
+                facts.append(line)
+                budget -= cost
+
+        topics = list(context.get("topics") or [])[:self.max_topics]
+        while topics:
+            line = f"They are talking about {', '.join(topics)}."
+            cost = self.count_tokens(line)
+            if cost <= budget:
+                facts.append(line)
+                budget -= cost
+                break
+            topics.pop()
+
+        # Newest messages first until the budget runs out, then back in order.
+        recent = []
+        history = context.get("history") or ()
+        header = "Their recent messages:"
+        if history:
+            budget -= self.count_tokens(header)
+        for line, tokens in reversed(history):
+            if tokens > budget:
+                break
+            recent.append(line)
+            budget -= tokens
+
+        parts = facts
+        if recent:
+            parts.append(header)
+            parts.extend(reversed(recent))
+        parts.append(ask)
+        return "\n".join(parts)
+
+    def stats(self):
+        with self._lock:
+            return {"users": len(self._histories), "hits": self.hits, "misses": self.misses}
+
+    def _load(self, user_id):
+        history = _History()
+        if self.load_history is None:
+            return history
+        rows = self.load_history(user_id, self.history_limit)
+        for row in reversed(rows):
+            self._append(history, row[2])
+        return history
+
+    def _append(self, history, message):
+        line = f"- {message}"
+        history.lines.append((line, self.count_tokens(line)))
+        history.tokens += history.lines[-1][1]
+        while len(history.lines) > self.history_limit or history.tokens > self.budget:
+            history.tokens -= history.lines.popleft()[1]
+
+    def _evict(self):
+        while len(self._histories) > self.maxsize:
+            self._histories.popitem(last=False)
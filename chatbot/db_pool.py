@@ -0,0 +1,127 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class DatabasePool:
+    """
+    A thread-safe pool of Postgres connections shared by every Chatlog method.
+
+    Callers borrow a connection (or a cursor on one) for the duration of a
+    `with` block, so each thread works on its own connection and many rooms
+    or users can be handled in parallel without reconnecting. Borrowing blocks
+    while all `max_connections` are in use instead of failing outright.
+
+    Attributes:
+        min_connections (int): Connections opened up front and kept open.
+        max_connections (int): Upper bound on open connections.
+        health_check_interval (float): Connections idle for longer than this
+            many seconds are pinged before being handed out.
+        acquire_timeout (float): Seconds to wait for a free connection.
+    """
+
+    def __init__(self, database_name, database_user, database_password, host="localhost", port=5432,
+                 min_connections=1, max_connections=10, health_check_interval=30, acquire_timeout=30):
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+
+        self._pool = ThreadedConnectionPool(
+            min_connections,
+            max_connections,
+            host=host,
+            port=port,
+            database=database_name,
+            user=database_user,
+            password=database_password
+        )
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._returned_at = {}
+        self._lock = threading.Lock()
+        self.borrowed = 0
+        self.replaced = 0
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection, committing on success and rolling back on error."""
+        conn = self._acquire()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self._release(conn)
+
+    @contextmanager
+    def cursor(self, name=None):
+        with self.connection() as conn:
+            with conn.cursor(name=name) as cur:
+                yield cur
+
+    def stats(self):
+        with self._lock:
+            return {
+                "borrowed": self.borrowed,
+                "replaced": self.replaced,
+                "min_connections": self.min_connections,
+                "max_connections": self.max_connections,
+            }
+
+    def close(self):
+        self._pool.closeall()
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise PoolTimeout(f"No database connection free after {self.acquire_timeout}s")
+
+        try:
+            conn = self._pool.getconn()
+            if not self._is_healthy(conn):
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+                with self._lock:
+                    self.replaced += 1
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self.borrowed += 1
+        return conn
+
+    def _release(self, conn):
+        with self._lock:
+            self.borrowed -= 1
+            self._returned_at[id(conn)] = time.monotonic()
+        try:
+            self._pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            self._slots.release()
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+
+        with self._lock:
+            returned_at = self._returned_at.get(id(conn))
+        if returned_at is not None and time.monotonic() - returned_at < self.health_check_interval:
+            return True
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
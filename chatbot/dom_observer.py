@@ -0,0 +1,195 @@
+# Installs a MutationObserver that queues every chat node added to the page.
+# Nodes are described when drained rather than when added, because rooms often
+# insert an empty node and fill in its text a moment later; a node still
+# without text is left queued until it has some or is `settle` ms old.
+INSTALL_SCRIPT = """
+if (window.__chatObserver) {
+    return false;
+}
+const selector = arguments[0];
+const limit = arguments[1];
+window.__chatBuffer = [];
+window.__chatDropped = 0;
+window.__chatWaiter = null;
+
+function push(node) {
+    if (window.__chatBuffer.length >= limit) {
+        window.__chatBuffer.shift();
+        window.__chatDropped++;
+    }
+    window.__chatBuffer.push({node: node, at: performance.now()});
+}
+
+window.__chatObserver = new MutationObserver(function (mutations) {
+    for (const mutation of mutations) {
+        for (const node of mutation.addedNodes) {
+            if (node.nodeType !== Node.ELEMENT_NODE) {
+                continue;
+            }
+            if (node.matches(selector)) {
+                push(node);
+            } else {
+                node.querySelectorAll(selector).forEach(push);
+            }
+        }
+    }
+    if (window.__chatWaiter && window.__chatBuffer.length) {
+        window.__chatWaiter();
+    }
+});
+window.__chatObserver.observe(document.body, {childList: true, subtree: true});
+return true;
+"""
+
+DRAIN_FUNCTION = """
+function drain(userAttribute, idAttribute, settle) {
+    if (!window.__chatObserver) {
+        return null;
+    }
+    const now = performance.now();
+    const nodes = [];
+    const unfilled = [];
+    for (const entry of window.__chatBuffer) {
+        if (entry.node.textContent.trim() || now - entry.at >= settle) {
+            nodes.push(entry.node);
+        } else {
+            unfilled.push(entry);
+        }
+    }
+    const dropped = window.__chatDropped;
+    window.__chatBuffer = unfilled;
+    window.__chatDropped = 0;
+    return {
+        dropped: dropped,
+        items: nodes.map(function (node) {
+            return {
+                id: idAttribute ? node.getAttribute(idAttribute) : null,
+                user_id: node.getAttribute(userAttribute),
+                text: node.innerText,
+            };
+        }),
+    };
+}
+"""
+
+DRAIN_SCRIPT = DRAIN_FUNCTION + """
+return drain(arguments[0], arguments[1], arguments[2]);
+"""
+
+# Resolves once a queued node has its text (or has settled), or after the
+# timeout. The observer fires in the same task that inserted the node, so
+# the check is deferred with setTimeout to let the page's own zero-delay
+# fill-in run first; nodes still empty are checked again every 50 ms.
+WAIT_SCRIPT = DRAIN_FUNCTION + """
+const userAttribute = arguments[0];
+const idAttribute = arguments[1];
+const settle = arguments[2];
+const timeout = arguments[3];
+const done = arguments[arguments.length - 1];
+
+if (!window.__chatObserver) {
+    done(null);
+    return;
+}
+let check = null;
+function finish(result) {
+    clearTimeout(timer);
+    clearTimeout(check);
+    window.__chatWaiter = null;
+    done(result);
+}
+function schedule(delay) {
+    if (check === null) {
+        check = setTimeout(function () {
+            check = null;
+            const result = drain(userAttribute, idAttribute, settle);
+            if (result.items.length || result.dropped) {
+                finish(result);
+            } else if (window.__chatBuffer.length) {
+                schedule(50);
+            }
+        }, delay);
+    }
+}
+const timer = setTimeout(function () {
+    finish(drain(userAttribute, idAttribute, settle));
+}, timeout);
+window.__chatWaiter = function () {
+    schedule(0);
+};
+if (window.__chatBuffer.length) {
+    schedule(0);
+}
+"""
+
+
+class ChatObserver:
+    """
+    Collects new chat messages in the browser and drains them in one call.
+
+    A MutationObserver injected with `execute_script` buffers chat nodes as
+    the room adds them, so detecting new messages no longer needs repeated
+    `find_elements` queries over the whole DOM. `drain()` returns whatever
+    has been buffered; `wait()` blocks inside the browser until a message
+    arrives or `timeout` passes, which gives push-like latency from a single
+    WebDriver call. If the page navigates away the observer is reinstalled
+    on the next call.
+
+    A node the room inserts empty and fills in later is only returned once
+    it has text, or after `settle` seconds (when it is returned as it is).
+
+    Attributes:
+        max_buffer (int): Nodes kept in the page between drains; older ones
+            are dropped (and counted in `dropped`) if Python falls behind.
+        dropped (int): Nodes dropped because the buffer was full.
+    """
+
+    def __init__(self, driver, selector=".chat-message", user_attribute="data-user-id",
+                 id_attribute="data-message-id", max_buffer=10000, settle=1.0):
+        self.driver = driver
+        self.selector = selector
+        self.user_attribute = user_attribute
+        self.id_attribute = id_attribute
+        self.max_buffer = max_buffer
+        self.settle = settle
+        self.dropped = 0
+        self.installs = 0
+
+    def install(self):
+        if self.driver.execute_script(INSTALL_SCRIPT, self.selector, self.max_buffer):
+            self.installs += 1
+
+    def drain(self):
+        result = self.driver.execute_script(
+            DRAIN_SCRIPT,
+            self.user_attribute,
+            self.id_attribute,
+            int(self.settle * 1000)
+        )
+        return self._records(result)
+
+    def wait(self, timeout=5):
+        # The async script needs a script timeout longer than its own.
+        self.driver.set_script_timeout(timeout + 5)
+        result = self.driver.execute_async_script(
+            WAIT_SCRIPT,
+            self.user_attribute,
+            self.id_attribute,
+            int(self.settle * 1000),
+            int(timeout * 1000)
+        )
+        return self._records(result)
+
+    def _records(self, result):
+        if result is None:
+            self.install()
+            return []
+
+        self.dropped += result["dropped"]
+        records = []
+        for item in result["items"]:
+            record = {"user_id": item["user_id"], "message": item["text"]}
+            if item["id"]:
+                record["message_id"] = item["id"]
+            records.append(record)
+        return records
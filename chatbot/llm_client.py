@@ -0,0 +1,220 @@
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+
+from completion_cache import CompletionCache
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    pass
+
+
+class RateLimiter:
+    """A token bucket refilled continuously at `per_minute` units per minute."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return
+                wait = (amount - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class LLMClient:
+    """
+    A thread-safe completion client shared by every bot in the process.
+
+    Up to `max_concurrency` requests run at once, within a requests-per-minute
+    and an estimated tokens-per-minute budget. Identical requests that are
+    already in flight share one HTTP call, and answers are served from
+    `cache` when one is given. Each attempt has a `timeout`; timeouts,
+    connection errors, 429s and 5xxs are retried up to `max_retries` times
+    with full-jitter exponential backoff (honouring Retry-After).
+
+    `api_base` defaults to $OPENAI_API_BASE, so the client can be pointed at
+    a local stub server that implements POST /completions (see llm_stub.py).
+
+    Attributes:
+        requests (int): HTTP attempts made.
+        retries (int): Attempts that were retries.
+        coalesced (int): Calls that joined an identical in-flight request.
+        failures (int): Calls that failed after all retries.
+    """
+
+    def __init__(self, api_key=None, api_base=None, max_concurrency=8, requests_per_minute=3000,
+                 tokens_per_minute=250000, timeout=30, max_retries=4, backoff=0.5, max_backoff=20, cache=None):
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
+        self.api_base = (api_base or os.environ.get("OPENAI_API_BASE", "https://api.openai.com/v1")).rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.cache = cache
+        self.requests = 0
+        self.retries = 0
+        self.coalesced = 0
+        self.failures = 0
+
+        self._request_budget = RateLimiter(requests_per_minute)
+        self._token_budget = RateLimiter(tokens_per_minute)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm")
+        self._session = requests.Session()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def complete(self, engine, prompt, temperature=0.7, max_tokens=100):
+        return self.submit(engine, prompt, temperature=temperature, max_tokens=max_tokens).result()
+
+    def submit(self, engine, prompt, temperature=0.7, max_tokens=100):
+        """Returns a future for the completion text, sharing it with identical in-flight calls."""
+        params = {"temperature": temperature, "max_tokens": max_tokens}
+        key = CompletionCache.make_key(engine, prompt, **params)
+
+        if self.cache is not None:
+            text = self.cache.get(key)
+            if text is not None:
+                future = Future()
+                future.set_result(text)
+                return future
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future
+            future = self._executor.submit(self._complete, key, engine, prompt, params)
+            self._in_flight[key] = future
+
+        future.add_done_callback(lambda done: self._forget(key))
+        return future
+
+    def stream(self, engine, prompt, temperature=0.7, max_tokens=100):
+        """
+        Yields completion text as the backend produces it.
+
+        Streams are not coalesced, and retries only happen before the first
+        token arrives. The full text is cached once the stream finishes, and a
+        cached answer is yielded in one piece.
+        """
+        params = {"temperature": temperature, "max_tokens": max_tokens}
+        key = CompletionCache.make_key(engine, prompt, **params)
+
+        if self.cache is not None:
+            text = self.cache.get(key)
+            if text is not None:
+                yield text
+                return
+
+        payload = {"model": engine, "prompt": prompt, "stream": True, **params}
+        parts = []
+        with self._post("/completions", payload, max_tokens, stream=True) as response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                text = json.loads(data)["choices"][0]["text"]
+                if text:
+                    parts.append(text)
+                    yield text
+
+        if self.cache is not None:
+            self.cache.set(key, "".join(parts))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "coalesced": self.coalesced,
+                "failures": self.failures,
+                "in_flight": len(self._in_flight),
+            }
+
+    def close(self):
+        self._executor.shutdown()
+        self._session.close()
+
+    def _forget(self, key):
+        with self._lock:
+            self._in_flight.pop(key, None)
+
+    def _complete(self, key, engine, prompt, params):
+        payload = {"model": engine, "prompt": prompt, **params}
+        with self._post("/completions", payload, params["max_tokens"]) as response:
+            text = response.json()["choices"][0]["text"]
+        if self.cache is not None:
+            self.cache.set(key, text)
+        return text
+
+    def _post(self, path, payload, max_tokens, stream=False):
+        # A rough 4-characters-per-token estimate is enough for budgeting.
+        estimated_tokens = len(payload["prompt"]) // 4 + max_tokens
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+
+        for attempt in range(self.max_retries + 1):
+            self._request_budget.acquire()
+            self._token_budget.acquire(estimated_tokens)
+            with self._lock:
+                self.requests += 1
+                if attempt:
+                    self.retries += 1
+
+            retry_after = None
+            try:
+                response = self._session.post(
+                    self.api_base + path,
+                    json=payload,
+                    headers=headers,
+                    timeout=self.timeout,
+                    stream=stream
+                )
+                if response.status_code < 400:
+                    return response
+                # Closed so a streamed error response hands its connection back to the pool.
+                with response:
+                    if response.status_code not in RETRYABLE_STATUS:
+                        raise LLMError(f"Completion request failed with {response.status_code}: {response.text[:200]}")
+                    retry_after = response.headers.get("Retry-After")
+                error = LLMError(f"Completion request failed with {response.status_code}")
+            except (requests.Timeout, requests.ConnectionError) as exc:
+                error = exc
+            except LLMError:
+                with self._lock:
+                    self.failures += 1
+                raise
+
+            if attempt == self.max_retries:
+                break
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            if retry_after:
+                try:
+                    delay = max(delay, float(retry_after))
+                except ValueError:
+                    pass
+            time.sleep(delay)
+
+        with self._lock:
+            self.failures += 1
+        raise LLMError(f"Completion request failed after {self.max_retries + 1} attempts") from error
@@ -0,0 +1,110 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubServer:
+    """
+    A local stand-in for the completions API, for testing LLMClient.
+
+    POST /v1/completions answers "echo: <prompt>" after `latency` seconds,
+    as one JSON body or, with `"stream": true`, as server-sent events with
+    one word per event. `fail_next()` queues error responses (e.g. 429 with
+    a Retry-After header) for the next requests. Every request's payload is
+    kept in `requests`, with the time it arrived in `arrivals`.
+
+    Point a bot at it with OPENAI_API_BASE=<url>.
+    """
+
+    def __init__(self, port=0, latency=0):
+        self.latency = latency
+        self.requests = []
+        self.arrivals = []
+        self._failures = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="llm-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def fail_next(self, status, retry_after=None, times=1):
+        with self._lock:
+            self._failures.extend([(status, retry_after)] * times)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                with stub._lock:
+                    stub.requests.append(payload)
+                    stub.arrivals.append(time.monotonic())
+                    failure = stub._failures.pop(0) if stub._failures else None
+
+                if self.path != "/v1/completions":
+                    return self._send(404, {"error": "not found"})
+                if failure is not None:
+                    status, retry_after = failure
+                    headers = {"Retry-After": str(retry_after)} if retry_after is not None else {}
+                    return self._send(status, {"error": "stub failure"}, headers)
+
+                if stub.latency:
+                    time.sleep(stub.latency)
+                text = f"echo: {payload['prompt']}"
+                if payload.get("stream"):
+                    return self._stream(text)
+                self._send(200, {"choices": [{"text": text}]})
+
+            def _send(self, status, body, headers=None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, text):
+                words = text.split(" ")
+                events = [{"choices": [{"text": word if i == 0 else " " + word}]} for i, word in enumerate(words)]
+                body = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+                data = body.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    # python llm_stub.py [port] [latency]
+    import sys
+
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+    server = StubServer(port, latency).start()
+    print(f"Serving completions on {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.close()
@@ -0,0 +1,403 @@
+import threading
+import time
+
+from psycopg2 import errors
+from psycopg2.extras import Json, execute_values
+
+from profile_store import ProfileStore, TopKCounter
+from topic_store import TopicModelStore
+from topic_vectors import encode_vector, hash_topics
+
+# Arbitrary key for pg_advisory_xact_lock, so only one bot migrates at a time.
+MIGRATION_LOCK = 7302184
+
+
+class Migration:
+    """
+    One numbered schema change.
+
+    `apply(cur)` runs inside the migration transaction and must be safe to
+    run against a database that already has the change (IF NOT EXISTS and
+    friends), since databases created before the version table existed
+    start from version 0.
+
+    `backfill(cur, position, batch_size)`, if given, migrates existing data
+    online after the schema change has committed. It handles one batch per
+    call and returns `(rows, position)`; `position` is saved with the batch,
+    so an interrupted backfill resumes where it stopped. It is done once it
+    returns 0 rows, after which `finish(cur)` runs if given.
+    """
+
+    def __init__(self, version, name, apply=None, backfill=None, finish=None):
+        self.version = version
+        self.name = name
+        self.apply = apply
+        self.backfill = backfill
+        self.finish = finish
+
+
+class Migrator:
+    """
+    Applies numbered migrations and records them in `schema_migrations`.
+
+    Startup costs one query when the schema is current: the version table
+    is read and nothing else, with no catalog introspection. Pending
+    migrations are applied in order in one transaction under an advisory
+    lock, so bots starting together do not race. Backfills then run in
+    batches of `batch_size` rows, each in its own short transaction with
+    `batch_pause` seconds between them, either inline (`migrate()`) or on a
+    background thread (`start_backfills()`).
+    """
+
+    table = "schema_migrations"
+
+    def __init__(self, pool, migrations, batch_size=1000, batch_pause=0.05):
+        self.pool = pool
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.latest = self.migrations[-1].version if self.migrations else 0
+        self.backfills_pending = False
+
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def status(self):
+        """Returns `(version, backfills_pending)` with a single query."""
+        try:
+            with self.pool.cursor() as cur:
+                cur.execute(
+                    "SELECT COALESCE(MAX(version), 0), COALESCE(BOOL_OR(NOT backfilled), FALSE) "
+                    "FROM schema_migrations"
+                )
+                return cur.fetchone()
+        except errors.UndefinedTable:
+            return 0, False
+
+    def migrate(self, backfill=True):
+        """Brings the schema up to date. Returns True if anything was applied."""
+        version, pending = self.status()
+        applied = False
+        if version < self.latest:
+            applied = self._apply_pending()
+            pending = True
+        self.backfills_pending = bool(pending)
+        if pending and backfill:
+            self.run_backfills()
+        return applied
+
+    def start_backfills(self):
+        if not self.backfills_pending:
+            return
+        self._thread = threading.Thread(target=self._run_backfills_safely, name="migration-backfill", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run_backfills(self):
+        for migration in self.migrations:
+            if migration.backfill is None:
+                continue
+            while not self._stopping.is_set():
+                if self._backfill_batch(migration):
+                    break
+                if self.batch_pause:
+                    time.sleep(self.batch_pause)
+        self.backfills_pending = self._stopping.is_set()
+
+    def _apply_pending(self):
+        with self.pool.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK,))
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    applied_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                    backfilled BOOLEAN NOT NULL DEFAULT TRUE,
+                    backfill_position JSONB
+                )
+            """)
+            # Another bot may have migrated while we waited for the lock.
+            cur.execute("SELECT version FROM schema_migrations")
+            done = {row[0] for row in cur.fetchall()}
+
+            applied = False
+            for migration in self.migrations:
+                if migration.version in done:
+                    continue
+                print(f"Applying migration {migration.version}: {migration.name}")
+                if migration.apply is not None:
+                    migration.apply(cur)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, name, backfilled) VALUES (%s, %s, %s)",
+                    (migration.version, migration.name, migration.backfill is None)
+                )
+                applied = True
+            return applied
+
+    def _backfill_batch(self, migration):
+        """Runs one batch; returns True once the backfill is complete."""
+        with self.pool.cursor() as cur:
+            # The row lock keeps two bots from running the same batch.
+            cur.execute(
+                "SELECT backfilled, backfill_position FROM schema_migrations WHERE version = %s FOR UPDATE",
+                (migration.version,)
+            )
+            row = cur.fetchone()
+            if row is None or row[0]:
+                return True
+
+            rows, position = migration.backfill(cur, row[1], self.batch_size)
+            if rows:
+                cur.execute(
+                    "UPDATE schema_migrations SET backfill_position = %s WHERE version = %s",
+                    (Json(position), migration.version)
+                )
+                return False
+
+            if migration.finish is not None:
+                migration.finish(cur)
+            cur.execute("UPDATE schema_migrations SET backfilled = TRUE WHERE version = %s", (migration.version,))
+            print(f"Backfill for migration {migration.version} complete")
+            return True
+
+    def _run_backfills_safely(self):
+        try:
+            self.run_backfills()
+        except Exception as error:
+            print("Migration backfill failed: ", error)
+
+
+def _create_user_profiles(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS user_profiles (
+            user_id SERIAL PRIMARY KEY,
+            sentiments TEXT,
+            topics TEXT,
+            data JSONB
+        )
+    """)
+
+
+def _create_reanalysis_checkpoints(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS reanalysis_checkpoints (
+            job TEXT PRIMARY KEY,
+            position BIGINT NOT NULL DEFAULT 0,
+            until_id BIGINT NOT NULL DEFAULT 0,
+            processed BIGINT NOT NULL DEFAULT 0,
+            started_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            finished_at TIMESTAMP
+        )
+    """)
+
+
+def _backfill_profile_aggregates(topic_capacity):
+    # Folds the legacy comma-separated sentiments/topics columns into the
+    # aggregate columns, walking user_profiles in user_id order.
+    def backfill(cur, position, batch_size):
+        cur.execute(
+            """
+            SELECT user_id FROM user_profiles
+            WHERE user_id > %s AND (sentiments <> '' OR topics <> '')
+            ORDER BY user_id LIMIT %s
+            """,
+            (position or 0, batch_size)
+        )
+        ids = [row[0] for row in cur.fetchall()]
+        if not ids:
+            return 0, position
+
+        # Live bots update these rows too. Locking them means a concurrent
+        # update_many waits for this batch instead of having its counts
+        # overwritten; rows it holds are skipped rather than waited on (so
+        # the two cannot deadlock), and the batch stops before the first
+        # one, which is picked up again next time.
+        cur.execute(
+            """
+            SELECT user_id, sentiments, topics, topic_counts FROM user_profiles
+            WHERE user_id = ANY(%s)
+            ORDER BY user_id FOR UPDATE SKIP LOCKED
+            """,
+            (ids,)
+        )
+        rows = []
+        for user_id, row in zip(ids, cur.fetchall()):
+            if row[0] != user_id:
+                break
+            rows.append(row)
+        if not rows:
+            # The next row is busy; try again after the batch pause.
+            return len(ids), position
+
+        updates = []
+        for user_id, sentiments, topics, topic_counts in rows:
+            scores = []
+            for value in (sentiments or "").split(","):
+                try:
+                    scores.append(float(value))
+                except ValueError:
+                    pass
+            counter = TopKCounter(topic_capacity, topic_counts)
+            for topic in (topics or "").split(","):
+                if topic:
+                    counter.add(topic)
+            updates.append((
+                user_id,
+                len(scores),
+                sum(scores),
+                sum(score * score for score in scores),
+                Json(counter.counts),
+            ))
+
+        execute_values(
+            cur,
+            """
+            UPDATE user_profiles SET
+                sentiment_count = user_profiles.sentiment_count + v.count,
+                sentiment_sum = user_profiles.sentiment_sum + v.total,
+                sentiment_sumsq = user_profiles.sentiment_sumsq + v.total_sq,
+                topic_counts = v.topic_counts
+            FROM (VALUES %s) AS v (user_id, count, total, total_sq, topic_counts)
+            WHERE user_profiles.user_id = v.user_id
+            """,
+            updates,
+            template="(%s, %s::bigint, %s::double precision, %s::double precision, %s::jsonb)"
+        )
+        return len(rows), rows[-1][0]
+    return backfill
+
+
+def _backfill_top_topics(cur, position, batch_size):
+    cur.execute(
+        """
+        WITH batch AS (
+            SELECT user_id FROM user_profiles WHERE user_id > %s ORDER BY user_id LIMIT %s
+        )
+        UPDATE user_profiles SET top_topic = (
+            SELECT key FROM jsonb_each_text(user_profiles.topic_counts)
+            ORDER BY value::double precision DESC LIMIT 1
+        )
+        FROM batch WHERE user_profiles.user_id = batch.user_id
+        RETURNING user_profiles.user_id
+        """,
+        (position or 0, batch_size)
+    )
+    ids = [row[0] for row in cur.fetchall()]
+    return len(ids), max(ids) if ids else position
+
+
+def _backfill_topic_vectors(cur, position, batch_size):
+    cur.execute(
+        """
+        SELECT user_id, topic_counts FROM user_profiles
+        WHERE user_id > %s AND topic_vector IS NULL AND topic_counts <> '{}'
+        ORDER BY user_id LIMIT %s
+        """,
+        (position or 0, batch_size)
+    )
+    rows = cur.fetchall()
+    if not rows:
+        return 0, position
+
+    execute_values(
+        cur,
+        """
+        UPDATE user_profiles SET topic_vector = v.topic_vector
+        FROM (VALUES %s) AS v (user_id, topic_vector)
+        WHERE user_profiles.user_id = v.user_id
+        -- A live update_many may have set a fresher vector since the SELECT.
+        AND user_profiles.topic_vector IS NULL
+        """,
+        [(user_id, encode_vector(hash_topics(topic_counts))) for user_id, topic_counts in rows],
+        template="(%s, %s::bytea)"
+    )
+    return len(rows), rows[-1][0]
+
+
+def _partition_chatlog(partitions):
+    def apply(cur):
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('chatlog')")
+        row = cur.fetchone()
+        if row is not None and row[0] == "r":
+            # Keep the old table's rows where they are; the backfill moves them.
+            cur.execute("ALTER TABLE chatlog RENAME TO chatlog_legacy")
+            cur.execute("ALTER TABLE chatlog_legacy RENAME CONSTRAINT chatlog_pkey TO chatlog_legacy_pkey")
+            cur.execute(
+                "ALTER INDEX IF EXISTS chatlog_user_id_timestamp_idx RENAME TO chatlog_legacy_user_id_timestamp_idx"
+            )
+        partitions.ensure_schema(cur)
+
+        cur.execute("SELECT to_regclass('chatlog_legacy') IS NOT NULL")
+        if cur.fetchone()[0]:
+            cur.execute("SELECT MIN(timestamp), MAX(entry_id) FROM chatlog_legacy")
+            oldest, last_id = cur.fetchone()
+            if oldest is not None:
+                partitions.cover(cur, oldest)
+            cur.execute(
+                "SELECT setval(pg_get_serial_sequence('chatlog', 'entry_id'), %s)",
+                (max(last_id or 0, 1),)
+            )
+
+    def backfill(cur, position, batch_size):
+        cur.execute("SELECT to_regclass('chatlog_legacy') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return 0, position
+        cur.execute(
+            """
+            WITH batch AS (
+                DELETE FROM chatlog_legacy WHERE entry_id IN (
+                    SELECT entry_id FROM chatlog_legacy ORDER BY entry_id LIMIT %s
+                )
+                RETURNING entry_id, user_id, message, timestamp
+            )
+            INSERT INTO chatlog (entry_id, user_id, message, timestamp)
+            SELECT entry_id, user_id, message, COALESCE(timestamp, NOW()) FROM batch
+            """,
+            (batch_size,)
+        )
+        return cur.rowcount, None
+
+    def finish(cur):
+        cur.execute("DROP TABLE IF EXISTS chatlog_legacy")
+
+    return apply, backfill, finish
+
+
+def chatlog_migrations(partitions, topic_capacity=20):
+    """The chat bots' schema history, oldest first. Append new migrations; never renumber."""
+    apply_partitioning, move_legacy_rows, drop_legacy = _partition_chatlog(partitions)
+    return [
+        Migration(1, "create user_profiles", _create_user_profiles),
+        Migration(
+            2,
+            "aggregate profile sentiments and topics",
+            ProfileStore.ensure_schema,
+            backfill=_backfill_profile_aggregates(topic_capacity)
+        ),
+        Migration(
+            3,
+            "partition chatlog by timestamp",
+            apply_partitioning,
+            backfill=move_legacy_rows,
+            finish=drop_legacy
+        ),
+        Migration(
+            4,
+            "decay profile aggregates and store the top topic",
+            ProfileStore.ensure_decay_schema,
+            backfill=_backfill_top_topics
+        ),
+        Migration(
+            5,
+            "store a fixed-width topic vector per profile",
+            ProfileStore.ensure_vector_schema,
+            backfill=_backfill_topic_vectors
+        ),
+        Migration(6, "track chatlog re-analysis checkpoints", _create_reanalysis_checkpoints),
+        Migration(7, "save room topic models", TopicModelStore.ensure_schema),
+    ]
@@ -0,0 +1,30 @@
+import os
+import threading
+
+# spaCy, NLTK and openai each take a noticeable fraction of a second (or
+# several) to import, and a spaCy pipeline far longer to load, so the CLIs
+# import and load them here on first use instead of at startup.
+
+_models = {}
+_lock = threading.Lock()
+
+
+def spacy_model(model_name="en_core_web_sm", disable=()):
+    """Returns the process-wide spaCy pipeline for `model_name`, loading it on the first call."""
+    key = (model_name, tuple(disable))
+    nlp = _models.get(key)
+    if nlp is None:
+        with _lock:
+            nlp = _models.get(key)
+            if nlp is None:
+                import spacy
+                nlp = _models[key] = spacy.load(model_name, disable=list(disable))
+    return nlp
+
+
+def openai_api():
+    """Imports openai on first use, configured with $OPENAI_API_KEY."""
+    import openai
+    if openai.api_key is None:
+        openai.api_key = os.environ["OPENAI_API_KEY"]
+    return openai
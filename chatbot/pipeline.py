@@ -0,0 +1,208 @@
+import asyncio
+import inspect
+import time
+from collections import deque
+
+
+class StageStats:
+    """Latency counters for one pipeline stage, in seconds."""
+
+    def __init__(self, name, sample_size=1024):
+        self.name = name
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.wait_total = 0.0
+        self._samples = deque(maxlen=sample_size)
+
+    def record(self, seconds, waited):
+        self.count += 1
+        self.total += seconds
+        self.wait_total += waited
+        self.max = max(self.max, seconds)
+        self._samples.append(seconds)
+
+    def snapshot(self):
+        samples = sorted(self._samples)
+
+        def percentile(p):
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "max": self.max,
+            "mean_wait": self.wait_total / self.count if self.count else 0.0,
+        }
+
+
+class _Item:
+    __slots__ = ("record", "created_at", "queued_at")
+
+    def __init__(self, record):
+        self.record = record
+        self.created_at = time.monotonic()
+        self.queued_at = self.created_at
+
+
+class MessagePipeline:
+    """
+    An asyncio pipeline that moves chat messages through ordered stages.
+
+    `ingest` is either an async iterable of message records or a blocking
+    callable returning a list of records, which is polled every
+    `poll_interval` seconds on a worker thread. Each stage is a `(name, func)`
+    pair; `func` takes a record and returns it (or None to drop it), and
+    blocking functions run in the default executor so a slow stage such as an
+    LLM call overlaps with ingest and the other stages.
+
+    Stages are connected by bounded queues, so when a stage falls behind the
+    stages before it block instead of buffering without limit.
+
+    A stage listed in `batch_sizes` receives a list of up to that many
+    records (whatever is already queued, never waiting to fill the batch) and
+    returns a list of the same length, one record (or None) per input; a
+    list of any other length counts as an error and drops the batch. Its
+    stats count batches.
+
+    Attributes:
+        queue_size (int or dict): Capacity of each stage's input queue,
+            optionally per stage name.
+        workers (dict): Number of concurrent workers per stage name (default 1).
+        batch_sizes (dict): Maximum batch size per batched stage name.
+        stats (dict): StageStats per stage, plus "end_to_end".
+    """
+
+    def __init__(self, ingest, stages, queue_size=100, workers=None, batch_sizes=None, poll_interval=1.0,
+                 report_interval=None):
+        self.ingest = ingest
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.workers = workers or {}
+        self.batch_sizes = batch_sizes or {}
+        self.poll_interval = poll_interval
+        self.report_interval = report_interval
+        self.stats = {name: StageStats(name) for name, _ in self.stages}
+        self.stats["end_to_end"] = StageStats("end_to_end")
+        self._stopping = None
+
+    def stop(self):
+        if self._stopping is not None:
+            self._stopping.set()
+
+    def report(self):
+        return {name: stats.snapshot() for name, stats in self.stats.items()}
+
+    def queue_depths(self):
+        return {name: queue.qsize() for (name, _), queue in zip(self.stages, self._queues)}
+
+    async def run(self):
+        self._stopping = asyncio.Event()
+        self._queues = [asyncio.Queue(maxsize=self._size_for(name)) for name, _ in self.stages]
+
+        tasks = []
+        for index, (name, func) in enumerate(self.stages):
+            for _ in range(self.workers.get(name, 1)):
+                tasks.append(asyncio.create_task(self._work(index, name, func)))
+        reporter = asyncio.create_task(self._report_loop()) if self.report_interval else None
+
+        try:
+            await self._ingest()
+            # Drain stage by stage so nothing accepted is lost on shutdown.
+            for queue in self._queues:
+                await queue.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            if reporter is not None:
+                reporter.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _size_for(self, name):
+        if isinstance(self.queue_size, dict):
+            return self.queue_size.get(name, 100)
+        return self.queue_size
+
+    async def _ingest(self):
+        first = self._queues[0]
+
+        if hasattr(self.ingest, "__aiter__"):
+            async for record in self.ingest:
+                if self._stopping.is_set():
+                    break
+                await first.put(_Item(record))
+            return
+
+        loop = asyncio.get_running_loop()
+        while not self._stopping.is_set():
+            records = await loop.run_in_executor(None, self.ingest)
+            for record in records or []:
+                await first.put(_Item(record))
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _work(self, index, name, func):
+        queue = self._queues[index]
+        next_queue = self._queues[index + 1] if index + 1 < len(self._queues) else None
+        stats = self.stats[name]
+        loop = asyncio.get_running_loop()
+        is_async = inspect.iscoroutinefunction(func)
+        batch_size = self.batch_sizes.get(name)
+
+        while True:
+            items = [await queue.get()]
+            while batch_size and len(items) < batch_size and not queue.empty():
+                items.append(queue.get_nowait())
+
+            arg = [item.record for item in items] if batch_size else items[0].record
+            started = time.monotonic()
+            try:
+                if is_async:
+                    result = await func(arg)
+                else:
+                    result = await loop.run_in_executor(None, func, arg)
+            except Exception as error:
+                stats.errors += 1
+                print(f"Pipeline stage {name} failed: ", error)
+                result = [None] * len(items) if batch_size else None
+            else:
+                if batch_size and (result is None or len(result) != len(items)):
+                    # Records cannot be matched up with their inputs, so the whole batch is dropped.
+                    stats.errors += 1
+                    print(f"Pipeline stage {name} returned {0 if result is None else len(result)} records "
+                          f"for a batch of {len(items)}")
+                    result = [None] * len(items)
+
+            finished = time.monotonic()
+            waited = sum(started - item.queued_at for item in items) / len(items)
+            stats.record(finished - started, waited)
+
+            for item, record in zip(items, result if batch_size else [result]):
+                if record is not None:
+                    item.record = record
+                    if next_queue is not None:
+                        item.queued_at = finished
+                        await next_queue.put(item)
+                    else:
+                        self.stats["end_to_end"].record(finished - item.created_at, 0.0)
+            # Once per dequeued item, whatever the stage returned, so join() and drain() finish.
+            for _ in items:
+                queue.task_done()
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            for name, snapshot in self.report().items():
+                print(
+                    f"[{name}] n={snapshot['count']} err={snapshot['errors']} "
+                    f"mean={snapshot['mean'] * 1000:.1f}ms p95={snapshot['p95'] * 1000:.1f}ms "
+                    f"wait={snapshot['mean_wait'] * 1000:.1f}ms"
+                )
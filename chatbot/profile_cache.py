@@ -0,0 +1,340 @@
+import atexit
+import threading
+import time
+from collections import OrderedDict
+
+import psycopg2
+
+from profile_store import TopKCounter
+
+
+class _Entry:
+    __slots__ = ("base", "pending", "flushing", "loaded_at", "generation", "attempts")
+
+    def __init__(self, base):
+        self.base = base
+        self.pending = None
+        self.flushing = None
+        self.loaded_at = time.monotonic()
+        # Bumped whenever a flush takes this entry's delta; a read that
+        # started before then may or may not include it, so is not stored.
+        self.generation = 0
+        # Consecutive flushes in which this user's delta was rejected.
+        self.attempts = 0
+
+
+def _merge(delta, other):
+    if delta is None:
+        return other
+    if other is None:
+        return delta
+    count, total, total_sq, topics, data = delta
+    topics = dict(topics)
+    for topic, n in other[3].items():
+        topics[topic] = topics.get(topic, 0) + n
+    return (
+        count + other[0],
+        total + other[1],
+        total_sq + other[2],
+        topics,
+        other[4] if other[4] is not None else data,
+    )
+
+
+class CachedProfileStore:
+    """
+    An LRU read-through cache in front of a ProfileStore, with write coalescing.
+
+    Reads of a cached user cost no database round trip. Updates are folded
+    into the cached entry and marked dirty; a background thread writes all
+    dirty users every `flush_interval` seconds (or as soon as `max_dirty`
+    users are dirty) with one `ProfileStore.update_many` call, so a burst of
+    messages from one user becomes a single write.
+
+    Consistency is tunable: `flush_interval=0` writes every update through
+    before returning, and `ttl` re-reads a clean entry from the database once
+    it is that many seconds old, so changes made by other processes show up
+    within `ttl`. Dirty entries are never evicted before they are flushed,
+    and everything pending is flushed on `close()` or interpreter exit.
+
+    When the database rejects a batch, its users are written one at a time
+    so one bad profile cannot hold up the others; a user whose update is
+    rejected `max_attempts` flushes in a row has it dropped. While the
+    database is unreachable updates keep coalescing, but at most
+    `max_unflushed` users are kept dirty: beyond that the least recently
+    used users' pending updates are dropped (reanalyze.py rebuilds
+    profiles from the chatlog).
+
+    Attributes:
+        hits (int): Reads served from memory.
+        misses (int): Reads that went to the database.
+        flushes (int): Batched writes made.
+        coalesced (int): Updates merged into an already dirty entry.
+        dropped (int): Users whose pending updates were dropped.
+    """
+
+    def __init__(self, store, maxsize=10000, ttl=None, flush_interval=1.0, max_dirty=1000, max_attempts=3,
+                 max_unflushed=50000):
+        self.store = store
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.max_dirty = max_dirty
+        self.max_attempts = max_attempts
+        self.max_unflushed = max_unflushed
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+        self._entries = OrderedDict()
+        self._dirty = set()
+        self._closed = False
+        self._flush_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._thread = None
+        if flush_interval:
+            self._thread = threading.Thread(target=self._run, name="profile-flush", daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def get(self, user_id):
+        with self._cond:
+            entry = self._entries.get(user_id)
+            if entry is not None and self._fresh(user_id, entry):
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return self.store.to_profile(user_id, self._view(entry))
+            self.misses += 1
+            seen = entry
+            generation = entry.generation if entry is not None else 0
+
+        row = self.store.fetch(user_id)
+        with self._cond:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                entry = self._entries[user_id] = _Entry(row)
+                self._evict()
+            elif entry.flushing is None and entry.generation == generation and (entry is seen or seen is None):
+                entry.base = row
+                entry.loaded_at = time.monotonic()
+            # else a flush took this entry while `row` was being read; `row`
+            # may or may not include that write, so the flushed row is kept.
+            self._entries.move_to_end(user_id)
+            return self.store.to_profile(user_id, self._view(entry))
+
+    def update(self, user_id, sentiments, topics, data=None):
+        topic_counts = {}
+        for topic in topics or []:
+            topic_counts[topic] = topic_counts.get(topic, 0) + 1
+        delta = (
+            len(sentiments),
+            float(sum(sentiments)),
+            float(sum(s * s for s in sentiments)),
+            topic_counts,
+            data,
+        )
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("CachedProfileStore is closed")
+            entry = self._entries.get(user_id)
+            if entry is None:
+                # Nothing to show yet; the flush returns the merged row.
+                entry = self._entries[user_id] = _Entry(None)
+                entry.loaded_at = None
+                self._evict()
+            if entry.pending is not None:
+                self.coalesced += 1
+            entry.pending = _merge(entry.pending, delta)
+            self._entries.move_to_end(user_id)
+            self._dirty.add(user_id)
+            self._shed()
+            if len(self._dirty) >= self.max_dirty:
+                self._cond.notify_all()
+
+        if not self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Writes every dirty profile now; blocks until the write commits."""
+        with self._flush_lock:
+            with self._cond:
+                batch = []
+                for user_id in self._dirty:
+                    entry = self._entries[user_id]
+                    entry.flushing, entry.pending = entry.pending, None
+                    entry.generation += 1
+                    batch.append((user_id, *entry.flushing))
+                self._dirty = set()
+            if not batch:
+                return
+
+            error = None
+            try:
+                rows, rejected, unwritten = self.store.update_many(batch), [], []
+            except (psycopg2.DataError, psycopg2.IntegrityError, ValueError, TypeError) as rejection:
+                print("Profile flush rejected, writing users one at a time: ", rejection)
+                rows, rejected, unwritten, error = self._update_each(batch)
+            except Exception as failure:
+                rows, rejected, unwritten, error = {}, [], batch, failure
+
+            with self._cond:
+                now = time.monotonic()
+                for user_id, *_ in batch:
+                    if user_id in rows:
+                        entry = self._entries[user_id]
+                        entry.base = rows[user_id]
+                        entry.flushing = None
+                        entry.loaded_at = now
+                        entry.attempts = 0
+                for user_id in rejected:
+                    self._reject(user_id)
+                self._restore(unwritten)
+                if rows:
+                    self.flushes += 1
+                self._evict()
+            if error is not None:
+                raise error
+
+    def _update_each(self, batch):
+        # Returns the rows written, the users whose update was rejected, the
+        # deltas left unwritten and the error that stopped the writes.
+        rows = {}
+        rejected = []
+        for i, delta in enumerate(batch):
+            try:
+                rows.update(self.store.update_many([delta]))
+            except (psycopg2.DataError, psycopg2.IntegrityError, ValueError, TypeError) as error:
+                print(f"Profile update for {delta[0]} rejected: ", error)
+                rejected.append(delta[0])
+            except Exception as error:
+                return rows, rejected, batch[i:], error
+        return rows, rejected, [], None
+
+    def _restore(self, batch):
+        # Called with the lock held; puts unwritten deltas back to be retried.
+        for user_id, *_ in batch:
+            entry = self._entries[user_id]
+            entry.pending = _merge(entry.flushing, entry.pending)
+            entry.flushing = None
+            self._dirty.add(user_id)
+        self._shed()
+
+    def _reject(self, user_id):
+        # Called with the lock held.
+        entry = self._entries[user_id]
+        entry.attempts += 1
+        if entry.attempts >= self.max_attempts:
+            print(f"Dropping the profile update for {user_id} after {entry.attempts} rejected flushes")
+            entry.attempts = 0
+            self.dropped += 1
+            entry.flushing = None
+            if entry.pending is not None:
+                self._dirty.add(user_id)
+        else:
+            self._restore([(user_id,)])
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": len(self._entries),
+                "dirty": len(self._dirty),
+                "hits": self.hits,
+                "misses": self.misses,
+                "flushes": self.flushes,
+                "coalesced": self.coalesced,
+                "dropped": self.dropped,
+            }
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        atexit.unregister(self.close)
+        try:
+            self.flush()
+        except Exception as error:
+            print("Profile flush failed on close: ", error)
+
+    def _fresh(self, user_id, entry):
+        if entry.loaded_at is None:
+            return False
+        if self.ttl is None or user_id in self._dirty or entry.flushing is not None:
+            return True
+        return time.monotonic() - entry.loaded_at < self.ttl
+
+    def _view(self, entry):
+        # The stored row plus whatever is still on its way to the database.
+        row = entry.base
+        extra = _merge(entry.flushing, entry.pending)
+        if extra is None:
+            return row
+        if row is None:
+            row = (0, 0.0, 0.0, {}, None, None)
+
+        # Pending deltas are added undecayed; the flush applies the exact decay.
+        count, total, total_sq, topic_counts, data, _ = row
+        counter = TopKCounter(self.store.topic_capacity, topic_counts)
+        for topic, n in extra[3].items():
+            counter.add(topic, n)
+        return (
+            count + extra[0],
+            total + extra[1],
+            total_sq + extra[2],
+            counter.counts,
+            extra[4] if extra[4] is not None else data,
+            counter.top(),
+        )
+
+    def _evict(self):
+        # Only clean entries can go; dirty ones wait for the next flush.
+        excess = len(self._entries) - self.maxsize
+        if excess <= 0:
+            return
+        for user_id in list(self._entries):
+            if excess <= 0:
+                break
+            entry = self._entries[user_id]
+            if user_id in self._dirty or entry.flushing is not None:
+                continue
+            del self._entries[user_id]
+            excess -= 1
+
+    def _shed(self):
+        # Called with the lock held; drops the least recently used users'
+        # pending updates beyond max_unflushed.
+        excess = len(self._dirty) - self.max_unflushed
+        if excess <= 0:
+            return
+        for user_id in list(self._entries):
+            if excess <= 0:
+                break
+            if user_id not in self._dirty:
+                continue
+            self._entries[user_id].pending = None
+            self._dirty.discard(user_id)
+            self.dropped += 1
+            excess -= 1
+        print(f"Profile cache full: dropped pending updates, {self.dropped} so far")
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and len(self._dirty) < self.max_dirty:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as error:
+                print("Profile flush failed: ", error)
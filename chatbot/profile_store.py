@@ -0,0 +1,293 @@
+import heapq
+import math
+
+from psycopg2.extras import Json, execute_values
+
+from topic_store import TopicLabels
+from topic_vectors import decode_vector, encode_vector, hash_topics
+
+
+class TopKCounter:
+    """
+    A bounded topic counter that keeps at most `capacity` topics.
+
+    When a new topic arrives and the counter is full, the least frequent topic
+    is evicted and the newcomer inherits its count (Space-Saving), so memory
+    stays fixed no matter how many distinct topics a user mentions. Counts
+    can be scaled down with `decay()` so old interests fade, and the most
+    frequent topic is tracked as counts change, so `top()` is O(1).
+    """
+
+    def __init__(self, capacity=20, counts=None):
+        self.capacity = capacity
+        self.counts = dict(counts or {})
+        self._heap = [(count, topic) for topic, count in self.counts.items()]
+        heapq.heapify(self._heap)
+        self._top = max(self.counts, key=self.counts.get) if self.counts else None
+
+    def add(self, topic, n=1):
+        if topic in self.counts:
+            self.counts[topic] += n
+        elif len(self.counts) < self.capacity:
+            self.counts[topic] = n
+        else:
+            floor, evicted = self._pop_min()
+            del self.counts[evicted]
+            self.counts[topic] = floor + n
+
+        heapq.heappush(self._heap, (self.counts[topic], topic))
+        if self._top not in self.counts or self.counts[topic] > self.counts[self._top]:
+            self._top = topic
+
+        # Stale heap entries pile up as counts grow; rebuild before they dominate.
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(count, topic) for topic, count in self.counts.items()]
+            heapq.heapify(self._heap)
+
+    def decay(self, factor):
+        """Scales every count by `factor`; the ranking, and so `top()`, is unchanged."""
+        if factor >= 1:
+            return
+        self.counts = {topic: round(count * factor, 6) for topic, count in self.counts.items()}
+        self._heap = [(count, topic) for topic, count in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def _pop_min(self):
+        while True:
+            count, topic = heapq.heappop(self._heap)
+            if self.counts.get(topic) == count:
+                return count, topic
+
+    def most_common(self, n=None):
+        items = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        return items if n is None else items[:n]
+
+    def top(self):
+        return self._top
+
+
+class ProfileStore:
+    """
+    Keeps decayed sentiment aggregates and a bounded topic counter per user.
+
+    Each update touches a single `user_profiles` row, and reading a profile
+    costs the same whether the user has sent ten messages or ten million:
+    a row holds three sentiment sums and at most `topic_capacity` topics.
+
+    With `half_life` set (in seconds), older messages count for
+    exponentially less: sentiment sums and topic counts are scaled by
+    0.5 ** (age / half_life) before each update, so `avg_sentiment` and
+    `top_topics` follow the user's recent mood and interests. With
+    `half_life=None` the aggregates cover the user's whole history.
+
+    Every profile also carries a fixed-width float32 topic vector (see
+    `topic_vectors.hash_topics`), decayed and updated alongside the topic
+    counter and stored as `bytea`, so interests can be compared across
+    users. When `index` (a TopicIndex) is given, each updated vector is
+    upserted into it as well.
+
+    Room topics are stored as `topic_key()`s; profiles show them by their
+    label from `topics` (a RoomTopicModel, or by default the TopicLabels
+    last saved by the bots).
+    """
+
+    def __init__(self, pool, topic_capacity=20, half_life=7 * 24 * 3600, index=None, topics=None):
+        self.pool = pool
+        self.topic_capacity = topic_capacity
+        self.half_life = half_life
+        self.index = index
+        self.topics = topics or TopicLabels(pool)
+
+    @staticmethod
+    def ensure_schema(cur):
+        cur.execute("""
+            ALTER TABLE user_profiles
+                ADD COLUMN IF NOT EXISTS sentiment_count BIGINT NOT NULL DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS sentiment_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS sentiment_sumsq DOUBLE PRECISION NOT NULL DEFAULT 0,
+                ADD COLUMN IF NOT EXISTS topic_counts JSONB NOT NULL DEFAULT '{}'
+        """)
+
+    @staticmethod
+    def ensure_decay_schema(cur):
+        # Decayed counts are fractional; the timestamps drive the decay.
+        cur.execute("""
+            ALTER TABLE user_profiles
+                ALTER COLUMN sentiment_count TYPE DOUBLE PRECISION,
+                ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                ADD COLUMN IF NOT EXISTS topics_decayed_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                ADD COLUMN IF NOT EXISTS top_topic TEXT
+        """)
+
+    @staticmethod
+    def ensure_vector_schema(cur):
+        cur.execute("ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS topic_vector BYTEA")
+
+    def get(self, user_id):
+        return self.to_profile(user_id, self.fetch(user_id))
+
+    def fetch(self, user_id):
+        """Returns the raw `(count, sum, sumsq, topic_counts, data, top_topic)` aggregates, or None."""
+        with self.pool.cursor() as cur:
+            cur.execute(
+                """
+                SELECT sentiment_count, sentiment_sum, sentiment_sumsq, topic_counts, data, top_topic
+                FROM user_profiles WHERE user_id = %s
+                """,
+                (user_id,)
+            )
+            return cur.fetchone()
+
+    def to_profile(self, user_id, row):
+        if row is None:
+            return {
+                "user_id": user_id,
+                "sentiment_count": 0,
+                "avg_sentiment": 0,
+                "sentiment_stddev": 0,
+                "most_common_topic": None,
+                "top_topics": [],
+                "data": {},
+            }
+
+        count, total, total_sq, topic_counts, data, top_topic = row
+        avg = total / count if count else 0
+        variance = max(total_sq / count - avg * avg, 0) if count else 0
+        # Decay scales every sum and count alike, so the ratios need no adjusting here.
+        return {
+            "user_id": user_id,
+            "sentiment_count": count,
+            "avg_sentiment": avg,
+            "sentiment_stddev": math.sqrt(variance),
+            "most_common_topic": self.topics.describe(top_topic) if top_topic is not None else None,
+            "top_topics": [
+                self.topics.describe(topic)
+                for topic, _ in TopKCounter(self.topic_capacity, topic_counts).most_common()
+            ],
+            "data": data or {},
+        }
+
+    def update(self, user_id, sentiments, topics, data=None):
+        """Folds one message's sentiments and topics into the user's aggregates."""
+        topic_counts = {}
+        for topic in topics or []:
+            topic_counts[topic] = topic_counts.get(topic, 0) + 1
+        self.update_many([(
+            user_id,
+            len(sentiments),
+            float(sum(sentiments)),
+            float(sum(s * s for s in sentiments)),
+            topic_counts,
+            data,
+        )])
+
+    def update_many(self, deltas, cur=None):
+        """
+        Applies `(user_id, count, sum, sumsq, topic_counts, data)` deltas in one transaction.
+
+        Sentiment totals are decayed and incremented in SQL with one
+        multi-row upsert, which also locks the rows; the bounded topic
+        counters and topic vectors are then decayed and merged in Python and
+        written back with one multi-row UPDATE. Pass `cur` to run inside the
+        caller's transaction instead of a new one. Returns the new raw
+        aggregates per user id, as `fetch()` would.
+        """
+        # Scraped ids are often strings while the column is an integer, so
+        # deltas are merged and matched to returned rows by their text form.
+        merged = {}
+        for user_id, count, total, total_sq, topic_counts, data in deltas:
+            key = str(user_id)
+            if key in merged:
+                _, old_count, old_total, old_total_sq, old_topics, old_data = merged[key]
+                topics = dict(old_topics or {})
+                for topic, n in (topic_counts or {}).items():
+                    topics[topic] = topics.get(topic, 0) + n
+                merged[key] = (
+                    user_id,
+                    old_count + count,
+                    old_total + total,
+                    old_total_sq + total_sq,
+                    topics,
+                    data if data is not None else old_data,
+                )
+            else:
+                merged[key] = (user_id, count, total, total_sq, topic_counts, data)
+        if not merged:
+            return {}
+
+        if cur is not None:
+            results, vectors = self._apply(cur, merged)
+        else:
+            with self.pool.cursor() as cur:
+                results, vectors = self._apply(cur, merged)
+
+        # Only once the transaction has committed (or been handed back to the caller).
+        if self.index is not None:
+            for user_id, vector in vectors:
+                self.index.add(user_id, vector)
+        return results
+
+    def _apply(self, cur, merged):
+        if self.half_life:
+            decay = "power(0.5, EXTRACT(EPOCH FROM NOW() - user_profiles.updated_at) / {:f})".format(self.half_life)
+        else:
+            decay = "1"
+
+        rows = execute_values(
+            cur,
+            """
+            INSERT INTO user_profiles (user_id, sentiment_count, sentiment_sum, sentiment_sumsq, data)
+            VALUES %s
+            ON CONFLICT (user_id) DO UPDATE SET
+                sentiment_count = user_profiles.sentiment_count * {decay} + EXCLUDED.sentiment_count,
+                sentiment_sum = user_profiles.sentiment_sum * {decay} + EXCLUDED.sentiment_sum,
+                sentiment_sumsq = user_profiles.sentiment_sumsq * {decay} + EXCLUDED.sentiment_sumsq,
+                data = CASE WHEN EXCLUDED.data IS NULL THEN user_profiles.data ELSE EXCLUDED.data END,
+                updated_at = NOW()
+            RETURNING user_id, sentiment_count, sentiment_sum, sentiment_sumsq, topic_counts,
+                COALESCE(data, '{{}}'), top_topic, EXTRACT(EPOCH FROM NOW() - topics_decayed_at), topic_vector
+            """.format(decay=decay),
+            [
+                (user_id, count, total, total_sq, Json(data) if data is not None else None)
+                for user_id, count, total, total_sq, _, data in merged.values()
+            ],
+            fetch=True
+        )
+
+        results = {}
+        changed = []
+        vectors = []
+        for user_id, count, total, total_sq, topic_counts, data, top_topic, topics_age, vector in rows:
+            delta = merged[str(user_id)]
+            if delta[4]:
+                factor = 0.5 ** (float(topics_age) / self.half_life) if self.half_life else 1
+                counter = TopKCounter(self.topic_capacity, topic_counts)
+                counter.decay(factor)
+                for topic, n in delta[4].items():
+                    counter.add(topic, n)
+                topic_counts, top_topic = counter.counts, counter.top()
+                if vector is None:
+                    # Not backfilled yet; the merged counter already holds the history.
+                    vector = hash_topics(topic_counts)
+                else:
+                    vector = decode_vector(vector) * factor + hash_topics(delta[4])
+                changed.append((user_id, Json(topic_counts), top_topic, encode_vector(vector)))
+                vectors.append((user_id, vector))
+            results[delta[0]] = (count, total, total_sq, topic_counts, data, top_topic)
+
+        if changed:
+            execute_values(
+                cur,
+                """
+                UPDATE user_profiles SET
+                    topic_counts = v.topic_counts,
+                    top_topic = v.top_topic,
+                    topic_vector = v.topic_vector,
+                    topics_decayed_at = NOW()
+                FROM (VALUES %s) AS v (user_id, topic_counts, top_topic, topic_vector)
+                WHERE user_profiles.user_id = v.user_id
+                """,
+                changed,
+                template="(%s, %s::jsonb, %s, %s::bytea)"
+            )
+        return results, vectors
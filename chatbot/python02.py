@@ -1,18 +1,8 @@
-import os
-import random
-import time
-import nltk
-import spacy
-from nltk.sentiment import SentimentIntensityAnalyzer
-from nltk.tokenize import word_tokenize
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.cluster import KMeans
-import re
-import psycopg2
-import requests
-import openai
-
-openai.api_key = os.environ["OPENAI_API_KEY"]
+from chatlog_partitions import ChatlogPartitions
+from db_pool import DatabasePool
+from migrations import Migrator, chatlog_migrations
+from models import openai_api, spacy_model
+from profile_store import ProfileStore
 
 class Chatlog:
     """
@@ -38,16 +28,21 @@ class Chatlog:
         self.database_name = database_name
         self.database_user = database_user
         self.database_password = database_password
-        self.nlp = spacy.load("en")  # Load the English language model
-
-        self.conn = psycopg2.connect(
-            host="localhost",
-            port=5432,
-            database=database_name,
-            user=database_user,
-            password=database_password
-        )
-        self.cur = self.conn.cursor()
+
+        self.pool = DatabasePool(database_name, database_user, database_password)
+        self.profiles = ProfileStore(self.pool)
+        self.upgrade_database()
+
+    def upgrade_database(self):
+        # ProfileStore reads columns added by later migrations (top_topic, topic_vector).
+        self.migrator = Migrator(self.pool, chatlog_migrations(ChatlogPartitions(self.pool)))
+        self.migrator.migrate(backfill=False)
+        self.migrator.start_backfills()
+
+    @property
+    def nlp(self):
+        """The English language model, loaded on first use."""
+        return spacy_model("en")
 
     def get_user_profile(self, user_id):
         """
@@ -59,23 +54,8 @@ class Chatlog:
         Returns:
             dict: The user profile.
         """
-        sentiments = []
-        topics = []
-
-        self.cur.execute(
-            "SELECT * FROM user_profiles WHERE user_id = %s",
-            (user_id,)
-        )
-        profile = self.cur.fetchone()
-
-        if profile:
-            sentiments = [int(sentiment) for sentiment in profile[1].split(",")]
-            topics = profile[2].split(",")
-
-        return {
-            "avg_sentiment": sum(sentiments) / len(sentiments),
-            "most_common_topic": max(topics, key=topics.count)
-        }
+        # One fixed-size row: the decayed sentiment sums and a stored top topic.
+        return self.profiles.get(user_id)
 
 class Chatbot:
     """
@@ -123,7 +103,7 @@ class Chatbot:
 
         prompt += " How should I respond?"
 
-        response = openai.Completion.create(
+        response = openai_api().Completion.create(
             engine="davinci",
             prompt=prompt,
             temperature=0.7,
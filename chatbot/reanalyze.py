@@ -0,0 +1,212 @@
+import sys
+import time
+from collections import deque
+from datetime import datetime
+
+from analysis_pool import AnalysisPool
+from chatlog_partitions import ChatlogPartitions
+from db_pool import DatabasePool
+from migrations import Migrator, chatlog_migrations
+from profile_store import ProfileStore
+from topic_store import topic_key
+
+
+class ReanalysisJob:
+    """
+    Re-runs sentiment and topic analysis over the chatlog and rebuilds user_profiles from it.
+
+    A fresh run resets every profile's aggregates and records the newest
+    chatlog entry as its end point; messages after that are left to the
+    running bots. The chatlog is then read in `entry_id` order, `chunk_size`
+    rows per query, each query in its own short transaction so partition
+    maintenance is never held up behind the job. Each chunk is parsed with
+    `nlp.pipe` on the AnalysisPool's worker processes while the next chunk
+    is being read (up to `prefetch` chunks in flight), and its results are
+    folded into the profiles with one bulk upsert, in the same transaction
+    that advances the job's row in `reanalysis_checkpoints`. An interrupted
+    run therefore resumes after the last chunk it committed, with nothing
+    counted twice.
+
+    Messages are weighted by 0.5 ** (age / half_life), as if they had been
+    decayed live. Topics are the AnalysisPool's noun lemmas, which is what
+    CHATBOT04.py, chatbot031.py and the other lemma-based bots store. Bots
+    that classify messages into room topics (CHATBOT!.py) store
+    `topic_key()`s instead; pass a `topic_model` loaded from the saved
+    model (`--room-topics` on the command line) to rebuild those, otherwise
+    a rebuild replaces every profile's room topics with lemmas.
+
+    Bots keep a cache of profiles (CachedProfileStore); they pick up rebuilt
+    rows as their entries are flushed or expire, so run this while they are
+    stopped, or with a cache `ttl`, if stale reads in between matter.
+    """
+
+    def __init__(self, pool, analysis=None, store=None, name="profiles", chunk_size=2000, prefetch=2,
+                 report_interval=10, topic_model=None):
+        self.pool = pool
+        self.topic_model = topic_model
+        self._owns_analysis = analysis is None
+        self.analysis = analysis or AnalysisPool("en_core_web_sm")
+        self.store = store or ProfileStore(pool)
+        self.name = name
+        self.chunk_size = chunk_size
+        self.prefetch = prefetch
+        self.report_interval = report_interval
+
+    def run(self, restart=False):
+        """Resumes the unfinished run, or starts a new one; returns the rows analyzed by this call."""
+        position, until_id, done = self._start(restart)
+        started = last_report = time.perf_counter()
+        processed = 0
+
+        in_flight = deque()
+        while True:
+            rows = self._read(position, until_id)
+            if rows:
+                position = rows[-1][0]
+                in_flight.append((rows, self.analysis.submit_batch([row[2] or "" for row in rows])))
+            if not in_flight:
+                break
+            if rows and len(in_flight) < self.prefetch:
+                continue
+
+            rows, futures = in_flight.popleft()
+            self._write(rows, [future.result() for future in futures])
+            processed += len(rows)
+
+            now = time.perf_counter()
+            if now - last_report >= self.report_interval:
+                self._report(done + processed, processed / (now - started), rows[-1][0], until_id)
+                last_report = now
+
+        with self.pool.cursor() as cur:
+            cur.execute(
+                "UPDATE reanalysis_checkpoints SET finished_at = NOW() WHERE job = %s",
+                (self.name,)
+            )
+        elapsed = time.perf_counter() - started
+        print(f"Re-analysis '{self.name}' finished: {done + processed} rows, "
+              f"{processed / elapsed if elapsed else 0:.0f} rows/s this run")
+        return processed
+
+    def close(self):
+        if self._owns_analysis:
+            self.analysis.close()
+
+    def _start(self, restart):
+        with self.pool.cursor() as cur:
+            cur.execute(
+                "SELECT position, until_id, processed, finished_at FROM reanalysis_checkpoints WHERE job = %s FOR UPDATE",
+                (self.name,)
+            )
+            row = cur.fetchone()
+            if row is not None and row[3] is None and not restart:
+                print(f"Resuming re-analysis '{self.name}' after entry {row[0]} ({row[2]} rows done)")
+                return row[0], row[1], row[2]
+
+            cur.execute("SELECT COALESCE(MAX(entry_id), 0) FROM chatlog")
+            until_id = cur.fetchone()[0]
+            # The reset commits with the checkpoint, so a crash right after it resumes cleanly.
+            cur.execute("""
+                UPDATE user_profiles SET
+                    sentiment_count = 0,
+                    sentiment_sum = 0,
+                    sentiment_sumsq = 0,
+                    topic_counts = '{}',
+                    top_topic = NULL,
+                    topic_vector = NULL,
+                    updated_at = NOW(),
+                    topics_decayed_at = NOW()
+            """)
+            cur.execute(
+                """
+                INSERT INTO reanalysis_checkpoints (job, position, until_id, processed)
+                VALUES (%s, 0, %s, 0)
+                ON CONFLICT (job) DO UPDATE SET
+                    position = 0,
+                    until_id = EXCLUDED.until_id,
+                    processed = 0,
+                    started_at = NOW(),
+                    updated_at = NOW(),
+                    finished_at = NULL
+                """,
+                (self.name, until_id)
+            )
+            print(f"Starting re-analysis '{self.name}' of chatlog entries up to {until_id}")
+            return 0, until_id, 0
+
+    def _read(self, position, until_id):
+        # Each chunk is its own short transaction, so the job never holds
+        # locks on chatlog partitions for longer than one keyset query.
+        with self.pool.cursor() as cur:
+            cur.execute(
+                """
+                SELECT entry_id, user_id, message, timestamp FROM chatlog
+                WHERE entry_id > %s AND entry_id <= %s AND user_id IS NOT NULL
+                ORDER BY entry_id
+                LIMIT %s
+                """,
+                (position, until_id, self.chunk_size)
+            )
+            return cur.fetchall()
+
+    def _write(self, rows, results):
+        now = datetime.now()
+        half_life = self.store.half_life
+        deltas = []
+        for (entry_id, user_id, message, timestamp), result in zip(rows, results):
+            weight = 1.0
+            if half_life and timestamp is not None:
+                weight = 0.5 ** (max((now - timestamp).total_seconds(), 0) / half_life)
+            scores = result["sentiments"]
+            topics = result["topics"]
+            if self.topic_model is not None:
+                # As Chatlog.classify does, but without feeding history back into training.
+                topic_id = self.topic_model.assign(message or "", learn=False)
+                if topic_id is not None:
+                    topics = [topic_key(topic_id)]
+            topic_counts = {}
+            for topic in topics:
+                topic_counts[topic] = topic_counts.get(topic, 0) + weight
+            deltas.append((
+                user_id,
+                weight * len(scores),
+                weight * sum(scores),
+                weight * sum(score * score for score in scores),
+                topic_counts,
+                None,
+            ))
+
+        with self.pool.cursor() as cur:
+            self.store.update_many(deltas, cur=cur)
+            cur.execute(
+                """
+                UPDATE reanalysis_checkpoints SET
+                    position = %s, processed = processed + %s, updated_at = NOW()
+                WHERE job = %s
+                """,
+                (rows[-1][0], len(rows), self.name)
+            )
+
+    def _report(self, done, rate, position, until_id):
+        print(f"Re-analysis '{self.name}': {done} rows, {rate:.0f} rows/s, at entry {position} of {until_id}")
+
+
+if __name__ == "__main__":
+    # python reanalyze.py <database> <user> <password> [--restart] [--room-topics]
+    pool = DatabasePool(sys.argv[1], sys.argv[2], sys.argv[3], max_connections=4)
+    partitions = ChatlogPartitions(pool)
+    Migrator(pool, chatlog_migrations(partitions)).migrate()
+
+    topic_model = None
+    if "--room-topics" in sys.argv[4:]:
+        from topic_model import RoomTopicModel
+        topic_model = RoomTopicModel()
+        if not topic_model.load(pool):
+            sys.exit("No saved room topic model to classify with")
+
+    job = ReanalysisJob(pool, topic_model=topic_model)
+    try:
+        job.run(restart="--restart" in sys.argv[4:])
+    finally:
+        job.close()
+        pool.close()
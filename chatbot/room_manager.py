@@ -0,0 +1,288 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.support import expected_conditions as EC
+
+from browser_sessions import login_with_cache, make_driver, wait_for
+from dom_observer import ChatObserver
+from pipeline import MessagePipeline
+
+
+class Tab:
+    """
+    One browser tab, usable wherever a WebDriver is expected by ChatObserver.
+
+    Every call takes the owning browser's lock and switches to this tab
+    first, since a WebDriver session only talks to one window at a time and
+    is not thread-safe.
+    """
+
+    def __init__(self, browser, handle):
+        self.browser = browser
+        self.handle = handle
+
+    def run(self, func, *args):
+        with self.browser.lock:
+            driver = self.browser.driver
+            if self.browser.current != self.handle:
+                driver.switch_to.window(self.handle)
+                self.browser.current = self.handle
+                self.browser.switches += 1
+            return func(driver, *args)
+
+    def get(self, url):
+        return self.run(lambda driver: driver.get(url))
+
+    def execute_script(self, script, *args):
+        return self.run(lambda driver: driver.execute_script(script, *args))
+
+    def execute_async_script(self, script, *args):
+        return self.run(lambda driver: driver.execute_async_script(script, *args))
+
+    def set_script_timeout(self, seconds):
+        return self.run(lambda driver: driver.set_script_timeout(seconds))
+
+    def send_keys(self, selector, *keys):
+        return self.run(lambda driver: driver.find_element(By.CSS_SELECTOR, selector).send_keys(*keys))
+
+    def click(self, selector):
+        return self.run(lambda driver: driver.find_element(By.CSS_SELECTOR, selector).click())
+
+
+class _Browser:
+    __slots__ = ("driver", "lock", "tabs", "current", "switches")
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.lock = threading.Lock()
+        self.tabs = []
+        self.current = driver.current_window_handle
+        self.switches = 0
+
+
+class BrowserPool:
+    """
+    A few WebDriver sessions shared by many rooms, one tab per room.
+
+    Browsers (headless by default) are started lazily, up to `size`; a new
+    tab goes to the browser with the fewest tabs, so rooms spread evenly
+    across sessions.
+    """
+
+    def __init__(self, size=1, driver_factory=None):
+        self.size = size
+        self.driver_factory = driver_factory or make_driver
+        self.browsers = []
+        self._lock = threading.Lock()
+
+    def open_tab(self):
+        with self._lock:
+            if len(self.browsers) < self.size and all(browser.tabs for browser in self.browsers):
+                self.browsers.append(_Browser(self.driver_factory()))
+            browser = min(self.browsers, key=lambda browser: len(browser.tabs))
+
+        with browser.lock:
+            if not browser.tabs:
+                # The session's first window becomes its first tab.
+                handle = browser.driver.current_window_handle
+            else:
+                before = set(browser.driver.window_handles)
+                browser.driver.execute_script("window.open('about:blank');")
+                handle = (set(browser.driver.window_handles) - before).pop()
+            tab = Tab(browser, handle)
+            browser.tabs.append(tab)
+        return tab
+
+    def stats(self):
+        return [{"tabs": len(browser.tabs), "switches": browser.switches} for browser in self.browsers]
+
+    def close(self):
+        with self._lock:
+            for browser in self.browsers:
+                try:
+                    browser.driver.quit()
+                except Exception as error:
+                    print("Error closing browser: ", error)
+            self.browsers = []
+
+
+class Room:
+    """
+    A chat room handled by a RoomManager.
+
+    Each room polls its own tab every `poll_interval` seconds and runs its
+    own pipeline, so a busy room can be polled faster or given more respond
+    workers without affecting the others. Messages posted by `username` are
+    ignored so the bot does not answer itself.
+
+    Attributes:
+        name (str): Label used in records (as "room") and in reports.
+        login (callable): Optional `login(room)` run once the page has loaded;
+            by default the username and password fields are filled in when
+            both are given, reusing a saved session when there is one.
+        polls (int): Drains of the tab's observer.
+        received (int): Messages taken from the room.
+        sent (int): Messages posted to the room.
+    """
+
+    def __init__(self, name, url, username=None, password=None, selector=".chat-message",
+                 input_selector="#message_input", poll_interval=0.5, respond_workers=2, queue_size=100, login=None):
+        self.name = name
+        self.url = url
+        self.username = username
+        self.password = password
+        self.selector = selector
+        self.input_selector = input_selector
+        self.poll_interval = poll_interval
+        self.respond_workers = respond_workers
+        self.queue_size = queue_size
+        self.login = login
+        self.tab = None
+        self.observer = None
+        self.pipeline = None
+        self.polls = 0
+        self.received = 0
+        self.sent = 0
+        self.last_message_at = None
+
+    def open(self, tab):
+        self.tab = tab
+        if self.login is not None:
+            tab.get(self.url)
+            self.login(self)
+        elif self.username and self.password:
+            tab.run(lambda driver: login_with_cache(
+                driver,
+                self.url,
+                self.username,
+                self._submit_login,
+                EC.presence_of_element_located((By.CSS_SELECTOR, self.input_selector))
+            ))
+        else:
+            tab.get(self.url)
+        self.observer = ChatObserver(tab, self.selector)
+        self.observer.install()
+
+    def _submit_login(self, driver):
+        wait_for(driver, EC.visibility_of_element_located((By.NAME, "username"))).send_keys(self.username)
+        driver.find_element(By.NAME, "password").send_keys(self.password)
+        driver.find_element(By.CSS_SELECTOR, "button[type='submit']").click()
+
+    def poll(self):
+        records = self.observer.drain()
+        self.polls += 1
+        messages = []
+        for record in records:
+            if record["user_id"] == self.username:
+                continue
+            record["room"] = self.name
+            messages.append(record)
+        if messages:
+            self.received += len(messages)
+            self.last_message_at = time.time()
+        return messages
+
+    def send_message(self, message):
+        self.tab.send_keys(self.input_selector, message, Keys.RETURN)
+        self.sent += 1
+
+    def report(self):
+        report = {
+            "polls": self.polls,
+            "received": self.received,
+            "sent": self.sent,
+            "dropped": self.observer.dropped if self.observer else 0,
+            "last_message_at": self.last_message_at,
+        }
+        if self.pipeline is not None:
+            report["stages"] = self.pipeline.report()
+        return report
+
+
+class RoomManager:
+    """
+    Runs many chat rooms over a small BrowserPool in one event loop.
+
+    The rooms share whatever the `stages` factory closes over (normally one
+    AnalysisPool, one DatabasePool and one LLMClient), so adding a room
+    costs a tab and a few coroutines rather than a browser, a spaCy model
+    and a connection pool. `stages(room)` returns the `(name, func)` stages
+    for that room's MessagePipeline; analysis stages can be batched with
+    `batch_sizes`.
+    """
+
+    def __init__(self, stages, browsers=None, batch_sizes=None, report_interval=None, max_threads=None):
+        self.stages = stages
+        self.max_threads = max_threads
+        self.browsers = browsers or BrowserPool()
+        self.batch_sizes = batch_sizes or {}
+        self.report_interval = report_interval
+        self.rooms = {}
+        self._loop = None
+
+    def add_room(self, room):
+        if room.name in self.rooms:
+            raise ValueError(f"Room {room.name} is already managed")
+        self.rooms[room.name] = room
+        return room
+
+    def report(self):
+        return {
+            "browsers": self.browsers.stats(),
+            "rooms": {name: room.report() for name, room in self.rooms.items()},
+        }
+
+    def stop(self):
+        if self._loop is None:
+            return
+        for room in self.rooms.values():
+            if room.pipeline is not None:
+                self._loop.call_soon_threadsafe(room.pipeline.stop)
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        rooms = list(self.rooms.values())
+        # Every room polls and responds on executor threads; the default
+        # executor is too small to keep dozens of rooms from starving each other.
+        max_threads = self.max_threads or sum(room.respond_workers + 3 for room in rooms)
+        executor = ThreadPoolExecutor(max_workers=max(max_threads, 4), thread_name_prefix="room")
+        self._loop.set_default_executor(executor)
+        # Opening tabs and logging in is serialized per browser anyway.
+        for room in rooms:
+            await self._loop.run_in_executor(None, room.open, self.browsers.open_tab())
+            room.pipeline = MessagePipeline(
+                room.poll,
+                self.stages(room),
+                queue_size=room.queue_size,
+                workers={"respond": room.respond_workers},
+                batch_sizes=self.batch_sizes,
+                poll_interval=room.poll_interval
+            )
+
+        reporter = asyncio.create_task(self._report_loop()) if self.report_interval else None
+        try:
+            await asyncio.gather(*(room.pipeline.run() for room in rooms))
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+
+    def run_forever(self):
+        try:
+            asyncio.run(self.run())
+        finally:
+            self.browsers.close()
+
+    async def _report_loop(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            for name, room in self.rooms.items():
+                stages = room.pipeline.report() if room.pipeline else {}
+                end_to_end = stages.get("end_to_end", {})
+                print(
+                    f"[{name}] polls={room.polls} in={room.received} out={room.sent} "
+                    f"p95={end_to_end.get('p95', 0.0) * 1000:.1f}ms"
+                )
@@ -0,0 +1,111 @@
+import hashlib
+from collections import OrderedDict
+
+# Returns only the nodes past the watermark, after checking that the node just
+# before it is still the one we saw last time. If it is not (the room trimmed
+# or re-rendered its history), every node is returned and the caller dedupes.
+SCRAPE_SCRIPT = """
+const nodes = document.querySelectorAll(arguments[0]);
+const userAttribute = arguments[1];
+const idAttribute = arguments[2];
+let start = arguments[3];
+const anchor = arguments[4];
+
+function describe(node) {
+    return {
+        id: idAttribute ? node.getAttribute(idAttribute) : null,
+        user_id: node.getAttribute(userAttribute),
+        text: node.innerText,
+    };
+}
+
+let reset = false;
+if (start > 0) {
+    const previous = start <= nodes.length ? describe(nodes[start - 1]) : null;
+    if (!previous || previous.user_id !== anchor.user_id || previous.text !== anchor.text) {
+        start = 0;
+        reset = true;
+    }
+}
+
+const items = [];
+for (let i = start; i < nodes.length; i++) {
+    items.push(describe(nodes[i]));
+}
+return {total: nodes.length, reset: reset, items: items};
+"""
+
+
+class IncrementalScraper:
+    """
+    Scrapes only the chat messages that appeared since the previous poll.
+
+    The scraper remembers how many message nodes it has seen (the watermark)
+    and the last one it saw. Each poll runs one script in the page that
+    returns just the nodes past the watermark, so the Python side does
+    O(new messages) work per poll. If the page has dropped or re-rendered
+    older nodes, the whole list is returned once and messages are deduped
+    against a bounded set of recent fingerprints (the node's id attribute
+    when the room provides one, otherwise a hash of user and text).
+
+    Attributes:
+        emitted (int): Messages returned so far.
+        resets (int): Polls that had to fall back to a full rescan.
+    """
+
+    def __init__(self, driver, selector=".chat-message", user_attribute="data-user-id",
+                 id_attribute="data-message-id", window=5000):
+        self.driver = driver
+        self.selector = selector
+        self.user_attribute = user_attribute
+        self.id_attribute = id_attribute
+        self.window = window
+        self.emitted = 0
+        self.resets = 0
+
+        self._watermark = 0
+        self._anchor = {"user_id": None, "text": None}
+        self._seen = OrderedDict()
+
+    def poll(self):
+        result = self.driver.execute_script(
+            SCRAPE_SCRIPT,
+            self.selector,
+            self.user_attribute,
+            self.id_attribute,
+            self._watermark,
+            self._anchor
+        )
+        items = result["items"]
+        if result["reset"]:
+            self.resets += 1
+
+        messages = []
+        for item in items:
+            fingerprint = self._fingerprint(item)
+            # Past the watermark every node is new, even a repeated "lol";
+            # fingerprints only matter when rescanning after a reset.
+            if result["reset"] and fingerprint in self._seen:
+                continue
+            self._remember(fingerprint)
+            messages.append({
+                "user_id": item["user_id"],
+                "message": item["text"],
+            })
+
+        self._watermark = result["total"]
+        if items:
+            self._anchor = {"user_id": items[-1]["user_id"], "text": items[-1]["text"]}
+        self.emitted += len(messages)
+        return messages
+
+    def _fingerprint(self, item):
+        if item.get("id"):
+            return item["id"]
+        key = f"{item['user_id']}\x1f{item['text']}".encode("utf-8")
+        return hashlib.blake2b(key, digest_size=16).digest()
+
+    def _remember(self, fingerprint):
+        self._seen[fingerprint] = None
+        if len(self._seen) > self.window:
+            self._seen.popitem(last=False)
@@ -0,0 +1,57 @@
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+SentimentScores = namedtuple("SentimentScores", ["neg", "neu", "pos", "compound"])
+
+
+class SentimentEngine:
+    """
+    A process-wide VADER analyzer that loads its lexicon once.
+
+    `SentimentIntensityAnalyzer` only reads its lexicon after construction,
+    so one instance can score messages from any number of threads; only the
+    first construction is guarded by a lock.
+    """
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self):
+        # NLTK is slow to import; only processes that score anything load it.
+        from nltk.sentiment import SentimentIntensityAnalyzer
+        self._analyzer = SentimentIntensityAnalyzer()
+
+    @classmethod
+    def shared(cls):
+        if cls._shared is None:
+            with cls._shared_lock:
+                if cls._shared is None:
+                    cls._shared = cls()
+        return cls._shared
+
+    def score(self, message):
+        """Returns the compound score of a single message."""
+        return self._analyzer.polarity_scores(message)["compound"]
+
+    def score_batch(self, messages):
+        """
+        Scores `messages` in one pass into float32 arrays.
+
+        Repeated messages in the batch are scored once.
+
+        Returns:
+            SentimentScores: neg, neu, pos and compound arrays aligned with `messages`.
+        """
+        scores = np.empty((4, len(messages)), dtype=np.float32)
+        seen = {}
+
+        for index, message in enumerate(messages):
+            polarity = seen.get(message)
+            if polarity is None:
+                result = self._analyzer.polarity_scores(message)
+                polarity = seen[message] = (result["neg"], result["neu"], result["pos"], result["compound"])
+            scores[:, index] = polarity
+
+        return SentimentScores(*scores)
@@ -0,0 +1,120 @@
+import os
+import select
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+CLIS = ("chatbot0.5.py", "chatbot03.py", "chatbot031.py", "CHATBOT04.py")
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def time_to_prompt(script, cwd, prompt=b"Enter", timeout=120):
+    """
+    Starts `script` and waits for its first input prompt.
+
+    Returns:
+        tuple: Seconds until `prompt` was printed (None if the script exited
+            or timed out first) and the `-X importtime` report of the run.
+    """
+    env = dict(os.environ)
+    # Older revisions read the key at import time and exit without it.
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+
+    with tempfile.TemporaryFile() as report:
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-u", "-X", "importtime", script],
+            cwd=cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=report,
+            env=env
+        )
+        elapsed = None
+        output = b""
+        try:
+            while prompt not in output:
+                ready, _, _ = select.select([process.stdout], [], [], timeout)
+                if not ready:
+                    break
+                chunk = os.read(process.stdout.fileno(), 4096)
+                if not chunk:
+                    break
+                output += chunk
+            else:
+                elapsed = time.perf_counter() - started
+        finally:
+            process.kill()
+            process.wait()
+            process.stdout.close()
+            process.stdin.close()
+
+        report.seek(0)
+        return elapsed, report.read().decode(errors="replace")
+
+
+def slowest_imports(report, top=5):
+    """The `top` top-level imports by cumulative time, as `(seconds, module)`."""
+    imports = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nested imports are indented under the module that triggered them.
+        if not name.startswith("  ") and name.strip():
+            imports.append((int(cumulative) / 1e6, name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def export_revision(revision, target):
+    """Writes this directory as it was at `revision` into `target`."""
+    top = subprocess.run(
+        ["git", "rev-parse", "--show-toplevel"], cwd=HERE, check=True, capture_output=True, text=True
+    ).stdout.strip()
+    path = os.path.relpath(HERE, top).replace(os.sep, "/")
+    archive = subprocess.run(
+        ["git", "archive", "--format=tar", f"{revision}:{path}"], cwd=top, check=True, capture_output=True
+    ).stdout
+    with tempfile.TemporaryFile() as f:
+        f.write(archive)
+        f.seek(0)
+        with tarfile.open(fileobj=f) as tar:
+            tar.extractall(target)
+
+
+def best_of(script, cwd, runs):
+    best, report = None, ""
+    for _ in range(runs):
+        elapsed, run_report = time_to_prompt(script, cwd)
+        if elapsed is not None and (best is None or elapsed < best):
+            best, report = elapsed, run_report
+    return best, report
+
+
+def benchmark(baseline=None, runs=3, scripts=CLIS):
+    """Times each CLI to its first prompt, optionally against the same scripts at git revision `baseline`."""
+    with tempfile.TemporaryDirectory() as old_tree:
+        if baseline:
+            export_revision(baseline, old_tree)
+
+        for script in scripts:
+            now, report = best_of(script, HERE, runs)
+            line = f"{script:<16} now: " + (f"{now:.3f}s" if now is not None else "no prompt")
+            if baseline:
+                before, _ = best_of(script, old_tree, runs)
+                line += f"  {baseline}: " + (f"{before:.3f}s" if before is not None else "no prompt")
+                if now and before:
+                    line += f"  ({now / before:.0%} of before)"
+            print(line)
+            for seconds, module in slowest_imports(report):
+                print(f"    {seconds:7.3f}s  {module}")
+
+
+if __name__ == "__main__":
+    # python startup_benchmark.py [baseline-revision] [runs]
+    benchmark(
+        sys.argv[1] if len(sys.argv) > 1 else None,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    )
@@ -0,0 +1,106 @@
+import re
+import threading
+import time
+from collections import deque
+
+SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*(?=\s)")
+
+
+class SentenceChunker:
+    """
+    Groups streamed tokens into sentence-sized chunks for posting to a room.
+
+    A chunk is released at the last sentence boundary once at least
+    `min_chars` have accumulated. Once `max_chars` have accumulated it is cut
+    at the last boundary, or the last space if there is none, so a long
+    run-on sentence still streams.
+    """
+
+    def __init__(self, min_chars=20, max_chars=300):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._buffer = ""
+
+    def feed(self, text):
+        self._buffer += text
+        chunks = []
+
+        while True:
+            boundaries = [match.end() for match in SENTENCE_END.finditer(self._buffer, 0, self.max_chars + 1)]
+            cut = boundaries[-1] if boundaries and boundaries[-1] >= self.min_chars else None
+            if cut is None and len(self._buffer) >= self.max_chars:
+                cut = boundaries[-1] if boundaries else self._buffer.rfind(" ", 0, self.max_chars)
+                if cut <= 0:
+                    cut = self.max_chars
+            if cut is None:
+                return chunks
+
+            chunk = self._buffer[:cut].strip()
+            self._buffer = self._buffer[cut:]
+            if chunk:
+                chunks.append(chunk)
+
+    def flush(self):
+        chunk, self._buffer = self._buffer.strip(), ""
+        return [chunk] if chunk else []
+
+
+class StreamMetrics:
+    """Time-to-first-chunk and total stream time, in seconds."""
+
+    def __init__(self, sample_size=1024):
+        self.streams = 0
+        self.chunks = 0
+        self._first_chunk = deque(maxlen=sample_size)
+        self._total = deque(maxlen=sample_size)
+        self._lock = threading.Lock()
+
+    def record(self, first_chunk, total, chunks):
+        with self._lock:
+            self.streams += 1
+            self.chunks += chunks
+            if first_chunk is not None:
+                self._first_chunk.append(first_chunk)
+            self._total.append(total)
+
+    def snapshot(self):
+        with self._lock:
+            first_chunk = sorted(self._first_chunk)
+            total = sorted(self._total)
+
+        def percentile(samples, p):
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(p * len(samples)))]
+
+        return {
+            "streams": self.streams,
+            "chunks": self.chunks,
+            "first_chunk_p50": percentile(first_chunk, 0.50),
+            "first_chunk_p95": percentile(first_chunk, 0.95),
+            "total_p50": percentile(total, 0.50),
+        }
+
+
+def stream_chunks(tokens, chunker=None, metrics=None):
+    """Consumes `tokens` as they arrive and yields sentence-sized chunks."""
+    chunker = chunker or SentenceChunker()
+    started = time.monotonic()
+    first_chunk = None
+    count = 0
+
+    try:
+        for token in tokens:
+            for chunk in chunker.feed(token):
+                if first_chunk is None:
+                    first_chunk = time.monotonic() - started
+                count += 1
+                yield chunk
+        for chunk in chunker.flush():
+            if first_chunk is None:
+                first_chunk = time.monotonic() - started
+            count += 1
+            yield chunk
+    finally:
+        if metrics is not None:
+            metrics.record(first_chunk, time.monotonic() - started, count)
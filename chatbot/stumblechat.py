@@ -0,0 +1,45 @@
+from browser_sessions import SessionStore, login_with_cache, shared_sessions, wait_for
+from scraper import IncrementalScraper
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+
+
+class StumbleChatBot:
+    url = "https://www.stumblechat.com"
+
+    def __init__(self, username, password, sessions=None, store=None):
+        # Bots borrow an already-running headless browser instead of starting their own.
+        self.sessions = sessions or shared_sessions()
+        self.store = store or SessionStore()
+        self.driver = self.sessions.acquire()
+        self.scraper = IncrementalScraper(self.driver, ".message-element-class")
+        self.username = username
+        self.password = password
+
+    def login(self):
+        # Reuses saved cookies when they are still valid; waits on the page, not the clock.
+        return login_with_cache(
+            self.driver,
+            self.url,
+            self.username,
+            self._login_form,
+            EC.presence_of_element_located((By.ID, "post-message-input-id")),
+            self.store
+        )
+
+    def _login_form(self, driver):
+        wait_for(driver, EC.element_to_be_clickable((By.ID, "login-button-id"))).click()
+        wait_for(driver, EC.visibility_of_element_located((By.ID, "username-input-id"))).send_keys(self.username)
+        driver.find_element(By.ID, "password-input-id").send_keys(self.password)
+        driver.find_element(By.ID, "login-submit-button-id").click()
+
+    def close(self):
+        self.sessions.release(self.driver)
+
+    def fetch_messages(self):
+        # Only messages posted since the previous fetch.
+        return [message["message"] for message in self.scraper.poll()]
+
+    def post_message(self, message):
+        self.driver.find_element(By.ID, "post-message-input-id").send_keys(message)
+        self.driver.find_element(By.ID, "post-message-button-id").click()
@@ -0,0 +1,153 @@
+import threading
+import time
+import unittest
+
+from completion_cache import CompletionCache
+from llm_client import LLMClient, LLMError, RateLimiter
+from llm_stub import StubServer
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_paces_after_the_burst(self):
+        limiter = RateLimiter(600)
+        started = time.monotonic()
+        limiter.acquire(600)
+        self.assertLess(time.monotonic() - started, 0.1)
+        for _ in range(5):
+            limiter.acquire()
+        # 600 per minute is 10 per second once the bucket is empty.
+        self.assertGreaterEqual(time.monotonic() - started, 0.45)
+
+
+class LLMClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StubServer().start()
+        self.client = None
+
+    def tearDown(self):
+        if self.client is not None:
+            self.client.close()
+        self.server.close()
+
+    def make_client(self, **options):
+        options.setdefault("backoff", 0.01)
+        self.client = LLMClient(api_key="test", api_base=self.server.url, **options)
+        self.responses = []
+        post = self.client._session.post
+
+        # Records every response and whether the client closed it.
+        def tracking_post(*args, **kwargs):
+            response = post(*args, **kwargs)
+            response.closed_by_client = False
+            close = response.close
+
+            def tracked_close():
+                response.closed_by_client = True
+                close()
+
+            response.close = tracked_close
+            self.responses.append(response)
+            return response
+
+        self.client._session.post = tracking_post
+        return self.client
+
+    def test_complete(self):
+        client = self.make_client()
+        self.assertEqual(client.complete("davinci", "hello"), "echo: hello")
+        self.assertEqual(self.server.requests[0]["model"], "davinci")
+        self.assertTrue(all(response.closed_by_client for response in self.responses))
+
+    def test_coalesces_identical_requests(self):
+        self.server.latency = 0.2
+        client = self.make_client()
+        futures = [client.submit("davinci", "same prompt") for _ in range(5)]
+        self.assertEqual({future.result() for future in futures}, {"echo: same prompt"})
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(client.stats()["coalesced"], 4)
+
+    def test_serves_repeats_from_the_cache(self):
+        client = self.make_client(cache=CompletionCache())
+        client.complete("davinci", "hello")
+        client.complete("davinci", "hello")
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_honours_retry_after(self):
+        self.server.fail_next(429, retry_after=0.3)
+        client = self.make_client()
+        started = time.monotonic()
+        self.assertEqual(client.complete("davinci", "hello"), "echo: hello")
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        self.assertEqual(client.stats()["retries"], 1)
+        self.assertEqual(len(self.responses), 2)
+        self.assertTrue(all(response.closed_by_client for response in self.responses))
+
+    def test_gives_up_after_max_retries(self):
+        self.server.fail_next(503, times=3)
+        client = self.make_client(max_retries=2)
+        with self.assertRaises(LLMError):
+            client.complete("davinci", "hello")
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual(client.stats()["failures"], 1)
+        self.assertTrue(all(response.closed_by_client for response in self.responses))
+
+    def test_does_not_retry_client_errors(self):
+        self.server.fail_next(400)
+        client = self.make_client()
+        with self.assertRaises(LLMError):
+            client.complete("davinci", "hello")
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertTrue(self.responses[0].closed_by_client)
+
+    def test_rate_limits_requests(self):
+        client = self.make_client(requests_per_minute=60)
+        futures = [client.submit("davinci", f"prompt {i}") for i in range(62)]
+        for future in futures:
+            future.result()
+        # The first 60 use up the minute's burst; the last two come a second apart.
+        self.assertEqual(len(self.server.requests), 62)
+        self.assertGreaterEqual(self.server.arrivals[-1] - self.server.arrivals[-3], 1.5)
+
+    def test_stream(self):
+        cache = CompletionCache()
+        client = self.make_client(cache=cache)
+        chunks = list(client.stream("davinci", "tell me a story"))
+        self.assertEqual(chunks, ["echo:", " tell", " me", " a", " story"])
+        self.assertTrue(self.server.requests[0]["stream"])
+        # The joined stream is cached and served in one piece.
+        self.assertEqual(list(client.stream("davinci", "tell me a story")), ["echo: tell me a story"])
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_stream_retries_before_the_first_token(self):
+        self.server.fail_next(503, retry_after=0)
+        client = self.make_client()
+        self.assertEqual("".join(client.stream("davinci", "hi")), "echo: hi")
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertTrue(all(response.closed_by_client for response in self.responses))
+
+    def test_stream_closed_early_releases_the_response(self):
+        client = self.make_client()
+        stream = client.stream("davinci", "one two three")
+        self.assertEqual(next(stream), "echo:")
+        stream.close()
+        self.assertTrue(self.responses[0].closed_by_client)
+
+    def test_shared_between_threads(self):
+        client = self.make_client(max_concurrency=4)
+        results = {}
+
+        def ask(i):
+            results[i] = client.complete("davinci", f"question {i}")
+
+        threads = [threading.Thread(target=ask, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, {i: f"echo: question {i}" for i in range(20)})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+import time
+import unittest
+from urllib.parse import parse_qs, urlparse
+
+from ws_ingest import WebSocketIngest, parse_frame
+
+GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+class ChatServer:
+    """
+    A minimal WebSocket chat server on localhost.
+
+    Keeps a list of messages; each connection is sent every message after
+    the `since` id in its URL, one frame per message (all of them when
+    `replay_from` is set, to test that replays are skipped), then closed
+    after `close_after` frames or held open until the client leaves.
+    """
+
+    def __init__(self, messages, close_after=None, replay_from=None):
+        self.messages = messages
+        self.close_after = close_after
+        self.replay_from = replay_from
+        self.paths = []
+        self._sock = socket.socket()
+        self._sock.bind(("127.0.0.1", 0))
+        self._sock.listen()
+        self.url = f"ws://127.0.0.1:{self._sock.getsockname()[1]}/chat"
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._sock.close()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            request = b""
+            while b"\r\n\r\n" not in request:
+                request += conn.recv(4096)
+            lines = request.decode().split("\r\n")
+            path = lines[0].split()[1]
+            headers = dict(line.split(": ", 1) for line in lines[1:] if ": " in line)
+            accept = base64.b64encode(hashlib.sha1((headers["Sec-WebSocket-Key"] + GUID).encode()).digest())
+            conn.sendall(
+                b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n"
+            )
+            self.paths.append(path)
+
+            since = parse_qs(urlparse(path).query).get("since", [None])[0]
+            if self.replay_from is not None and since is not None:
+                since = self.replay_from
+            start = 0
+            if since is not None:
+                start = next(i + 1 for i, m in enumerate(self.messages) if str(m["id"]) == since)
+
+            sent = 0
+            for message in self.messages[start:]:
+                if self.close_after is not None and sent >= self.close_after:
+                    break
+                self._send(conn, json.dumps(message))
+                sent += 1
+            if self.close_after is not None and sent >= self.close_after:
+                # Only the first connection is cut short.
+                self.close_after = None
+                conn.sendall(b"\x88\x00")
+                return
+            # Answer the client's close frame so it does not wait for one.
+            try:
+                while True:
+                    header = conn.recv(2)
+                    if len(header) < 2 or header[0] & 0x0F == 0x8:
+                        break
+                    length = header[1] & 0x7F
+                    if length == 126:
+                        length = struct.unpack("!H", conn.recv(2))[0]
+                    conn.recv(4 + length)
+                conn.sendall(b"\x88\x00")
+            except OSError:
+                pass
+
+    @staticmethod
+    def _send(conn, text):
+        data = text.encode()
+        if len(data) < 126:
+            header = struct.pack("!BB", 0x81, len(data))
+        else:
+            header = struct.pack("!BBH", 0x81, 126, len(data))
+        conn.sendall(header + data)
+
+
+def message(i):
+    return {"id": i, "user_id": f"user{i % 3}", "message": f"message {i}"}
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+class ParseFrameTest(unittest.TestCase):
+
+    def test_shapes(self):
+        self.assertEqual(parse_frame('{"userId": 1, "text": "hi", "id": 7}'),
+                         [{"user_id": 1, "message": "hi", "message_id": 7}])
+        self.assertEqual(len(parse_frame(json.dumps({"messages": [message(1), message(2)]}))), 2)
+        self.assertEqual(parse_frame("ping"), [])
+        self.assertEqual(parse_frame('{"type": "presence"}'), [])
+
+
+class WebSocketIngestTest(unittest.TestCase):
+
+    def setUp(self):
+        self.received = []
+        self.ingest = None
+        self.server = None
+
+    def tearDown(self):
+        if self.ingest is not None:
+            self.ingest.stop()
+        if self.server is not None:
+            self.server.close()
+
+    def start(self, on_records=None, **server_options):
+        self.server = ChatServer([message(i) for i in range(1, 6)], **server_options)
+        self.ingest = WebSocketIngest(self.server.url, on_records or self.received.extend, ping_interval=0)
+        self.ingest.start()
+
+    def ids(self):
+        return [record["message_id"] for record in self.received]
+
+    def test_reconnects_and_resumes(self):
+        self.start(close_after=2)
+        wait_for(lambda: len(self.received) == 5)
+        self.assertEqual(self.ids(), [1, 2, 3, 4, 5])
+        self.assertEqual(self.ingest.reconnects, 1)
+        self.assertEqual(self.server.paths, ["/chat", "/chat?since=2"])
+        self.assertEqual(self.ingest.last_id, 5)
+
+    def test_skips_replayed_messages(self):
+        self.start(close_after=3, replay_from="1")
+        wait_for(lambda: self.ingest.last_id == 5)
+        self.assertEqual(self.ids(), [1, 2, 3, 4, 5])
+        self.assertEqual(self.ingest.records, 5)
+
+    def test_failed_delivery_is_replayed(self):
+        failures = [3]
+
+        def on_records(records):
+            if records[0]["message_id"] in failures:
+                failures.remove(records[0]["message_id"])
+                raise RuntimeError("downstream unavailable")
+            self.received.extend(records)
+
+        self.start(on_records=on_records)
+        wait_for(lambda: len(self.received) == 5)
+        self.assertEqual(self.ids(), [1, 2, 3, 4, 5])
+        self.assertEqual(self.server.paths, ["/chat", "/chat?since=2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,332 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+import numpy as np
+from scipy import sparse
+from sklearn.cluster import kmeans_plusplus
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.utils import murmurhash3_32
+
+from chatlog_export import iter_chatlog
+from profile_store import TopKCounter
+from topic_store import TopicModelStore, parse_topic_key, topic_key
+
+
+class RoomTopicModel:
+    """
+    Clusters a room's messages into `n_topics` topics and keeps learning online.
+
+    Messages are vectorized with a stateless HashingVectorizer, so there is
+    no vocabulary to refit, and clustered with mini-batch k-means: centroids
+    are seeded with k-means++ from the first batch, and every later batch
+    moves each centroid to the running mean of the messages assigned to it.
+    `assign()` hashes one message's words itself (the same features
+    HashingVectorizer produces, without its per-call overhead) and scores
+    them against a snapshot of the centroids, which takes microseconds and
+    never waits on training. Assigned messages are buffered (at most
+    `max_pending`), and `refresh()` folds the buffer into the model and
+    swaps in the new centroids; `start()` runs it every `refresh_interval`
+    seconds.
+
+    Profiles store topic ids (`topic_key()`), so the numbering has to
+    outlive the process. `start(pool)` loads the model saved in
+    `room_topic_models` (see TopicModelStore) and only trains on the last
+    `history_days` of the chatlog when nothing is saved yet; the model is
+    saved every `save_interval` seconds and on `stop()`. `retrain()` starts
+    over, which renumbers the topics.
+
+    Each topic is labelled with its `label_terms` most frequent words, kept
+    in a bounded counter per topic that decays by `label_decay` on every
+    refresh, so labels follow what the room is talking about now.
+
+    Attributes:
+        fitted (int): Messages the model has been trained on.
+        refreshes (int): Completed `refresh()` calls that trained on something.
+    """
+
+    def __init__(self, n_topics=20, n_features=2 ** 16, batch_size=1024, refresh_interval=30, max_pending=10000,
+                 history_days=30, label_terms=3, label_decay=0.9, random_state=0, name="room", save_interval=600):
+        self.n_topics = n_topics
+        self.n_features = n_features
+        self.batch_size = batch_size
+        self.refresh_interval = refresh_interval
+        self.history_days = history_days
+        self.label_terms = label_terms
+        self.label_decay = label_decay
+        self.random_state = random_state
+        self.name = name
+        self.save_interval = save_interval
+        self.fitted = 0
+        self.refreshes = 0
+
+        self.vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=False, stop_words="english")
+        self._analyzer = self.vectorizer.build_analyzer()
+        self._terms = [TopKCounter(50) for _ in range(n_topics)]
+        self._labels = [None] * n_topics
+        # Training state: float32 centroids and how many messages each has absorbed.
+        self._centroids = None
+        self._counts = np.zeros(n_topics, dtype=np.float64)
+
+        # (centroids, squared norms), replaced as a whole after each refresh.
+        self._snapshot = None
+        self._pending = deque(maxlen=max_pending)
+        self._fit_lock = threading.Lock()
+        self._stored = False
+        self._stopping = threading.Event()
+        self._pool = None
+        self._thread = None
+
+    def assign(self, message, learn=True):
+        """
+        Returns the topic id of `message`, or None until the model has been fitted.
+
+        With `learn`, the message is also buffered for the next `refresh()`.
+        """
+        if learn:
+            self._pending.append(message)
+        snapshot = self._snapshot
+        if snapshot is None:
+            return None
+        centroids, norms = snapshot
+        indices, values = self._features(message)
+        if not len(indices):
+            return None
+        # argmin ||c - x||^2 == argmin ||c||^2 - 2 c.x, touching only x's non-zero columns.
+        return int(np.argmin(norms - 2 * (centroids[:, indices] @ values)))
+
+    def label(self, topic_id):
+        return self._labels[topic_id] or f"topic {topic_id}"
+
+    def describe(self, topic):
+        """The current label of a `topic_key()`; any other topic string is returned unchanged."""
+        topic_id = parse_topic_key(topic)
+        if topic_id is None or topic_id >= self.n_topics:
+            return topic
+        return self.label(topic_id)
+
+    def fit_chatlog(self, pool, days=None):
+        """Trains on the chatlog's last `days` days, read in `batch_size` chunks."""
+        since = datetime.now() - timedelta(days=days or self.history_days)
+        # Keyset-paged, one short transaction per chunk, so startup training
+        # holds no connection or partition locks between chunks.
+        messages = []
+        for _, _, message, _ in iter_chatlog(pool, since=since, chunk_size=self.batch_size):
+            if self._stopping.is_set():
+                break
+            if message:
+                messages.append(message)
+            if len(messages) >= self.batch_size:
+                self._fit(messages)
+                messages = []
+        if messages and not self._stopping.is_set():
+            self._fit(messages)
+        return self.fitted
+
+    def refresh(self):
+        """Trains on every buffered message; returns how many there were."""
+        messages = []
+        while self._pending:
+            messages.append(self._pending.popleft())
+        if not messages:
+            return 0
+
+        # k-means++ needs at least n_topics samples for the first batch.
+        if self._snapshot is None and len(messages) < self.n_topics:
+            self._pending.extendleft(reversed(messages))
+            return 0
+
+        for counter in self._terms:
+            counter.decay(self.label_decay)
+        for start in range(0, len(messages), self.batch_size):
+            self._fit(messages[start:start + self.batch_size])
+        self.refreshes += 1
+        return len(messages)
+
+    def load(self, pool):
+        """Replaces the model with the one saved under `name`; returns False if there is none that fits."""
+        saved = TopicModelStore(pool, self.name).load()
+        if saved is None or saved["centroids"].shape != (self.n_topics, self.n_features):
+            return False
+        with self._fit_lock:
+            self._centroids = saved["centroids"]
+            self._counts = saved["counts"]
+            self._terms = [TopKCounter(50, counts) for counts in saved["terms"]]
+            self._labels = list(saved["labels"])
+            self.fitted = saved["fitted"]
+            self._snapshot = (self._centroids, np.einsum("ij,ij->i", self._centroids, self._centroids))
+            self._stored = True
+        return True
+
+    def save(self, pool, replace=True):
+        """Saves the model under `name`; with `replace=False` only if none is saved yet. Returns whether it was."""
+        with self._fit_lock:
+            if self._centroids is None:
+                return False
+            model = {
+                "centroids": self._centroids,
+                "counts": self._counts,
+                "terms": [dict(counter.counts) for counter in self._terms],
+                "labels": list(self._labels),
+                "fitted": self.fitted,
+            }
+        return TopicModelStore(pool, self.name).save(model, replace)
+
+    def retrain(self, pool, days=None):
+        """
+        Trains a new model from the chatlog and saves it over the old one.
+
+        Topic ids are renumbered, so profiles' room topics stop matching;
+        rebuild them afterwards with reanalyze.py (`--room-topics`).
+        """
+        with self._fit_lock:
+            self._centroids = None
+            self._counts = np.zeros(self.n_topics, dtype=np.float64)
+            self._terms = [TopKCounter(50) for _ in range(self.n_topics)]
+            self._labels = [None] * self.n_topics
+            self._snapshot = None
+            self.fitted = 0
+        self.fit_chatlog(pool, days)
+        self._stored = self.save(pool)
+        return self.fitted
+
+    def topics(self):
+        """Returns `(topic_id, label)` for every topic."""
+        return [(topic_id, self.label(topic_id)) for topic_id in range(self.n_topics)]
+
+    def stats(self):
+        return {
+            "fitted": self.fitted,
+            "refreshes": self.refreshes,
+            "pending": len(self._pending),
+            "ready": self._snapshot is not None,
+            "stored": self._stored,
+        }
+
+    def start(self, pool=None):
+        self._pool = pool
+        self._thread = threading.Thread(target=self._run, args=(pool,), name="room-topics", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._pool is not None:
+            try:
+                self._persist(self._pool)
+            except Exception as error:
+                print("Saving the room topic model failed: ", error)
+
+    def _features(self, message):
+        # Equivalent to vectorizer.transform([message]) for a single message.
+        counts = {}
+        for term in self._analyzer(message):
+            index = abs(murmurhash3_32(term, seed=0)) % self.n_features
+            counts[index] = counts.get(index, 0) + 1
+        indices = np.fromiter(counts.keys(), dtype=np.intp, count=len(counts))
+        values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        if len(values):
+            values /= np.sqrt(values @ values)
+        return indices, values
+
+    def _fit(self, messages):
+        with self._fit_lock:
+            X = self.vectorizer.transform(messages)
+            if self._centroids is None:
+                if X.shape[0] < self.n_topics:
+                    return
+                centroids, _ = kmeans_plusplus(X, self.n_topics, random_state=self.random_state)
+                self._centroids = centroids.astype(np.float32)
+
+            centroids = self._centroids
+            norms = np.einsum("ij,ij->i", centroids, centroids)
+            topic_ids = np.asarray(np.argmin(norms - 2 * (X @ centroids.T), axis=1)).ravel()
+
+            # Each centroid becomes the mean of every message it has absorbed so far.
+            assigned = sparse.csr_matrix(
+                (np.ones(len(topic_ids)), (topic_ids, np.arange(len(topic_ids)))),
+                shape=(self.n_topics, X.shape[0])
+            )
+            sums = (assigned @ X).toarray()
+            batch_counts = np.bincount(topic_ids, minlength=self.n_topics).astype(np.float64)
+            counts = self._counts + batch_counts
+            moved = batch_counts > 0
+            updated = centroids.copy()
+            updated[moved] += (
+                (sums[moved] - batch_counts[moved, None] * centroids[moved]) / counts[moved, None]
+            ).astype(np.float32)
+
+            self._centroids = updated
+            self._counts = counts
+            self.fitted += X.shape[0]
+            self._snapshot = (updated, np.einsum("ij,ij->i", updated, updated))
+
+            for topic_id, message in zip(topic_ids.tolist(), messages):
+                counter = self._terms[topic_id]
+                for term in self._analyzer(message):
+                    counter.add(term)
+            for topic_id, counter in enumerate(self._terms):
+                terms = [term for term, _ in counter.most_common(self.label_terms)]
+                self._labels[topic_id] = "/".join(terms) or None
+
+    def _persist(self, pool):
+        if self._snapshot is None:
+            return
+        if self._stored:
+            self.save(pool)
+        elif self.save(pool, replace=False):
+            self._stored = True
+        elif self.load(pool):
+            # Another bot saved a model first; use its numbering from now on.
+            print("Room topic model: switched to the model saved by another bot")
+
+    def _run(self, pool):
+        if pool is not None:
+            started = time.perf_counter()
+            try:
+                if self.load(pool):
+                    print(f"Room topic model loaded ({self.fitted} messages trained)")
+                else:
+                    self.fit_chatlog(pool)
+                    self._persist(pool)
+                    print(f"Room topic model trained on {self.fitted} messages in "
+                          f"{time.perf_counter() - started:.1f}s")
+            except Exception as error:
+                print("Room topic model startup failed: ", error)
+
+        last_save = time.monotonic()
+        while not self._stopping.wait(self.refresh_interval):
+            try:
+                self.refresh()
+            except Exception as error:
+                print("Room topic model refresh failed: ", error)
+            if pool is not None and (not self._stored or time.monotonic() - last_save >= self.save_interval):
+                try:
+                    self._persist(pool)
+                except Exception as error:
+                    print("Saving the room topic model failed: ", error)
+                last_save = time.monotonic()
+
+
+if __name__ == "__main__":
+    # python topic_model.py <database> <user> <password> [--retrain]
+    import sys
+
+    from chatlog_partitions import ChatlogPartitions
+    from db_pool import DatabasePool
+    from migrations import Migrator, chatlog_migrations
+
+    pool = DatabasePool(sys.argv[1], sys.argv[2], sys.argv[3], max_connections=2)
+    Migrator(pool, chatlog_migrations(ChatlogPartitions(pool))).migrate()
+    model = RoomTopicModel()
+    try:
+        if "--retrain" in sys.argv[4:]:
+            print(f"Retrained on {model.retrain(pool)} messages; rebuild profiles with reanalyze.py --room-topics")
+        elif not model.load(pool):
+            print("No saved room topic model")
+        for topic_id, label in model.topics():
+            print(f"{topic_key(topic_id):>10}  {label}")
+    finally:
+        pool.close()
@@ -0,0 +1,168 @@
+import threading
+import time
+import zlib
+
+import numpy as np
+from psycopg2 import errors
+from psycopg2.extras import Json
+
+KEY_PREFIX = "topic:"
+
+
+def topic_key(topic_id):
+    """
+    The profile topic stored for a room topic.
+
+    Labels change as the model learns, so profiles count the topic id and
+    only resolve it to a label (see `TopicLabels.describe`) for display.
+    """
+    return f"{KEY_PREFIX}{topic_id}"
+
+
+def parse_topic_key(topic):
+    """The room topic id in a `topic_key()`, or None for any other topic string."""
+    if isinstance(topic, str) and topic.startswith(KEY_PREFIX) and topic[len(KEY_PREFIX):].isdigit():
+        return int(topic[len(KEY_PREFIX):])
+    return None
+
+
+class TopicModelStore:
+    """
+    Saves a room topic model in `room_topic_models`, one row per model name.
+
+    The row holds the centroids and per-topic sample counts (float32 and
+    float64, zlib-compressed) that online training continues from, each
+    topic's term counts, and the current labels. Every bot loads the same
+    row, so a topic id means the same cluster in every process and across
+    restarts.
+    """
+
+    def __init__(self, pool, name="room"):
+        self.pool = pool
+        self.name = name
+
+    @staticmethod
+    def ensure_schema(cur):
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS room_topic_models (
+                name TEXT PRIMARY KEY,
+                n_topics INTEGER NOT NULL,
+                n_features INTEGER NOT NULL,
+                centroids BYTEA NOT NULL,
+                counts BYTEA NOT NULL,
+                terms JSONB NOT NULL,
+                labels JSONB NOT NULL,
+                fitted BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+            )
+        """)
+
+    def load(self):
+        """Returns the saved model as a dict (see `save`), or None if there is none."""
+        try:
+            with self.pool.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT n_topics, n_features, centroids, counts, terms, labels, fitted
+                    FROM room_topic_models WHERE name = %s
+                    """,
+                    (self.name,)
+                )
+                row = cur.fetchone()
+        except errors.UndefinedTable:
+            return None
+        if row is None:
+            return None
+
+        n_topics, n_features, centroids, counts, terms, labels, fitted = row
+        return {
+            "centroids": np.frombuffer(zlib.decompress(bytes(centroids)), dtype=np.float32)
+            .reshape(n_topics, n_features).copy(),
+            "counts": np.frombuffer(zlib.decompress(bytes(counts)), dtype=np.float64).copy(),
+            "terms": terms,
+            "labels": labels,
+            "fitted": fitted,
+        }
+
+    def save(self, model, replace=True):
+        """
+        Saves `model` ("centroids", "counts", "terms", "labels", "fitted").
+
+        With `replace=False` an existing row is left alone; returns whether
+        the row was written.
+        """
+        centroids = np.asarray(model["centroids"], dtype=np.float32)
+        params = (
+            self.name,
+            centroids.shape[0],
+            centroids.shape[1],
+            zlib.compress(centroids.tobytes(), 1),
+            zlib.compress(np.asarray(model["counts"], dtype=np.float64).tobytes(), 1),
+            Json(model["terms"]),
+            Json(model["labels"]),
+            model["fitted"],
+        )
+        conflict = """
+            DO UPDATE SET
+                n_topics = EXCLUDED.n_topics,
+                n_features = EXCLUDED.n_features,
+                centroids = EXCLUDED.centroids,
+                counts = EXCLUDED.counts,
+                terms = EXCLUDED.terms,
+                labels = EXCLUDED.labels,
+                fitted = EXCLUDED.fitted,
+                updated_at = NOW()
+        """ if replace else "DO NOTHING"
+        with self.pool.cursor() as cur:
+            cur.execute(
+                f"""
+                INSERT INTO room_topic_models (name, n_topics, n_features, centroids, counts, terms, labels, fitted)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (name) {conflict}
+                """,
+                params
+            )
+            return cur.rowcount == 1
+
+    def labels(self):
+        """The saved labels, one per topic id (empty if nothing is saved)."""
+        try:
+            with self.pool.cursor() as cur:
+                cur.execute("SELECT labels FROM room_topic_models WHERE name = %s", (self.name,))
+                row = cur.fetchone()
+        except errors.UndefinedTable:
+            return []
+        return row[0] if row is not None else []
+
+
+class TopicLabels:
+    """
+    Resolves `topic_key()`s to the labels last saved by the bots' topic model.
+
+    For processes that read profiles without running a RoomTopicModel
+    themselves. Labels are re-read at most every `ttl` seconds.
+    """
+
+    def __init__(self, pool, name="room", ttl=60):
+        self.store = TopicModelStore(pool, name)
+        self.ttl = ttl
+        self._labels = []
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def describe(self, topic):
+        """The label of a `topic_key()`; any other topic string is returned unchanged."""
+        topic_id = parse_topic_key(topic)
+        if topic_id is None:
+            return topic
+        with self._lock:
+            if self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl:
+                try:
+                    self._labels = self.store.labels()
+                except Exception as error:
+                    print("Could not load topic labels: ", error)
+                self._loaded_at = time.monotonic()
+            labels = self._labels
+        if topic_id < len(labels) and labels[topic_id]:
+            return labels[topic_id]
+        return f"topic {topic_id}"
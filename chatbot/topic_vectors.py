@@ -0,0 +1,285 @@
+import sys
+import threading
+import time
+import zlib
+
+import numpy as np
+
+# Width of every profile's topic vector; 64 float32s are 256 bytes per user.
+TOPIC_DIM = 64
+
+
+def hash_topics(topic_counts, dim=TOPIC_DIM):
+    """
+    Hashes `{topic: count}` into a fixed-width float32 vector.
+
+    crc32 is stable across processes and Python versions, so vectors written
+    by one bot can be compared with vectors written by any other.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for topic, count in topic_counts.items():
+        vector[zlib.crc32(topic.lower().encode()) % dim] += count
+    return vector
+
+
+def decode_vector(data, dim=TOPIC_DIM):
+    """The float32 vector stored in a `topic_vector` bytea, or zeros for NULL."""
+    if data is None:
+        return np.zeros(dim, dtype=np.float32)
+    return np.frombuffer(bytes(data), dtype=np.float32).copy()
+
+
+def encode_vector(vector):
+    return vector.astype(np.float32).tobytes()
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+class TopicIndex:
+    """
+    An in-memory inverted-file index for cosine similarity over topic vectors.
+
+    Vectors are normalized and filed under the nearest of `nlist` coarse
+    centroids. A query scans only the `nprobe` cells closest to it, so over
+    a million profiles it compares against a few thousand vectors instead
+    of all of them. `add()` upserts one key in place, which is how
+    ProfileStore keeps the index current as profiles change. `build()`
+    reloads every stored vector and retrains the cells; `start()` runs it in
+    the background, again every `rebuild_interval` seconds if given.
+
+    Keys are usually user ids, but anything hashable works, so persona
+    vectors can live in their own index and be matched the same way.
+    """
+
+    def __init__(self, dim=TOPIC_DIM, nlist=1024, nprobe=8, sample_size=100000):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.sample_size = sample_size
+
+        self._centroids = np.zeros((1, dim), dtype=np.float32)
+        self._vectors = np.zeros((1024, dim), dtype=np.float32)
+        self._cells = np.zeros(1024, dtype=np.int32)
+        self._keys = []
+        self._rows = {}
+        # Row numbers per cell; a row that moves is taken out of its old cell.
+        self._members = [set()]
+        self._member_arrays = {}
+        # Keys added while build() is reading, re-applied over its snapshot.
+        self._changed = None
+        self._lock = threading.RLock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, key, vector):
+        vector = _normalize(np.asarray(vector, dtype=np.float32))
+        with self._lock:
+            if self._changed is not None:
+                self._changed[key] = vector
+            cell = self._nearest_cells(vector, 1)[0]
+            row = self._rows.get(key)
+            if row is None:
+                row = self._rows[key] = len(self._keys)
+                self._keys.append(key)
+                self._grow(row + 1)
+            elif self._cells[row] == cell:
+                self._vectors[row] = vector
+                return
+            else:
+                previous = self._cells[row]
+                self._members[previous].discard(row)
+                self._member_arrays.pop(previous, None)
+            self._vectors[row] = vector
+            self._cells[row] = cell
+            self._members[cell].add(row)
+            self._member_arrays.pop(cell, None)
+
+    def get(self, key):
+        with self._lock:
+            row = self._rows.get(key)
+            return None if row is None else self._vectors[row].copy()
+
+    def similar(self, vector, k=10, exclude=()):
+        """Returns up to `k` `(key, cosine similarity)` pairs, most similar first."""
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+        if not query.any():
+            return []
+        with self._lock:
+            candidates = []
+            for cell in self._nearest_cells(query, self.nprobe):
+                rows = self._member_arrays.get(cell)
+                if rows is None:
+                    members = self._members[cell]
+                    rows = self._member_arrays[cell] = np.fromiter(members, dtype=np.intp, count=len(members))
+                candidates.append(rows)
+            if not candidates:
+                return []
+            rows = np.concatenate(candidates)
+            scores = self._vectors[rows] @ query
+            keys = self._keys
+
+            wanted = min(len(rows), k + len(exclude))
+            best = np.argpartition(-scores, wanted - 1)[:wanted] if wanted < len(rows) else np.arange(len(rows))
+            best = best[np.argsort(-scores[best])]
+            results = [(keys[rows[i]], float(scores[i])) for i in best if keys[rows[i]] not in exclude]
+            return results[:k]
+
+    def similar_to(self, key, k=10):
+        vector = self.get(key)
+        if vector is None:
+            return []
+        return self.similar(vector, k, exclude={key})
+
+    def build(self, pool, batch_size=10000):
+        """
+        Loads every stored topic vector and retrains the cells; returns the number loaded.
+
+        Keys added while it runs may be missing from (or stale in) what it
+        read, so they are re-applied once the new contents are swapped in.
+        """
+        with self._lock:
+            self._changed = {}
+        try:
+            keys = []
+            chunks = []
+            # Streamed through a named cursor, so a million rows never sit in one result set.
+            with pool.cursor(name="topic_index_build") as cur:
+                cur.itersize = batch_size
+                cur.execute("SELECT user_id, topic_vector FROM user_profiles WHERE topic_vector IS NOT NULL")
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    keys.extend(row[0] for row in rows)
+                    chunks.append(np.frombuffer(b"".join(bytes(row[1]) for row in rows), dtype=np.float32))
+            vectors = np.concatenate(chunks).reshape(-1, self.dim) if chunks else np.zeros((0, self.dim), np.float32)
+            self.load(keys, vectors)
+        finally:
+            with self._lock:
+                self._changed = None
+        return len(keys)
+
+    def load(self, keys, vectors):
+        """Replaces the index contents with `keys` and their `vectors`, then re-applies adds made during a build."""
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        centroids = self._train(vectors)
+        cells = self._assign(vectors, centroids)
+
+        members = [set() for _ in range(len(centroids))]
+        for row, cell in enumerate(cells.tolist()):
+            members[cell].add(row)
+
+        with self._lock:
+            changed, self._changed = self._changed, None
+            self._centroids = centroids
+            self._vectors = vectors.copy() if len(vectors) else np.zeros((1024, self.dim), dtype=np.float32)
+            self._cells = cells.astype(np.int32) if len(vectors) else np.zeros(1024, dtype=np.int32)
+            self._keys = list(keys)
+            self._rows = {key: row for row, key in enumerate(self._keys)}
+            self._members = members
+            self._member_arrays = {}
+            for key, vector in (changed or {}).items():
+                self.add(key, vector)
+
+    def start(self, pool, rebuild_interval=None):
+        self._thread = threading.Thread(
+            target=self._run, args=(pool, rebuild_interval), name="topic-index", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, pool, rebuild_interval):
+        while not self._stopping.is_set():
+            started = time.perf_counter()
+            try:
+                loaded = self.build(pool)
+                print(f"Topic index built over {loaded} profiles in {time.perf_counter() - started:.1f}s")
+            except Exception as error:
+                print("Topic index build failed: ", error)
+            if not rebuild_interval or self._stopping.wait(rebuild_interval):
+                return
+
+    def _train(self, vectors, iterations=10):
+        # Spherical k-means on a sample: cells only need to be roughly balanced.
+        nlist = max(1, min(self.nlist, len(vectors) // 40))
+        if len(vectors) <= nlist:
+            return np.zeros((1, self.dim), dtype=np.float32)
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), self.sample_size), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            cells = self._assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, cells, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = _normalize(sums)
+        return centroids
+
+    def _assign(self, vectors, centroids, batch_size=65536):
+        cells = np.empty(len(vectors), dtype=np.intp)
+        for start in range(0, len(vectors), batch_size):
+            cells[start:start + batch_size] = np.argmax(vectors[start:start + batch_size] @ centroids.T, axis=1)
+        return cells
+
+    def _nearest_cells(self, vector, n):
+        scores = self._centroids @ vector
+        if n >= len(scores):
+            return np.argsort(-scores)
+        best = np.argpartition(-scores, n - 1)[:n]
+        return best[np.argsort(-scores[best])]
+
+    def _grow(self, size):
+        if size <= len(self._vectors):
+            return
+        capacity = max(size, 2 * len(self._vectors))
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        vectors[:len(self._vectors)] = self._vectors
+        cells = np.zeros(capacity, dtype=np.int32)
+        cells[:len(self._cells)] = self._cells
+        self._vectors, self._cells = vectors, cells
+
+
+def benchmark(profiles=1000000, queries=1000, topics_per_user=8, vocabulary=5000):
+    """Builds an index over random profiles and times `similar()` against an exact scan."""
+    rng = np.random.default_rng(1)
+    # Interests cluster around a few hundred themes, as real ones do.
+    themes = rng.integers(0, vocabulary, size=(500, topics_per_user * 2))
+    vectors = np.zeros((profiles, TOPIC_DIM), dtype=np.float32)
+    for user, theme in enumerate(rng.integers(0, len(themes), size=profiles)):
+        topics = rng.choice(themes[theme], topics_per_user, replace=False)
+        vectors[user] = hash_topics({f"topic{topic}": 1 for topic in topics})
+
+    index = TopicIndex()
+    started = time.perf_counter()
+    index.load(range(profiles), vectors)
+    print(f"built {profiles} profiles in {time.perf_counter() - started:.1f}s")
+
+    normalized = _normalize(vectors)
+    picks = rng.integers(0, profiles, size=queries)
+    started = time.perf_counter()
+    results = [index.similar_to(int(user)) for user in picks]
+    elapsed = (time.perf_counter() - started) / queries
+
+    # Many profiles tie on score, so a hit is any result scoring at least the exact 10th best.
+    recall = 0
+    for user, found in zip(picks[:50], results[:50]):
+        scores = normalized @ normalized[user]
+        scores[user] = -1
+        tenth = np.partition(-scores, 9)[9]
+        recall += sum(score >= -tenth - 1e-6 for _, score in found) / 10
+    print(f"similar_to: {elapsed * 1000:.2f} ms/query, recall@10 vs exact scan: {recall / 50:.2f}")
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
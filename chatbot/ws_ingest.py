@@ -0,0 +1,200 @@
+import asyncio
+import concurrent.futures
+import json
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlencode, urlparse, parse_qsl, urlunparse
+
+import websocket
+
+
+def parse_frame(frame):
+    """
+    Parses a chat frame into `{"user_id", "message"}` records.
+
+    Frames may carry a single message object, a list of them, or an object
+    with a "messages" list. Frames that are not JSON chat messages (pings,
+    presence updates, ...) yield no records. When the server sends a message
+    id it is kept as "message_id" so the stream can be resumed.
+    """
+    try:
+        data = json.loads(frame)
+    except (TypeError, ValueError):
+        return []
+
+    if isinstance(data, dict) and isinstance(data.get("messages"), list):
+        items = data["messages"]
+    elif isinstance(data, list):
+        items = data
+    else:
+        items = [data]
+
+    records = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        user_id = item.get("user_id", item.get("userId", item.get("user")))
+        message = item.get("message", item.get("text"))
+        if user_id is None or message is None:
+            continue
+
+        record = {"user_id": user_id, "message": message}
+        message_id = item.get("message_id", item.get("id"))
+        if message_id is not None:
+            record["message_id"] = message_id
+        records.append(record)
+    return records
+
+
+class WebSocketIngest:
+    """
+    Receives chat messages over a WebSocket and hands them on as records.
+
+    The connection is re-opened with jittered exponential backoff whenever it
+    drops. After the first message with an id has been seen, reconnects add
+    `resume_param=<last id>` to the URL so the server can replay what was
+    missed; replayed ids that were already delivered are skipped. An id only
+    counts as delivered once `on_records` has returned; if it raises, the
+    connection is re-opened from the last delivered id.
+
+    Attributes:
+        url (str): The chat room's WebSocket endpoint.
+        on_records (callable): Called with each non-empty list of new records.
+        frames (int): Frames received.
+        records (int): Records delivered.
+        reconnects (int): Connections opened after the first.
+    """
+
+    def __init__(self, url, on_records=None, resume_param="since", ping_interval=20, max_backoff=30,
+                 header=None, dedupe_window=10000):
+        self.url = url
+        self.on_records = on_records
+        self.resume_param = resume_param
+        self.ping_interval = ping_interval
+        self.max_backoff = max_backoff
+        self.header = header
+        self.last_id = None
+        self.frames = 0
+        self.records = 0
+        self.reconnects = 0
+
+        self._seen = set()
+        self._seen_order = deque(maxlen=dedupe_window)
+        self._app = None
+        self._opened = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run_forever, name="ws-ingest", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._app is not None:
+            self._app.close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run_forever(self):
+        backoff = 0.5
+        while not self._stopping.is_set():
+            opened_before = self._opened
+            self._app = websocket.WebSocketApp(
+                self._resume_url(),
+                header=self.header,
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_error=self._on_error
+            )
+            self._app.run_forever(ping_interval=self.ping_interval)
+
+            if self._stopping.is_set():
+                break
+            if self._opened > opened_before:
+                backoff = 0.5
+            delay = random.uniform(0, backoff)
+            backoff = min(self.max_backoff, backoff * 2)
+            print(f"WebSocket closed, reconnecting in {delay:.1f}s")
+            self._stopping.wait(delay)
+
+    async def stream(self, maxsize=1000):
+        """
+        Yields records as an async iterator, e.g. as a MessagePipeline ingest.
+
+        The socket runs on its own thread; when the consumer falls behind,
+        that thread blocks on the bounded queue instead of buffering forever.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=maxsize)
+
+        def deliver(records):
+            for record in records:
+                put = asyncio.run_coroutine_threadsafe(queue.put(record), loop)
+                while True:
+                    try:
+                        put.result(timeout=0.5)
+                        break
+                    except concurrent.futures.TimeoutError:
+                        if self._stopping.is_set():
+                            put.cancel()
+                            return
+
+        self.on_records = deliver
+        self.start()
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            await loop.run_in_executor(None, self.stop)
+
+    def _resume_url(self):
+        if self.last_id is None:
+            return self.url
+        parts = urlparse(self.url)
+        query = [(key, value) for key, value in parse_qsl(parts.query) if key != self.resume_param]
+        query.append((self.resume_param, str(self.last_id)))
+        return urlunparse(parts._replace(query=urlencode(query)))
+
+    def _on_open(self, ws):
+        if self._opened:
+            self.reconnects += 1
+        self._opened += 1
+
+    def _on_message(self, ws, frame):
+        self.frames += 1
+        received_at = time.time()
+        records = []
+        ids = []
+
+        for record in parse_frame(frame):
+            message_id = record.get("message_id")
+            if message_id is not None:
+                if message_id in self._seen or message_id in ids:
+                    continue
+                ids.append(message_id)
+            record["received_at"] = received_at
+            records.append(record)
+
+        if records and self.on_records is not None:
+            try:
+                self.on_records(records)
+            except Exception as error:
+                # Nothing from this frame counts as delivered; reconnecting
+                # resumes from the last delivered id so the server replays it.
+                print("Delivering chat records failed, reconnecting: ", error)
+                ws.close()
+                return
+            self.records += len(records)
+
+        for message_id in ids:
+            if len(self._seen_order) == self._seen_order.maxlen:
+                self._seen.discard(self._seen_order[0])
+            self._seen_order.append(message_id)
+            self._seen.add(message_id)
+            self.last_id = message_id
+
+    def _on_error(self, ws, error):
+        print("WebSocket error: ", error)